@@ -1,6 +1,7 @@
 import argparse
+from device import analysis, simulation, tuning
 from device.log import logging_setup
-from device.config import load_config
+from device.config import get_config, load_config
 from device.test import test
 import os
 
@@ -17,6 +18,30 @@ parser.add_argument(
 parser.add_argument(
     "-s", "--static", action="store_true", help="Avvia il dispositivo con frame fisso"
 )
+parser.add_argument(
+    "--headless",
+    action="store_true",
+    help="Nessuna finestra di debug: le immagini di debug sono disponibili solo via API",
+)
+subparsers = parser.add_subparsers(dest="command")
+analysis.add_arguments(
+    subparsers.add_parser(
+        "analyze",
+        help="Analizza un video registrato e produce la cronologia degli eventi di movimento",
+    )
+)
+tuning.add_arguments(
+    subparsers.add_parser(
+        "tune",
+        help="Cerca le soglie del rilevatore con il punteggio migliore sui video etichettati",
+    )
+)
+simulation.add_arguments(
+    subparsers.add_parser(
+        "simulate",
+        help="Simula partite con un orologio virtuale e verifica il timer del gioco",
+    )
+)
 
 
 def main():
@@ -32,8 +57,16 @@ def main():
 if __name__ == "__main__":
     args = parser.parse_args()
     load_config()
+    if args.headless:
+        get_config()["VIDEO"]["Headless"] = "true"
     logging_setup()
-    if args.test:
+    if args.command == "analyze":
+        analysis.run(args)
+    elif args.command == "tune":
+        tuning.run(args)
+    elif args.command == "simulate":
+        simulation.run(args)
+    elif args.test:
         test(static=args.static)
     else:
         main()
@@ -0,0 +1,326 @@
+"""
+Analisi offline di un video registrato con il rilevatore di movimento.
+
+I frame vengono decodificati alla massima velocità possibile, senza le attese del
+VideoProducer, ed elaborati dalla stessa pipeline del VideoConsumer (contesto, prefiltro,
+motore di rilevamento, tracciamento e debounce). Il risultato è la cronologia degli eventi di
+inizio e fine movimento, con indici dei frame e tempi nel video, e le statistiche di velocità.
+
+Come dal vivo, il rilevatore non elabora più di DetectorMaxFps frame al secondo: nei video a
+frequenza più alta i frame in eccesso vengono solo estratti (grab), senza decodificarli.
+Con più processi il video viene diviso in blocchi contigui: ogni processo inizia warmup
+secondi prima del proprio blocco, per arrivare al suo inizio con lo stesso stato del
+rilevatore, e riporta solo gli eventi del proprio blocco.
+
+Uso:
+    python -m device analyze <video> --table <preset.json> [--workers N] [--format csv]
+"""
+
+import csv
+import json
+import math
+import multiprocessing
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+
+from device.config import get_config
+from device.game.video_consumer import VideoConsumer
+from device.table import TablePreset, load_table_preset
+from device.video_producer import Frame
+
+# Secondi elaborati prima di ogni blocco, senza riportarne gli eventi
+WARMUP_SECONDS = 3.0
+CSV_FIELDS = ["event", "frame", "time", "onset_frame", "onset_time", "latency"]
+
+
+def video_info(video_path):
+    """Numero di frame e frequenza di un file video."""
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Impossibile aprire il video: {video_path}")
+    frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    capture.release()
+    return frames, fps
+
+
+def decode_frames(video_path, first, end, max_fps, stats):
+    """
+    Generatore dei frame [first, end) del video da elaborare, come (indice, immagine), al
+    massimo max_fps al secondo: i frame in eccesso vengono solo estratti (grab).
+
+    Args:
+        video_path (str): File video.
+        first (int): Primo frame da leggere.
+        end (int): Frame successivo all'ultimo da leggere.
+        max_fps (float): Frequenza massima di elaborazione, in frame al secondo.
+        stats (dict): Dizionario in cui vengono aggiornati "frames_read" e "decode_time".
+    """
+    capture = cv2.VideoCapture(video_path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    if first > 0:
+        capture.set(cv2.CAP_PROP_POS_FRAMES, first)
+    min_interval = 1 / max_fps if max_fps else 0.0
+    stats.setdefault("frames_read", 0)
+    stats.setdefault("decode_time", 0.0)
+    next_due = None
+    index = first
+    try:
+        while index < end:
+            timestamp = index / fps
+            # Margine di mezzo frame, per non scartare frame per errori di arrotondamento
+            due = next_due is None or timestamp >= next_due - 0.5 / fps
+            decode_start = time.perf_counter()
+            if due:
+                ret, image = capture.read()
+            else:
+                ret, image = capture.grab(), None
+            stats["decode_time"] += time.perf_counter() - decode_start
+            if not ret:
+                break
+            stats["frames_read"] += 1
+            if due:
+                next_due = timestamp + min_interval
+                yield index, image
+            index += 1
+    finally:
+        capture.release()
+
+
+def replay_frames(table: TablePreset, frames, fps, start=0, frame_times=None):
+    """
+    Elabora i frame con la pipeline del VideoConsumer e restituisce gli eventi di movimento
+    dei frame da start in poi, con il numero di frame elaborati e il tempo di elaborazione.
+    Il tempo di acquisizione di ogni frame è il suo tempo nel video, indice / fps.
+
+    Args:
+        table (TablePreset): Preset del tavolo ripreso nei frame.
+        frames (iterable): Frame come (indice, immagine), in ordine.
+        fps (float): Frequenza del video.
+        start (int): Primo frame di cui riportare gli eventi.
+        frame_times (list): Lista a cui aggiungere il tempo di elaborazione di ogni frame, in
+            secondi (Opzionale).
+    """
+    events = []
+    current = {}
+
+    def record(event, onset):
+        if current["index"] < start:
+            return
+        events.append(
+            {
+                "event": event,
+                "frame": current["index"],
+                "time": current["index"] / fps,
+                "onset_frame": round(onset * fps),
+                "onset_time": onset,
+                "latency": current["index"] / fps - onset,
+            }
+        )
+
+    consumer = VideoConsumer(
+        table,
+        lambda onset: record("start", onset),
+        lambda onset: record("stop", onset),
+        None,
+        headless=True,
+        threaded=False,
+    )
+    process_time = 0.0
+    processed = 0
+    last_timestamp = None
+    for index, image in frames:
+        timestamp = index / fps
+        current["index"] = index
+        interval = timestamp - last_timestamp if last_timestamp is not None else None
+        last_timestamp = timestamp
+        process_start = time.perf_counter()
+        consumer.process_frame(Frame(index + 1, timestamp, image), interval)
+        elapsed = time.perf_counter() - process_start
+        process_time += elapsed
+        if frame_times is not None:
+            frame_times.append(elapsed)
+        processed += 1
+    return {
+        "events": events,
+        "frames_processed": processed,
+        "process_time": process_time,
+    }
+
+
+def analyze_chunk(
+    video_path, table: TablePreset, start, end, warmup, max_fps, frame_times=None
+):
+    """
+    Elabora i frame [start - warmup, end) del video e restituisce gli eventi dei frame
+    [start, end) e le statistiche di velocità.
+
+    Args:
+        video_path (str): File video.
+        table (TablePreset): Preset del tavolo ripreso nel video.
+        start (int): Primo frame del blocco.
+        end (int): Frame successivo all'ultimo del blocco.
+        warmup (int): Frame elaborati prima del blocco senza riportarne gli eventi.
+        max_fps (float): Frequenza massima di elaborazione, in frame al secondo.
+        frame_times (list): Lista a cui aggiungere il tempo di elaborazione di ogni frame, in
+            secondi (Opzionale).
+    """
+    first = max(0, start - warmup)
+    _, fps = video_info(video_path)
+    decode_stats = {}
+    frames = decode_frames(video_path, first, end, max_fps, decode_stats)
+    result = replay_frames(table, frames, fps, start, frame_times)
+    return {
+        "events": result["events"],
+        "stats": {
+            "start": start,
+            "end": min(end, first + decode_stats["frames_read"]),
+            "frames_read": decode_stats["frames_read"],
+            "frames_processed": result["frames_processed"],
+            "decode_time": decode_stats["decode_time"],
+            "process_time": result["process_time"],
+        },
+    }
+
+
+def merge_events(chunks):
+    """Unisce gli eventi dei blocchi in ordine, scartando un evento uguale al precedente."""
+    events = []
+    for chunk in chunks:
+        for event in chunk["events"]:
+            if events and events[-1]["event"] == event["event"]:
+                continue
+            events.append(event)
+    return events
+
+
+def analyze_video(
+    video_path, table: TablePreset, workers=1, max_fps=None, warmup=WARMUP_SECONDS
+):
+    """
+    Analizza un video e restituisce la cronologia degli eventi di movimento e le statistiche.
+
+    Args:
+        video_path (str): File video.
+        table (TablePreset): Preset del tavolo ripreso nel video.
+        workers (int): Processi su cui dividere il video.
+        max_fps (float): Frequenza massima di elaborazione (Opzionale, config DetectorMaxFps).
+        warmup (float): Secondi elaborati prima di ogni blocco, con più processi.
+
+    Returns:
+        dict: {"video", "events", "stats"}.
+    """
+    if max_fps is None:
+        max_fps = get_config().getfloat("VIDEO", "DetectorMaxFps", fallback=30.0)
+    total, fps = video_info(video_path)
+    workers = max(1, min(workers, total)) if total > 0 else 1
+    wall_start = time.perf_counter()
+    if workers == 1:
+        # Senza il numero di frame (alcuni formati non lo riportano) si legge fino alla fine
+        chunks = [analyze_chunk(video_path, table, 0, total or sys.maxsize, 0, max_fps)]
+    else:
+        size = math.ceil(total / workers)
+        warmup_frames = round(warmup * fps)
+        bounds = [(start, min(start + size, total)) for start in range(0, total, size)]
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(len(bounds), mp_context=context) as executor:
+            futures = [
+                executor.submit(
+                    analyze_chunk,
+                    video_path,
+                    table,
+                    start,
+                    end,
+                    warmup_frames,
+                    max_fps,
+                )
+                for start, end in bounds
+            ]
+            chunks = [future.result() for future in futures]
+    wall_time = time.perf_counter() - wall_start
+
+    frames = sum(chunk["stats"]["end"] - chunk["stats"]["start"] for chunk in chunks)
+    processed = sum(chunk["stats"]["frames_processed"] for chunk in chunks)
+    decode_time = sum(chunk["stats"]["decode_time"] for chunk in chunks)
+    process_time = sum(chunk["stats"]["process_time"] for chunk in chunks)
+    duration = frames / fps
+    return {
+        "video": {"path": video_path, "frames": frames, "fps": fps},
+        "events": merge_events(chunks),
+        "stats": {
+            "workers": len(chunks),
+            "max_fps": max_fps,
+            "frames_processed": processed,
+            "wall_time": wall_time,
+            "video_duration": duration,
+            "speed": duration / wall_time if wall_time else 0.0,
+            "frames_per_second": frames / wall_time if wall_time else 0.0,
+            "avg_decode_ms": decode_time * 1000 / processed if processed else 0.0,
+            "avg_process_ms": process_time * 1000 / processed if processed else 0.0,
+            "chunks": [chunk["stats"] for chunk in chunks],
+        },
+    }
+
+
+def write_report(report, output, format="json"):
+    """Scrive la cronologia in JSON (eventi e statistiche) o in CSV (solo eventi) su output."""
+    if format == "csv":
+        writer = csv.DictWriter(output, fieldnames=CSV_FIELDS, lineterminator="\n")
+        writer.writeheader()
+        writer.writerows(report["events"])
+    else:
+        json.dump(report, output, indent=4)
+        output.write("\n")
+
+
+def add_arguments(parser):
+    """Aggiunge al parser gli argomenti del comando analyze."""
+    parser.add_argument("video", help="File video da analizzare")
+    parser.add_argument(
+        "--table", required=True, help="File JSON del preset del tavolo"
+    )
+    parser.add_argument(
+        "--workers", type=int, default=1, help="Processi su cui dividere il video"
+    )
+    parser.add_argument(
+        "--max-fps",
+        type=float,
+        default=None,
+        help="Frequenza massima di elaborazione (predefinita: config DetectorMaxFps)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=float,
+        default=WARMUP_SECONDS,
+        help="Secondi elaborati prima di ogni blocco, con più processi",
+    )
+    parser.add_argument("--format", choices=["json", "csv"], default="json")
+    parser.add_argument(
+        "-o", "--output", default=None, help="File di uscita (predefinito: stdout)"
+    )
+
+
+def run(args):
+    """Esegue il comando analyze con gli argomenti di add_arguments()."""
+    table = load_table_preset(args.table)
+    report = analyze_video(
+        args.video,
+        table,
+        workers=args.workers,
+        max_fps=args.max_fps,
+        warmup=args.warmup,
+    )
+    if args.output is None:
+        write_report(report, sys.stdout, args.format)
+    else:
+        with open(args.output, "w", newline="") as output:
+            write_report(report, output, args.format)
+    stats = report["stats"]
+    print(
+        f"{report['video']['frames']} frame in {stats['wall_time']:.1f} s "
+        f"({stats['speed']:.1f}x tempo reale, {len(report['events'])} eventi)",
+        file=sys.stderr,
+    )
@@ -0,0 +1,54 @@
+import io
+import unittest
+
+from device.analysis import analyze_video, merge_events, write_report
+from device.table import load_table_preset
+
+VIDEO = "device/test_data/video/example_edited_extended.mp4"
+TABLE = "device/test_data/video/example_edited.json"
+
+
+class AnalysisTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.table = load_table_preset(TABLE)
+        cls.report = analyze_video(VIDEO, cls.table)
+
+    def test_timeline(self):
+        events = self.report["events"]
+        self.assertEqual([event["event"] for event in events], ["start", "stop"])
+        start, stop = events
+        # Il tiro inizia intorno agli 11 secondi e il video si ferma dopo i 17
+        self.assertLess(start["onset_frame"], start["frame"])
+        self.assertAlmostEqual(start["onset_time"], 11.2, delta=0.5)
+        self.assertAlmostEqual(stop["onset_time"], 17.2, delta=0.3)
+        self.assertEqual(self.report["video"]["frames"], 526)
+        self.assertGreater(self.report["stats"]["speed"], 1)
+
+    def test_workers_match_single_pass(self):
+        report = analyze_video(VIDEO, self.table, workers=2)
+        self.assertEqual(report["stats"]["workers"], 2)
+        self.assertEqual(report["events"], self.report["events"])
+
+    def test_csv(self):
+        output = io.StringIO()
+        write_report(self.report, output, "csv")
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], "event,frame,time,onset_frame,onset_time,latency")
+        self.assertTrue(lines[1].startswith("start,"))
+
+    def test_merge_drops_repeated_events(self):
+        chunks = [
+            {"events": [{"event": "start", "frame": 10}]},
+            {
+                "events": [
+                    {"event": "start", "frame": 40},
+                    {"event": "stop", "frame": 90},
+                ]
+            },
+        ]
+        self.assertEqual([event["frame"] for event in merge_events(chunks)], [10, 90])
+
+
+if __name__ == "__main__":
+    unittest.main()
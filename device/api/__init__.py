@@ -51,16 +51,43 @@ socketio = SocketIO(
 )
 websocket.register(socketio)
 
-api.add_resource(resources.GameResource, "/game")
-api.add_resource(resources.GameActionsResource, "/game/actions")
+# Le risorse di gioco e video sono disponibili sia senza tavolo (ultimo gioco creato / sorgente
+# predefinita) sia con il prefisso /table/<table_id> per i dispositivi che gestiscono più tavoli
+api.add_resource(resources.GameResource, "/game", "/table/<int:table_id>/game")
+api.add_resource(
+    resources.GameActionsResource,
+    "/game/actions",
+    "/table/<int:table_id>/game/actions",
+)
 api.add_resource(resources.TablePresetResource, "/table")
 api.add_resource(resources.TablePresetResource2, "/table/<int:id>")
 api.add_resource(resources.RulesetResource, "/ruleset")
 api.add_resource(resources.RulesetResource2, "/ruleset/<int:id>")
-api.add_resource(resources.VideoFrameResource, "/video/frame")
-api.add_resource(resources.VideoRecordResource, "/video/record")
-api.add_resource(resources.VideoStreamResource, "/video/stream")
-api.add_resource(resources.VideoStreamControlResource, "/video/stream/control")
+api.add_resource(
+    resources.VideoFrameResource,
+    "/video/frame",
+    "/table/<int:table_id>/video/frame",
+)
+api.add_resource(
+    resources.VideoRecordResource,
+    "/video/record",
+    "/table/<int:table_id>/video/record",
+)
+api.add_resource(
+    resources.VideoDebugResource,
+    "/video/debug",
+    "/table/<int:table_id>/video/debug",
+)
+api.add_resource(
+    resources.VideoStreamResource,
+    "/video/stream",
+    "/table/<int:table_id>/video/stream",
+)
+api.add_resource(
+    resources.VideoStreamControlResource,
+    "/video/stream/control",
+    "/table/<int:table_id>/video/stream/control",
+)
 api.add_resource(resources.Login, "/login")
 api.add_resource(resources.Logout, "/logout")
 api.add_resource(resources.CheckAuth, "/check-auth")
@@ -74,6 +101,11 @@ def start(debug=False):
     Parametri:
     debug (bool): Se True, il server verrà eseguito in modalità debug. Il valore predefinito è False.
     """
+    from device.api import models_dao
+
+    # Aggiorna i database creati con una versione precedente prima di accettare richieste
+    with app.app_context():
+        models_dao.add_missing_columns()
     socketio.run(
         app,
         allow_unsafe_werkzeug=True,
@@ -1,4 +1,5 @@
 from device.api import db
+from sqlalchemy import inspect, text
 from sqlalchemy.orm import Mapped, mapped_column
 from typing import List, Tuple
 import json
@@ -63,6 +64,31 @@ class TablePreset(db.Model):
     points: Mapped[str] = mapped_column()
     colors: Mapped[str] = mapped_column()
     min_area_threshold: Mapped[int] = mapped_column(default=100)
+    detector: Mapped[str] = mapped_column(default="{}")
+
+
+def add_missing_columns():
+    """
+    Aggiunge alle tabelle esistenti le colonne introdotte dopo la loro creazione.
+    db.create_all() crea solo le tabelle mancanti, non aggiorna quelle già presenti.
+    """
+    inspector = inspect(db.engine)
+    for table in db.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            column_type = column.type.compile(db.engine.dialect)
+            default = column.default.arg if column.default is not None else None
+            sql = f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"
+            if isinstance(default, str):
+                sql += " DEFAULT '" + default.replace("'", "''") + "'"
+            elif isinstance(default, (int, float)):
+                sql += f" DEFAULT {default}"
+            db.session.execute(text(sql))
+    db.session.commit()
 
 
 class TablePresetDao:
@@ -89,12 +115,14 @@ class TablePresetDao:
         points: List[Tuple[int, int]],
         colors: List[Tuple[int, int]],
         min_area_threshold: int,
+        detector: dict | None = None,
     ):
         new_tablepreset = TablePreset(
             name=name,
             points=json.dumps(points),
             colors=json.dumps(colors),
             min_area_threshold=min_area_threshold,
+            detector=json.dumps(detector or {}),
         )
         db.session.add(new_tablepreset)
         db.session.commit()
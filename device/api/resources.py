@@ -15,20 +15,39 @@ import uuid
 from device.api.auth import auth_required, check_auth, create_access_token
 from device.config import get_config, set_config
 from device.utils import hex_to_opencv_hsv
-from device.video_producer import VideoProducer
+from device.video_producer import get_producer
 from device.game import game_manager
 from device.api import db
 from device.api import models_dao
 
 
+def _get_video_producer(table_id=None):
+    """
+    Restituisce il VideoProducer della telecamera del tavolo table_id, se sul tavolo c'è un gioco.
+    Altrimenti usa la sorgente indicata dal parametro "source" della richiesta, o quella predefinita.
+    """
+    if table_id is not None:
+        game = game_manager.get_game(table_id)
+        if game is not None:
+            return game.video_producer
+    return get_producer(request.args.get("source"))
+
+
 class VideoFrameResource(Resource):
-    def get(self):
-        frame = VideoProducer.get_instance().get_frame()
-        _, buffer = cv2.imencode(".jpg", frame)
+    # Secondi di attesa di un frame della telecamera
+    FRAME_TIMEOUT = 2.0
+
+    def get(self, table_id=None):
+        frame = _get_video_producer(table_id).wait_for_frame(timeout=self.FRAME_TIMEOUT)
+        # Telecamera ferma o nessun frame entro il timeout
+        if frame is None:
+            return ({"message": "No frame available"}, 503)
+        with frame:
+            _, buffer = cv2.imencode(".jpg", frame.image)
         response = Response(buffer.tobytes(), mimetype="image/jpeg")
         return response
 
-    def post(self):
+    def post(self, table_id=None):
         def mask(hsv, colors, points):
             # Funzione per mascherare l'immagine HSV
             # Se non ci sono colori, applica solo la maschera del poligono
@@ -68,9 +87,14 @@ class VideoFrameResource(Resource):
             colors = data["colors"]
             points = data["points"]
             if len(points) > 2:
-                frame = VideoProducer.get_instance().get_frame()
-                hsv = cv2.cvtColor(frame, cv2.COLOR_BGR2HSV)
-                hsv = cv2.GaussianBlur(hsv, (5, 5), 0)
+                frame = _get_video_producer(table_id).wait_for_frame(
+                    timeout=self.FRAME_TIMEOUT
+                )
+                if frame is None:
+                    return ({"message": "No frame available"}, 503)
+                with frame:
+                    # HSV sfocato dalla cache del frame, condiviso con il rilevatore
+                    hsv = frame.hsv()
                 masked = mask(hsv, colors, points)
                 blurred = cv2.GaussianBlur(masked, (5, 5), 0)
                 _, buffer = cv2.imencode(".jpg", blurred)
@@ -79,13 +103,13 @@ class VideoFrameResource(Resource):
 
 
 class VideoRecordResource(Resource):
-    def get(self):
+    def get(self, table_id=None):
         recording_id = str(uuid.uuid4())
         video_path = os.path.join(os.getcwd(), f"output_{recording_id}.avi")
+        video_producer = _get_video_producer(table_id)
 
         def record_video(video_path):
             logging.info(f"Video Recording Started: {video_path}")
-            video_producer = VideoProducer.get_instance()
             start_time = time.time()
 
             try:
@@ -100,12 +124,17 @@ class VideoRecordResource(Resource):
                     video_path, cv2.VideoWriter_fourcc(*"XVID"), 30, (width, height)
                 )
 
+                last_seq = 0
                 while time.time() - start_time < 50:
-                    frame = video_producer.get_frame()
+                    frame = video_producer.wait_for_frame(
+                        after_seq=last_seq, timeout=1.0
+                    )
+                    if frame is None:
+                        continue
+                    last_seq = frame.seq
                     # Scrive direttamente il frame invece di tenerlo in memoria
-                    out.write(frame)
-                    # Usa una pausa standard invece di eventlet.sleep
-                    time.sleep(0.01)  # Pausa più breve per una migliore framerate
+                    with frame:
+                        out.write(frame.image)
 
                 out.release()
                 logging.info(f"Video salvato con successo: {video_path}")
@@ -126,123 +155,180 @@ class VideoRecordResource(Resource):
         )
 
 
-class VideoStreamResource(Resource):
-    # Coda condivisa per i frame
-    frame_queue = queue.Queue(maxsize=10)
-    # Variabile per tenere traccia se il thread di acquisizione è attivo
-    is_capturing = False
-    # Lock per accesso sicuro alle variabili condivise
-    lock = threading.Lock()
-    # Riferimento al thread di acquisizione
-    capture_thread = None
+class VideoDebugResource(Resource):
+    def get(self, table_id=None):
+        """
+        Immagini di debug del rilevatore del tavolo.
+        Senza parametri restituisce i nomi delle immagini disponibili; con ?name=<nome>
+        restituisce l'immagine in JPEG. Ogni richiesta tiene attiva la pubblicazione delle
+        immagini, che il rilevatore interrompe quando nessuno le legge più.
+        """
+        game = game_manager.get_game(table_id)
+        if game is None:
+            return ({"message": "No game in progress"}, 404)
+        debug_frames = game.debug_frames
+        name = request.args.get("name")
+        if name is None:
+            debug_frames.request()
+            return jsonify(
+                {
+                    "names": debug_frames.names(),
+                    "min_interval": debug_frames.min_interval,
+                }
+            )
+        image, timestamp = debug_frames.get_jpeg(name)
+        if image is None:
+            return ({"message": "Debug frame not available yet"}, 404)
+        response = Response(image, mimetype="image/jpeg")
+        response.headers["X-Frame-Timestamp"] = str(timestamp)
+        return response
 
-    @classmethod
-    def start_capture_thread(cls):
+
+class VideoStream:
+    """
+    Stream MJPEG di un VideoProducer.
+    Un thread di acquisizione codifica in JPEG ogni nuovo frame e lo rilascia subito: la coda
+    contiene solo le immagini codificate, così un client lento non trattiene i buffer del
+    FramePool del producer.
+    """
+
+    def __init__(self, video_producer):
+        self.video_producer = video_producer
+        # Coda condivisa dei frame codificati in JPEG
+        self.frame_queue = queue.Queue(maxsize=10)
+        # Variabile per tenere traccia se il thread di acquisizione è attivo
+        self.is_capturing = False
+        # Lock per accesso sicuro alle variabili condivise
+        self.lock = threading.Lock()
+        # Riferimento al thread di acquisizione
+        self.capture_thread = None
+
+    def start_capture_thread(self):
         """Avvia il thread di acquisizione frame se non è già in esecuzione"""
-        with cls.lock:
-            if not cls.is_capturing:
-                cls.is_capturing = True
-                cls.capture_thread = threading.Thread(
-                    target=cls.capture_frames, daemon=True
+        with self.lock:
+            if not self.is_capturing:
+                self.is_capturing = True
+                self.capture_thread = threading.Thread(
+                    target=self.capture_frames, daemon=True
                 )
-                cls.capture_thread.start()
+                self.capture_thread.start()
                 return True
             return False
 
-    @classmethod
-    def stop_capture_thread(cls):
+    def stop_capture_thread(self):
         """Ferma il thread di acquisizione in modo sicuro"""
-        with cls.lock:
-            was_capturing = cls.is_capturing
-            cls.is_capturing = False
+        with self.lock:
+            was_capturing = self.is_capturing
+            self.is_capturing = False
             # Svuota la coda
-            while not cls.frame_queue.empty():
+            while not self.frame_queue.empty():
                 try:
-                    cls.frame_queue.get_nowait()
-                except:
+                    self.frame_queue.get_nowait()
+                except queue.Empty:
                     pass
         return was_capturing
 
-    @classmethod
-    def capture_frames(cls):
-        """Thread che acquisisce continuamente i frame e li mette in coda"""
-        video_producer = VideoProducer.get_instance()
+    def capture_frames(self):
+        """Thread che acquisisce continuamente i frame e li mette in coda, codificati in JPEG"""
+        last_seq = 0
         try:
-            while cls.is_capturing:
-                frame = video_producer.get_frame()
+            while self.is_capturing:
+                # Attende il prossimo frame acquisito, così ogni frame viene accodato una sola volta
+                frame = self.video_producer.wait_for_frame(
+                    after_seq=last_seq, timeout=1.0
+                )
                 if frame is not None:
+                    last_seq = frame.seq
+                    # Il buffer del frame torna al pool appena codificato
+                    with frame:
+                        ret, buffer = cv2.imencode(".jpg", frame.image)
+                    if not ret:
+                        continue
                     # Se la coda è piena, rimuovi il frame più vecchio
-                    if cls.frame_queue.full():
+                    if self.frame_queue.full():
                         try:
-                            cls.frame_queue.get_nowait()
+                            self.frame_queue.get_nowait()
                         except queue.Empty:
                             pass
-                    # Aggiungi il nuovo frame
-                    cls.frame_queue.put(frame)
-                time.sleep(0.03)  # Piccola pausa
+                    self.frame_queue.put(buffer.tobytes())
         except Exception as e:
             print(f"Errore nel thread di acquisizione: {e}")
         finally:
-            with cls.lock:
-                cls.is_capturing = False
+            with self.lock:
+                self.is_capturing = False
 
-    def get(self):
-        # Assicurati che il thread di acquisizione sia in esecuzione
-        self.start_capture_thread()
+    def generate_frames(self):
+        while self.is_capturing:
+            try:
+                # Attendi un frame dalla coda (timeout di 1 secondo)
+                frame_bytes = self.frame_queue.get(timeout=1.0)
 
-        def generate_frames():
-            while self.is_capturing:
-                try:
-                    # Attendi un frame dalla coda (timeout di 1 secondo)
-                    frame = self.frame_queue.get(timeout=1.0)
+                # Formato per il multipart/x-mixed-replace
+                yield (
+                    b"--frame\r\n"
+                    b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
+                )
 
-                    # Converti il frame in formato JPEG
-                    ret, buffer = cv2.imencode(".jpg", frame)
-                    frame_bytes = buffer.tobytes()
+            except queue.Empty:
+                # Se non ci sono frame disponibili, manda un frame vuoto o continua
+                continue
+            except Exception as e:
+                print(f"Errore nel generatore: {e}")
+                break
 
-                    # Formato per il multipart/x-mixed-replace
-                    yield (
-                        b"--frame\r\n"
-                        b"Content-Type: image/jpeg\r\n\r\n" + frame_bytes + b"\r\n"
-                    )
 
-                except queue.Empty:
-                    # Se non ci sono frame disponibili, manda un frame vuoto o continua
-                    continue
-                except Exception as e:
-                    print(f"Errore nel generatore: {e}")
-                    break
+class VideoStreamResource(Resource):
+    # Uno stream per ogni sorgente video
+    streams = {}
+    lock = threading.Lock()
+
+    @classmethod
+    def get_stream(cls, table_id=None):
+        """Restituisce lo stream della telecamera del tavolo table_id, creandolo se necessario."""
+        video_producer = _get_video_producer(table_id)
+        with cls.lock:
+            stream = cls.streams.get(video_producer.video_source)
+            if stream is None or stream.video_producer is not video_producer:
+                stream = VideoStream(video_producer)
+                cls.streams[video_producer.video_source] = stream
+            return stream
+
+    def get(self, table_id=None):
+        # Assicurati che il thread di acquisizione sia in esecuzione
+        stream = self.get_stream(table_id)
+        stream.start_capture_thread()
 
         return Response(
-            generate_frames(), mimetype="multipart/x-mixed-replace; boundary=frame"
+            stream.generate_frames(),
+            mimetype="multipart/x-mixed-replace; boundary=frame",
         )
 
 
 class VideoStreamControlResource(Resource):
-    def post(self):
+    def post(self, table_id=None):
         # Avvia lo streaming
-        if VideoStreamResource.start_capture_thread():
+        if VideoStreamResource.get_stream(table_id).start_capture_thread():
             return jsonify({"status": "success", "message": "Streaming avviato"})
         else:
             return jsonify({"status": "info", "message": "Streaming già in corso"})
 
-    def delete(self):
+    def delete(self, table_id=None):
         # Ferma lo streaming
-        if VideoStreamResource.stop_capture_thread():
+        if VideoStreamResource.get_stream(table_id).stop_capture_thread():
             return jsonify({"status": "success", "message": "Streaming interrotto"})
         else:
             return jsonify({"status": "info", "message": "Streaming non attivo"})
 
-    def get(self):
+    def get(self, table_id=None):
         # Controlla lo stato dello streaming
-        is_active = VideoStreamResource.is_capturing
+        is_active = VideoStreamResource.get_stream(table_id).is_capturing
         return jsonify({"status": "success", "streaming_active": is_active})
 
 
 class GameResource(Resource):
 
-    def get(self):
-        game = game_manager.get_game()
+    def get(self, table_id=None):
+        game = game_manager.get_game(table_id)
         if game is None:
             return ({"message": "No game in progress"}, 404)
         else:
@@ -253,17 +339,20 @@ class GameResource(Resource):
                 "game_status": game.status,
                 "ruleset_id": game.ruleset.id,
                 "tablepreset_id": game.table.id,
+                "video_source": game.video_producer.video_source,
             }
             return jsonify(data_return)
 
     @auth_required
-    def post(self):
+    def post(self, table_id=None):
         from . import socketio
 
         try:
             if not request.is_json:
                 return ({"message": "Missing JSON in request"}, 400)
             data = request.json
+            if table_id is not None:
+                data = {**data, "table_id": table_id}
             if not all(
                 flag in data
                 for flag in ("ruleset_id", "table_id", "player1_name", "player2_name")
@@ -279,6 +368,7 @@ class GameResource(Resource):
             table.points = json.loads(table.points)
             table.colors = json.loads(table.colors)
             table.colors = [hex_to_opencv_hsv(color) for color in table.colors]
+            table.detector = json.loads(table.detector or "{}")
             if ruleset and table:
                 game_manager.new_game(
                     ruleset=ruleset,
@@ -286,18 +376,25 @@ class GameResource(Resource):
                     player1_name=data["player1_name"],
                     player2_name=data["player2_name"],
                     socketio=socketio,
+                    video_source=data.get("video_source"),
                 )
                 return ({"message": "Game created successfully"}, 200)
             else:
                 return ({"message": "Ruleset or TablePreset not found"}, 404)
+        except TimeoutError as e:
+            logging.error(e)
+            return ({"message": "Previous game is still shutting down"}, 503)
         except Exception as e:
             logging.error(e)
             return ({"message": "Internal server error"}, 500)
 
 
 class GameActionsResource(Resource):
+    # Secondi di attesa dell'esito di un comando, eseguito dal dispatcher del gioco
+    COMMAND_TIMEOUT = 2.0
+
     @auth_required
-    def post(self):
+    def post(self, table_id=None):
         # Prendere il request e vedere se c'è un action
         data = None
         if not request.is_json:
@@ -308,26 +405,31 @@ class GameActionsResource(Resource):
         if "action" not in data:
             return ({"message": "Missing 'action' in request"}, 400)
 
-        game = game_manager.get_game()
+        game = game_manager.get_game(table_id)
         if game is None:
             return ({"message": "No game in progress"}, 400)
 
         action = data["action"].lower()
         error = None
-        if action == "start":
-            error = game.start()
-        elif action == "pause":
-            game.pause()
-        elif action == "resume":
-            game.resume()
-        elif action == "end":
-            error = game_manager.end_game()
-        elif action == "increment_time_p0":
-            error = game.increment_time(0)
-        elif action == "increment_time_p1":
-            error = game.increment_time(1)
-        else:
-            return ({"message": "Invalid action"}, 400)
+        timeout = self.COMMAND_TIMEOUT
+        try:
+            if action == "start":
+                error = game.start().result(timeout)
+            elif action == "pause":
+                game.pause().result(timeout)
+            elif action == "resume":
+                game.resume().result(timeout)
+            elif action == "end":
+                # Non attende la fine del gioco (e dei suoi thread): la attende il prossimo new_game
+                error = game_manager.end_game(game.table.id)
+            elif action == "increment_time_p0":
+                error = game.increment_time(0).result(timeout)
+            elif action == "increment_time_p1":
+                error = game.increment_time(1).result(timeout)
+            else:
+                return ({"message": "Invalid action"}, 400)
+        except TimeoutError:
+            return ({"message": f"Action '{action}' timed out"}, 503)
         if error:
             return ({"message": error}, 400)
         return ({"message": f"Action '{action}' performed successfully"}, 200)
@@ -339,6 +441,7 @@ class TablePresetResource(Resource):
         for table in tables:
             table.colors = json.loads(table.colors)
             table.points = json.loads(table.points)
+            table.detector = json.loads(table.detector or "{}")
         return jsonify(tables)
 
     @auth_required
@@ -361,6 +464,7 @@ class TablePresetResource(Resource):
             points=data["points"],
             colors=data["colors"],
             min_area_threshold=data["min_area_threshold"],
+            detector=data.get("detector"),
         )
         return jsonify(tablepreset)
 
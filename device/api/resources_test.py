@@ -0,0 +1,43 @@
+import time
+import unittest
+
+import numpy as np
+
+from device.api.resources import VideoStream
+from device.video_producer import VideoProducer
+
+
+class VideoStreamTest(unittest.TestCase):
+    def setUp(self):
+        self.image = np.zeros((36, 64, 3), np.uint8)
+        # Il frame fisso iniziale fissa il formato dei buffer del pool
+        self.producer = VideoProducer(frame=self.image, frame_pool_size=4)
+        self.stream = VideoStream(self.producer)
+
+    def tearDown(self):
+        self.stream.stop_capture_thread()
+        self.producer.stop()
+
+    def capture(self, count):
+        """Pubblica count frame come il ciclo di acquisizione, nei buffer del pool."""
+        for _ in range(count):
+            buffer = self.producer._acquire_buffer()
+            if buffer is None:
+                self.producer._publish(self.image.copy())
+            else:
+                np.copyto(buffer, self.image)
+                self.producer._publish(buffer, buffer)
+            time.sleep(0.005)
+
+    def test_slow_client_does_not_exhaust_pool(self):
+        self.stream.start_capture_thread()
+        # Nessun client legge lo stream: la coda si riempie
+        self.capture(40)
+        self.assertGreater(self.stream.frame_queue.qsize(), 4)
+        self.assertEqual(self.producer.get_stats()["frame_pool"]["fallbacks"], 0)
+        chunk = next(self.stream.generate_frames())
+        self.assertTrue(chunk.startswith(b"--frame\r\nContent-Type: image/jpeg"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,6 +1,21 @@
 import logging
 import time
-from flask_socketio import emit, send
+from flask import request
+from flask_socketio import emit, send, join_room, leave_room, rooms
+
+from device.game import Game
+
+
+def _table_id(data):
+    """id del tavolo in data["table_id"] (intero o stringa di cifre), None se data non è valido."""
+    if not isinstance(data, dict):
+        return None
+    table_id = data.get("table_id")
+    if isinstance(table_id, str) and table_id.isdigit():
+        return int(table_id)
+    if isinstance(table_id, bool) or not isinstance(table_id, int):
+        return None
+    return table_id
 
 
 def register(socketio):
@@ -11,9 +26,38 @@ def register(socketio):
 
     @socketio.on("connect")
     def on_connect():
+        # Il client può seguire un solo tavolo passando ?table_id=<id>,
+        # altrimenti riceve gli eventi di tutti i tavoli
+        table_id = request.args.get("table_id", type=int)
+        if table_id is None:
+            join_room(Game.ALL_TABLES_ROOM)
+        else:
+            join_room(Game.table_room(table_id))
         emit("time_sync", {"server_time": time.time()})
         logging.info("Client connesso")
 
+    @socketio.on("subscribe")
+    def on_subscribe(data):
+        """Passa a seguire gli eventi del solo tavolo indicato in data["table_id"]."""
+        table_id = _table_id(data)
+        if table_id is None:
+            # Richiesta non valida: il client continua a seguire gli stessi tavoli
+            logging.warning(f"Richiesta subscribe non valida: {data!r}")
+            emit("error", {"message": "subscribe requires an integer 'table_id'"})
+            return
+        for room in rooms():
+            if room != request.sid:
+                leave_room(room)
+        join_room(Game.table_room(table_id))
+
+    @socketio.on("unsubscribe")
+    def on_unsubscribe(data=None):
+        """Torna a ricevere gli eventi di tutti i tavoli."""
+        for room in rooms():
+            if room != request.sid:
+                leave_room(room)
+        join_room(Game.ALL_TABLES_ROOM)
+
     @socketio.on("disconnect")
     def on_disconnect():
         logging.info("Client disconnesso")
@@ -0,0 +1,568 @@
+"""
+Benchmark delle parti del rilevatore di movimento.
+
+Uso:
+    python -m device.benchmark blob-filters <video> <preset.json>
+    python -m device.benchmark allocations <video> <preset.json>
+    python -m device.benchmark engines <video> <preset.json>
+    python -m device.benchmark suite [--labels labels.json] [-o report.json]
+    python -m device.benchmark compare <old.json> <new.json>
+"""
+
+import argparse
+import dataclasses
+import datetime
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+import cv2
+import numpy as np
+
+from device.analysis import analyze_chunk, video_info
+from device.config import get_config
+from device.game.detection import BLOB_FILTERS, PackedMaskHistory
+from device.game.motion_engines import MOTION_ENGINES
+from device.game.video_consumer import VideoConsumer
+from device.table import TablePreset, load_table_preset
+from device.video_producer import Frame
+
+
+def read_frames(video_path, max_frames=None):
+    """
+    Legge i frame di un file video (al massimo max_frames) e li restituisce come Frame,
+    con il tempo del frame nel video come timestamp.
+    """
+    capture = cv2.VideoCapture(video_path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 30.0
+    frames = []
+    while capture.isOpened() and (max_frames is None or len(frames) < max_frames):
+        ret, image = capture.read()
+        if not ret:
+            break
+        frames.append(Frame(len(frames) + 1, len(frames) / fps, image))
+    capture.release()
+    return frames
+
+
+def percentile_ms(times, percentile):
+    return float(np.percentile(times, percentile) * 1000) if times else 0.0
+
+
+def benchmark_blob_filters(frames, table: TablePreset, repeat=3):
+    """
+    Confronta i filtri delle macchie di BLOB_FILTERS sulle stesse maschere.
+
+    Per ogni filtro riporta il tempo per frame (media, p50, p95) e l'accordo con il filtro
+    "contours" di riferimento, come IoU dei pixel accettati.
+
+    Args:
+        frames (list of Frame): Frame su cui eseguire il confronto.
+        table (TablePreset): Preset del tavolo ripreso nei frame.
+        repeat (int): Numero di ripetizioni di ogni filtro su ogni maschera.
+    """
+    context = VideoConsumer.compile_context(table)
+    circularity = float(VideoConsumer.table_option(table, "circularity"))
+    masks = []
+    for frame in frames:
+        context.ensure_shape(frame.image.shape[:2])
+        masks.append(context.foreground_mask(frame.hsv(context.roi)))
+
+    results = {}
+    reference = None
+    for name, filter_blobs in BLOB_FILTERS.items():
+        times = []
+        outputs = []
+        for mask in masks:
+            for _ in range(repeat):
+                start = time.perf_counter()
+                output = filter_blobs(mask, table.min_area_threshold, circularity)
+                times.append(time.perf_counter() - start)
+            outputs.append(output)
+        if reference is None:
+            reference = outputs
+        intersection = sum(
+            cv2.countNonZero(cv2.bitwise_and(a, b)) for a, b in zip(outputs, reference)
+        )
+        union = sum(
+            cv2.countNonZero(cv2.bitwise_or(a, b)) for a, b in zip(outputs, reference)
+        )
+        results[name] = {
+            "mean_ms": float(np.mean(times) * 1000) if times else 0.0,
+            "p50_ms": percentile_ms(times, 50),
+            "p95_ms": percentile_ms(times, 95),
+            "iou_vs_contours": intersection / union if union else 1.0,
+        }
+    return {"frames": len(masks), "filters": results}
+
+
+def benchmark_allocations(frames, table: TablePreset):
+    """
+    Confronta la memoria allocata per frame dal rilevatore con e senza buffer preallocati.
+
+    Per ogni modalità esegue maschera, filtro delle macchie e differenze tra frame come
+    VideoConsumer e misura con tracemalloc il picco di memoria allocata durante ogni frame.
+    Il primo frame, in cui vengono create le immagini del workspace, è riportato a parte.
+
+    Args:
+        frames (list of Frame): Frame su cui eseguire il confronto.
+        table (TablePreset): Preset del tavolo ripreso nei frame.
+    """
+    results = {}
+    for preallocate in (False, True):
+        preset = dataclasses.replace(
+            table, detector={**table.detector, "preallocate": preallocate}
+        )
+        consumer = VideoConsumer(
+            preset, None, None, None, headless=True, threaded=False
+        )
+        context = consumer._context
+        history = PackedMaskHistory(3)
+        peaks = []
+        times = []
+        tracemalloc.start()
+        for frame in frames:
+            start_memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+            start = time.perf_counter()
+            context.ensure_shape(frame.image.shape[:2])
+            if context.workspace is not None:
+                _, hsv = context.workspace.prepare(
+                    frame.crop(context.roi), Frame.BLUR_KERNEL
+                )
+            else:
+                hsv = cv2.cvtColor(
+                    cv2.GaussianBlur(frame.crop(context.roi), Frame.BLUR_KERNEL, 0),
+                    cv2.COLOR_BGR2HSV,
+                )
+            history.add(consumer._create_mask(hsv, context))
+            if history.is_full():
+                consumer._motion_count(history)
+            times.append(time.perf_counter() - start)
+            _, peak_memory = tracemalloc.get_traced_memory()
+            peaks.append(peak_memory - start_memory)
+        tracemalloc.stop()
+        workspace = context.workspace
+        results["preallocated" if preallocate else "allocating"] = {
+            "mean_ms": float(np.mean(times) * 1000) if times else 0.0,
+            "first_frame_peak_bytes": peaks[0] if peaks else 0,
+            "warm_frame_peak_bytes": max(peaks[1:], default=0),
+            "workspace_bytes": workspace.nbytes if workspace is not None else 0,
+            "reallocations": workspace.reallocations if workspace is not None else 0,
+        }
+    return {"frames": len(frames), "modes": results}
+
+
+def benchmark_engines(frames, table: TablePreset):
+    """
+    Confronta i motori di rilevamento di MOTION_ENGINES sugli stessi frame.
+
+    Ogni motore elabora tutti i frame, con i loro tempi nel video, attraverso la stessa logica
+    di debounce del VideoConsumer. Per ogni motore riporta il costo per frame (media, p50, p95),
+    gli eventi di movimento con il loro tempo nel video, l'istante riportato ai callback (onset,
+    il primo frame con il nuovo stato) e la latenza del rilevamento di ogni evento.
+
+    Args:
+        frames (list of Frame): Frame su cui eseguire il confronto.
+        table (TablePreset): Preset del tavolo ripreso nei frame.
+    """
+    results = {}
+    for name in MOTION_ENGINES:
+        preset = dataclasses.replace(table, detector={**table.detector, "engine": name})
+        events = []
+        current = {}
+
+        def record(event, onset):
+            latency = consumer.get_stats()[f"{event}_latency"]
+            events.append(
+                {
+                    "event": event,
+                    "time": current["timestamp"],
+                    "onset": onset,
+                    "latency": latency,
+                }
+            )
+
+        consumer = VideoConsumer(
+            preset,
+            lambda onset: record("start", onset),
+            lambda onset: record("stop", onset),
+            None,
+            headless=True,
+            threaded=False,
+        )
+        times = []
+        last_timestamp = None
+        for frame in frames:
+            # Frame nuovo a ogni motore: le immagini derivate non sono condivise tra i motori
+            frame = Frame(frame.seq, frame.timestamp, frame.image)
+            current["timestamp"] = frame.timestamp
+            interval = (
+                frame.timestamp - last_timestamp if last_timestamp is not None else None
+            )
+            last_timestamp = frame.timestamp
+            start = time.perf_counter()
+            consumer.process_frame(frame, interval)
+            times.append(time.perf_counter() - start)
+        stats = consumer.get_stats()
+        results[name] = {
+            "mean_ms": float(np.mean(times) * 1000) if times else 0.0,
+            "p50_ms": percentile_ms(times, 50),
+            "p95_ms": percentile_ms(times, 95),
+            "engine_avg_ms": stats["engine_avg_ms"],
+            "gate_skip_ratio": stats["gate_skip_ratio"],
+            "threshold": stats["engine_threshold"],
+            "events": events,
+        }
+    return {"frames": len(frames), "engines": results}
+
+
+LABELS_PATH = "device/test_data/video/labels.json"
+
+# Configurazioni del rilevatore confrontate dalla suite: opzioni aggiunte a TablePreset.detector
+SUITE_CONFIGURATIONS = {
+    "color": {"engine": "color"},
+    "color-tracked": {"engine": "color", "tracking": True},
+    "color-ungated": {"engine": "color", "gate": False},
+    "color-components": {"engine": "color", "blob_filter": "components"},
+    "color-preallocated": {"engine": "color", "preallocate": True},
+    "mog2": {"engine": "mog2"},
+    "knn": {"engine": "knn"},
+    "flow": {"engine": "flow"},
+}
+
+
+def load_labels(path=LABELS_PATH):
+    """
+    Carica le etichette dei video di prova.
+
+    Il file JSON contiene la tolleranza in secondi e, per ogni video, il preset del tavolo
+    e gli intervalli di movimento delle biglie [inizio, fine] in secondi dall'inizio del video
+    (fine null se le biglie si muovono ancora alla fine). I percorsi sono relativi al file.
+    """
+    with open(path, "r") as f:
+        data = json.load(f)
+    folder = os.path.dirname(path)
+    clips = [
+        {
+            **clip,
+            "video": os.path.join(folder, clip["video"]),
+            "table": os.path.join(folder, clip["table"]),
+        }
+        for clip in data["clips"]
+    ]
+    return clips, float(data.get("tolerance", 0.2))
+
+
+def match_events(events, motion, tolerance):
+    """
+    Confronta gli eventi del rilevatore con gli intervalli di movimento etichettati.
+
+    Un evento start corrisponde al primo intervallo non ancora iniziato che contiene il suo
+    tempo (a meno della tolleranza, per etichette leggermente in ritardo); un evento stop
+    alla fine di un intervallo, se arriva dopo di essa e prima del movimento successivo.
+    Gli altri eventi sono falsi, gli intervalli senza evento sono mancati.
+
+    Args:
+        events (list of dict): Eventi con "event" (start o stop), "time" e "onset_time".
+        motion (list): Intervalli [inizio, fine] in secondi, fine None se non termina.
+        tolerance (float): Anticipo massimo di un evento rispetto all'etichetta, in secondi.
+
+    Returns:
+        dict: Latenze (tempo del rilevamento meno etichetta), errori dell'onset riportato
+            ai callback, eventi falsi e mancati.
+    """
+    result = {
+        "start_latencies": [],
+        "stop_latencies": [],
+        "start_onset_errors": [],
+        "stop_onset_errors": [],
+        "false_starts": 0,
+        "false_stops": 0,
+        "missed_starts": 0,
+        "missed_stops": 0,
+    }
+    started = [False] * len(motion)
+    stopped = [False] * len(motion)
+    for event in events:
+        matched = False
+        for index, (begin, end) in enumerate(motion):
+            following = motion[index + 1][0] if index + 1 < len(motion) else None
+            if event["event"] == "start":
+                label = begin
+                matched = (
+                    not started[index]
+                    and event["time"] >= begin - tolerance
+                    and (end is None or event["time"] < end)
+                )
+            else:
+                label = end
+                matched = (
+                    end is not None
+                    and started[index]
+                    and not stopped[index]
+                    and event["time"] >= end - tolerance
+                    and (following is None or event["time"] < following)
+                )
+            if matched:
+                (started if event["event"] == "start" else stopped)[index] = True
+                result[f"{event['event']}_latencies"].append(event["time"] - label)
+                result[f"{event['event']}_onset_errors"].append(
+                    event["onset_time"] - label
+                )
+                break
+        if not matched:
+            result[f"false_{event['event']}s"] += 1
+    result["missed_starts"] = started.count(False)
+    result["missed_stops"] = sum(
+        1 for (_, end), done in zip(motion, stopped) if end is not None and not done
+    )
+    return result
+
+
+def summarize_times(times):
+    """Tempo per frame (media e percentili, in millisecondi) e frame elaborati al secondo."""
+    return {
+        "frames": len(times),
+        "mean_ms": float(np.mean(times) * 1000) if times else 0.0,
+        "p50_ms": percentile_ms(times, 50),
+        "p95_ms": percentile_ms(times, 95),
+        "p99_ms": percentile_ms(times, 99),
+        "fps": len(times) / sum(times) if times else 0.0,
+    }
+
+
+def summarize_matches(matches):
+    """Somma dei conteggi e latenze medie e massime di più confronti di match_events()."""
+    summary = {}
+    for event in ("start", "stop"):
+        latencies = [x for match in matches for x in match[f"{event}_latencies"]]
+        onset_errors = [x for match in matches for x in match[f"{event}_onset_errors"]]
+        summary[f"{event}_latency_mean"] = (
+            float(np.mean(latencies)) if latencies else None
+        )
+        summary[f"{event}_latency_max"] = max(latencies, default=None)
+        summary[f"{event}_onset_error_mean"] = (
+            float(np.mean(onset_errors)) if onset_errors else None
+        )
+        for kind in ("false", "missed"):
+            key = f"{kind}_{event}s"
+            summary[key] = sum(match[key] for match in matches)
+    return summary
+
+
+def version_info():
+    """Revisione del codice e versioni delle librerie, per confrontare i report."""
+    try:
+        revision = subprocess.run(
+            ["git", "describe", "--always", "--dirty"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        revision = None
+    return {
+        "revision": revision,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+    }
+
+
+def benchmark_suite(clips, tolerance, configurations=None, max_fps=None):
+    """
+    Esegue ogni configurazione del rilevatore su ogni video etichettato, senza attese e senza
+    finestre, come il comando analyze.
+
+    Per ogni video e configurazione riporta il tempo di elaborazione per frame (media, p50,
+    p95, p99, decodifica esclusa), i frame elaborati al secondo, gli eventi e il loro confronto
+    con le etichette (latenze di inizio e fine, eventi falsi e mancati); per ogni
+    configurazione riporta anche il riepilogo su tutti i video.
+
+    Args:
+        clips (list of dict): Video etichettati, come restituiti da load_labels().
+        tolerance (float): Anticipo massimo di un evento rispetto all'etichetta, in secondi.
+        configurations (dict): Opzioni del rilevatore per nome (Opzionale, SUITE_CONFIGURATIONS).
+        max_fps (float): Frequenza massima di elaborazione (Opzionale, config DetectorMaxFps).
+    """
+    if configurations is None:
+        configurations = SUITE_CONFIGURATIONS
+    if max_fps is None:
+        max_fps = get_config().getfloat("VIDEO", "DetectorMaxFps", fallback=30.0)
+    results = {name: {"clips": {}} for name in configurations}
+    for clip in clips:
+        table = load_table_preset(clip["table"])
+        frames, fps = video_info(clip["video"])
+        motion = [tuple(interval) for interval in clip["motion"]]
+        for name, options in configurations.items():
+            preset = dataclasses.replace(table, detector={**table.detector, **options})
+            times = []
+            chunk = analyze_chunk(
+                clip["video"], preset, 0, frames, 0, max_fps, frame_times=times
+            )
+            results[name]["clips"][os.path.basename(clip["video"])] = {
+                **summarize_times(times),
+                "events": chunk["events"],
+                **match_events(chunk["events"], motion, tolerance),
+            }
+            results[name].setdefault("times", []).extend(times)
+    for result in results.values():
+        times = result.pop("times", [])
+        result["summary"] = {
+            **summarize_times(times),
+            **summarize_matches(list(result["clips"].values())),
+        }
+    return {
+        "version": version_info(),
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "max_fps": max_fps,
+        "tolerance": tolerance,
+        "clips": [
+            {
+                "video": os.path.basename(clip["video"]),
+                "table": os.path.basename(clip["table"]),
+                "motion": clip["motion"],
+            }
+            for clip in clips
+        ],
+        "configurations": results,
+    }
+
+
+# Metriche del riepilogo confrontate da compare_reports()
+COMPARED_METRICS = [
+    "p50_ms",
+    "p95_ms",
+    "p99_ms",
+    "fps",
+    "start_latency_mean",
+    "stop_latency_mean",
+    "false_starts",
+    "false_stops",
+    "missed_starts",
+    "missed_stops",
+]
+
+
+def compare_reports(old, new):
+    """
+    Confronta i riepiloghi di due report di benchmark_suite(), per le configurazioni presenti
+    in entrambi: per ogni metrica di COMPARED_METRICS riporta il vecchio valore, il nuovo e
+    la differenza.
+    """
+    comparison = {}
+    for name, result in new["configurations"].items():
+        if name not in old["configurations"]:
+            continue
+        before = old["configurations"][name]["summary"]
+        after = result["summary"]
+        comparison[name] = {
+            metric: {
+                "old": before.get(metric),
+                "new": after.get(metric),
+                "delta": (
+                    after[metric] - before[metric]
+                    if before.get(metric) is not None and after.get(metric) is not None
+                    else None
+                ),
+            }
+            for metric in COMPARED_METRICS
+        }
+    return {
+        "old": old["version"]["revision"],
+        "new": new["version"]["revision"],
+        "configurations": comparison,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="python -m device.benchmark",
+        description="Benchmark delle parti del rilevatore di movimento",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    blob_parser = subparsers.add_parser(
+        "blob-filters", help="Confronta i filtri delle macchie su un video"
+    )
+    blob_parser.add_argument("video", help="File video da analizzare")
+    blob_parser.add_argument("table", help="File JSON del preset del tavolo")
+    blob_parser.add_argument("--max-frames", type=int, default=None)
+    blob_parser.add_argument("--repeat", type=int, default=3)
+    allocations_parser = subparsers.add_parser(
+        "allocations",
+        help="Confronta la memoria allocata per frame con e senza buffer preallocati",
+    )
+    allocations_parser.add_argument("video", help="File video da analizzare")
+    allocations_parser.add_argument("table", help="File JSON del preset del tavolo")
+    allocations_parser.add_argument("--max-frames", type=int, default=None)
+    engines_parser = subparsers.add_parser(
+        "engines",
+        help="Confronta costo, eventi e latenza dei motori di rilevamento su un video",
+    )
+    engines_parser.add_argument("video", help="File video da analizzare")
+    engines_parser.add_argument("table", help="File JSON del preset del tavolo")
+    engines_parser.add_argument("--max-frames", type=int, default=None)
+    suite_parser = subparsers.add_parser(
+        "suite",
+        help="Esegue le configurazioni del rilevatore sui video etichettati",
+    )
+    suite_parser.add_argument(
+        "--labels", default=LABELS_PATH, help="File JSON delle etichette dei video"
+    )
+    suite_parser.add_argument(
+        "--config",
+        action="append",
+        choices=list(SUITE_CONFIGURATIONS),
+        help="Configurazione da eseguire, ripetibile (predefinite: tutte)",
+    )
+    suite_parser.add_argument("--max-fps", type=float, default=None)
+    suite_parser.add_argument(
+        "-o", "--output", default=None, help="File del report (predefinito: stdout)"
+    )
+    compare_parser = subparsers.add_parser(
+        "compare", help="Confronta i riepiloghi di due report della suite"
+    )
+    compare_parser.add_argument("old", help="Report di riferimento")
+    compare_parser.add_argument("new", help="Nuovo report")
+    args = parser.parse_args(argv)
+
+    if args.command == "blob-filters":
+        frames = read_frames(args.video, args.max_frames)
+        table = load_table_preset(args.table)
+        report = benchmark_blob_filters(frames, table, repeat=args.repeat)
+        print(json.dumps(report, indent=4))
+    elif args.command == "allocations":
+        frames = read_frames(args.video, args.max_frames)
+        table = load_table_preset(args.table)
+        report = benchmark_allocations(frames, table)
+        print(json.dumps(report, indent=4))
+    elif args.command == "engines":
+        frames = read_frames(args.video, args.max_frames)
+        table = load_table_preset(args.table)
+        report = benchmark_engines(frames, table)
+        print(json.dumps(report, indent=4))
+    elif args.command == "suite":
+        clips, tolerance = load_labels(args.labels)
+        configurations = SUITE_CONFIGURATIONS
+        if args.config:
+            configurations = {name: SUITE_CONFIGURATIONS[name] for name in args.config}
+        report = benchmark_suite(clips, tolerance, configurations, args.max_fps)
+        if args.output is None:
+            print(json.dumps(report, indent=4))
+        else:
+            with open(args.output, "w") as f:
+                json.dump(report, f, indent=4)
+    elif args.command == "compare":
+        with open(args.old, "r") as f:
+            old = json.load(f)
+        with open(args.new, "r") as f:
+            new = json.load(f)
+        print(json.dumps(compare_reports(old, new), indent=4))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+import os
+import unittest
+
+from device.benchmark import compare_reports, load_labels, match_events
+
+
+def event(name, time, onset=None):
+    return {"event": name, "time": time, "onset_time": time if onset is None else onset}
+
+
+class MatchEventsTest(unittest.TestCase):
+    def test_latencies(self):
+        events = [event("start", 11.9, onset=11.3), event("stop", 17.4)]
+        result = match_events(events, [(11.2, 17.1)], tolerance=0.2)
+        self.assertAlmostEqual(result["start_latencies"][0], 0.7)
+        self.assertAlmostEqual(result["start_onset_errors"][0], 0.1)
+        self.assertAlmostEqual(result["stop_latencies"][0], 0.3)
+        self.assertEqual(result["false_starts"] + result["false_stops"], 0)
+        self.assertEqual(result["missed_starts"] + result["missed_stops"], 0)
+
+    def test_false_and_missed_events(self):
+        events = [
+            event("start", 4.8),  # Prima del movimento
+            event("stop", 6.0),
+            event("start", 11.5),
+            event("stop", 12.0),  # Biglie ancora in movimento
+        ]
+        result = match_events(events, [(11.2, None), (20.0, 25.0)], tolerance=0.2)
+        self.assertEqual(result["false_starts"], 1)
+        self.assertEqual(result["false_stops"], 2)
+        self.assertEqual(result["missed_starts"], 1)
+        self.assertEqual(result["missed_stops"], 1)
+        self.assertEqual(result["stop_latencies"], [])
+
+
+class SuiteReportTest(unittest.TestCase):
+    def test_labels_point_to_clips(self):
+        clips, tolerance = load_labels()
+        self.assertGreater(tolerance, 0)
+        for clip in clips:
+            self.assertTrue(os.path.exists(clip["video"]), clip["video"])
+            self.assertTrue(os.path.exists(clip["table"]), clip["table"])
+            for begin, end in clip["motion"]:
+                self.assertTrue(end is None or end > begin)
+
+    def test_compare_reports(self):
+        def report(revision, p95, false_starts):
+            summary = {"p95_ms": p95, "false_starts": false_starts}
+            return {
+                "version": {"revision": revision},
+                "configurations": {"color": {"summary": summary}},
+            }
+
+        comparison = compare_reports(report("a", 3.0, 1), report("b", 2.5, 0))
+        self.assertEqual(comparison["new"], "b")
+        metrics = comparison["configurations"]["color"]
+        self.assertAlmostEqual(metrics["p95_ms"]["delta"], -0.5)
+        self.assertEqual(metrics["false_starts"]["delta"], -1)
+        self.assertIsNone(metrics["fps"]["delta"])
+
+
+if __name__ == "__main__":
+    unittest.main()
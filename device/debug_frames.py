@@ -0,0 +1,88 @@
+"""
+Canale opzionale per le immagini di debug del rilevatore di movimento.
+
+In modalità headless il rilevatore non apre finestre: le immagini intermedie (frame sfocato,
+maschere, differenze) vengono pubblicate su un DebugFrames solo se un client le ha richieste
+di recente e al massimo una volta ogni min_interval secondi. Se nessuno le guarda, il costo
+per frame è un solo confronto tra tempi.
+"""
+
+import threading
+import time
+
+import cv2
+
+from device.config import get_config
+
+
+class DebugFrames:
+    """
+    Ultime immagini di debug pubblicate da un VideoConsumer, lette dall'interfaccia web.
+
+    Attributi:
+        min_interval (float): Intervallo minimo tra due pubblicazioni, in secondi
+            (config VIDEO/DebugFrameInterval, predefinito 0.5).
+        idle_timeout (float): Secondi dopo l'ultima richiesta oltre i quali si smette di pubblicare.
+        published (int): Numero di pubblicazioni effettuate.
+    """
+
+    def __init__(self, min_interval=None, idle_timeout=5.0):
+        if min_interval is None:
+            min_interval = get_config().getfloat(
+                "VIDEO", "DebugFrameInterval", fallback=0.5
+            )
+        self.min_interval = min_interval
+        self.idle_timeout = idle_timeout
+        self.published = 0
+        self._images = {}
+        self._timestamp = None
+        self._requested_at = float("-inf")
+        self._published_at = float("-inf")
+        self._lock = threading.Lock()
+
+    def wanted(self) -> bool:
+        """True se un client ha richiesto le immagini di recente ed è ora di pubblicarne di nuove."""
+        now = time.monotonic()
+        return (
+            now - self._requested_at < self.idle_timeout
+            and now - self._published_at >= self.min_interval
+        )
+
+    def publish(self, images: dict):
+        """
+        Pubblica le immagini di debug di un frame.
+        Le immagini vengono copiate: il rilevatore può riusare subito i propri buffer.
+        """
+        images = {name: image.copy() for name, image in images.items()}
+        with self._lock:
+            self._images = images
+            self._timestamp = time.time()
+            self._published_at = time.monotonic()
+            self.published += 1
+
+    def request(self):
+        """Segnala che un client sta guardando le immagini di debug."""
+        self._requested_at = time.monotonic()
+
+    def names(self):
+        """Nomi delle immagini disponibili."""
+        with self._lock:
+            return sorted(self._images)
+
+    def get(self, name):
+        """
+        Restituisce l'ultima immagine pubblicata con il nome indicato (None se non disponibile)
+        e il tempo della sua pubblicazione. Segnala anche la richiesta, così le pubblicazioni
+        continuano finché il client continua a leggere.
+        """
+        self.request()
+        with self._lock:
+            return self._images.get(name), self._timestamp
+
+    def get_jpeg(self, name):
+        """Come get(), con l'immagine già codificata in JPEG (None se non disponibile)."""
+        image, timestamp = self.get(name)
+        if image is None:
+            return None, timestamp
+        _, buffer = cv2.imencode(".jpg", image)
+        return buffer.tobytes(), timestamp
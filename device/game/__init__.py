@@ -1,15 +1,18 @@
-import threading
-import time
+from collections import deque
+from concurrent.futures import Future
 from typing import Literal
 import logging
-from gpiozero import Buzzer
 import os
+import time
 
 from .video_consumer import VideoConsumer
+from .detector_process import DetectorProcess, detector_process_enabled
+from device.game.clock import SYSTEM_CLOCK, Clock
+from device.game.dispatcher import CommandDispatcher
 from device.game.ruleset import Ruleset
+from device.game.sound import FINAL, TICK, WARNING, SoundWorker, get_sound_worker
 from device.game.timer import Timer
 from device.table import TablePreset
-from device.utils import is_raspberry_pi
 from device.video_producer import VideoProducer
 
 
@@ -30,11 +33,31 @@ class Game:
     increments (List[int]): Numero di incrementi disponibili per ciascun giocatore.
     _timer (Timer): Timer che gestisce la durata di ogni turno.
     status (Literal["ready", "running", "waiting", "ended", "paused"]): Stato attuale del gioco.
-    _video_consumer (VideoConsumer): Gestore degli eventi video per il movimento.
+    _video_consumer (VideoConsumer | DetectorProcess): Gestore degli eventi video per il movimento.
     last_remaining_time (int): Ultimo tempo rimanente registrato.
     socketio: Oggetto per la comunicazione via WebSocket.
+    video_producer (VideoProducer): Produttore video della telecamera che inquadra il tavolo.
+    clock (Clock): Orologio del gioco, condiviso con il timer e il rilevatore di movimento.
+    transitions (deque): Ultime transizioni di stato, con istante (clock.time()) e comando.
+
+    Comandi (API REST) ed eventi (movimento dal rilevatore, scadenza dal timer) arrivano da
+    thread diversi: vengono accodati in un CommandDispatcher ed eseguiti uno alla volta, in
+    ordine di arrivo, quindi lo stato del gioco è modificato da un solo thread. I metodi
+    pubblici restituiscono subito un Future con il risultato del comando (un messaggio di
+    errore o None); i metodi _handle_* eseguono i comandi e vanno chiamati solo dal dispatcher.
+
+    Gli eventi WebSocket vengono inviati alla stanza del tavolo (table_room(table.id)) e alla
+    stanza ALL_TABLES_ROOM, in cui entrano i client che non seguono un tavolo specifico.
     """
 
+    ALL_TABLES_ROOM = "tables"
+    TRANSITION_HISTORY = 200  # Transizioni di stato conservate in transitions
+
+    @staticmethod
+    def table_room(table_id) -> str:
+        """Nome della stanza WebSocket che riceve gli eventi del tavolo table_id."""
+        return f"table/{table_id}"
+
     def __init__(
         self,
         ruleset: Ruleset,
@@ -43,6 +66,8 @@ class Game:
         player2_name: str,
         video_producer: VideoProducer,
         socketio=None,
+        clock: Clock | None = None,
+        sound: SoundWorker | None = None,
     ):
         """
         Inizializza una nuova istanza di Game impostando il set di regole, la configurazione del tavolo e i nomi dei giocatori.
@@ -54,12 +79,16 @@ class Game:
             player2_name (str): Nome del secondo giocatore.
             video_producer (VideoProducer): Oggetto che gestisce la produzione di video (Opzionale). Permette maggiore facilità di testing
             socketio (SocketIO): Oggetto per la comunicazione via WebSocket.
+            clock (Clock): Orologio del gioco (Opzionale, tempo reale). Con un VirtualClock il
+                rilevatore gira sempre nel processo del gioco.
+            sound (SoundWorker): Uscita dei segnali sonori (Opzionale, quella del dispositivo).
         """
+        self.clock = clock if clock is not None else SYSTEM_CLOCK
         self.ruleset = ruleset
         self.table = table
+        self.video_producer = video_producer
 
-        self._is_running_rpi = is_raspberry_pi()
-        self._buzzer = Buzzer(11) if self._is_running_rpi else None
+        self._sound = sound if sound is not None else get_sound_worker()
         self.player_names = [player1_name, player2_name]
         self.increments = [
             ruleset.max_increment_for_match,
@@ -67,66 +96,178 @@ class Game:
         ]
         self._timer = self._new_timer(ruleset.initial_duration)
         self.status: Literal["ready", "running", "waiting", "ended", "paused"] = "ready"
-        self._video_consumer = VideoConsumer(
+        # Con l'orologio virtuale i comandi vengono eseguiti subito da chi li invia
+        self._dispatcher = CommandDispatcher(
+            f"GameDispatcher-{table.id}", threaded=not self.clock.virtual
+        )
+        self.transitions = deque(maxlen=self.TRANSITION_HISTORY)
+        self.stale_events = 0
+        # Il contesto di rilevamento non cambia durante la partita: viene compilato una volta sola
+        self._detection_context = VideoConsumer.compile_context(table)
+        # Con VIDEO/DetectorProcess il rilevatore gira in un processo separato, che però usa
+        # sempre il tempo reale
+        consumer_class = (
+            DetectorProcess
+            if detector_process_enabled() and not self.clock.virtual
+            else VideoConsumer
+        )
+        self._video_consumer = consumer_class(
             table=table,
             video_producer=video_producer,
             start_movement_callback=self._start_movement,
             stop_movement_callback=self._stop_movement,
+            detection_context=self._detection_context,
+            clock=self.clock,
         )
         self.last_remaining_time = 0
         self.socketio = socketio
 
+    @property
+    def debug_frames(self):
+        """Canale delle immagini di debug del rilevatore di movimento di questo tavolo."""
+        return self._video_consumer.debug_frames
+
     def _emit_websocket(self, event, body):
         if os.getenv("FLASK_ENV") == "api":
-            self.socketio.emit(event, body)
+            if isinstance(body, dict):
+                body = {**body, "table_id": self.table.id}
+            self.socketio.emit(
+                event,
+                body,
+                to=[self.table_room(self.table.id), self.ALL_TABLES_ROOM],
+            )
+
+    def _submit(self, name, handler, *args) -> Future:
+        """Accoda un comando o un evento per il dispatcher del gioco."""
+        return self._dispatcher.submit(name, handler, *args)
 
-    def start(self):
+    def _set_status(self, status):
+        """Cambia lo stato del gioco e registra la transizione con il comando che l'ha causata."""
+        self.transitions.append(
+            {
+                "timestamp": self.clock.time(),
+                "command": self._dispatcher.current,
+                "from": self.status,
+                "to": status,
+            }
+        )
+        self.status = status
+
+    def get_stats(self):
+        """Statistiche del dispatcher dei comandi (coda e latenze) ed eventi scartati."""
+        return {
+            "dispatcher": self._dispatcher.get_stats(),
+            "stale_events": self.stale_events,
+        }
+
+    """------GAME COMMANDS-----"""
+
+    def start(self) -> Future:
         """Avvia il gioco e inizia il turno per il primo giocatore."""
+        return self._submit("start", self._handle_start)
+
+    def end(self) -> Future:
+        """Ferma il gioco e cancella tutti i timer."""
+        return self._submit("end", self._handle_end)
+
+    def join(self, timeout=None) -> bool:
+        """
+        Attende, dopo end(), che il gioco abbia eseguito i comandi in coda e rilasciato il
+        rilevatore (thread del VideoConsumer o processo del rilevatore).
+
+        Returns:
+            bool: False se timeout è scaduto prima.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+
+        def remaining():
+            return None if deadline is None else max(0.0, deadline - time.monotonic())
+
+        # Il dispatcher termina solo dopo aver eseguito end(), che ferma il rilevatore
+        return self._dispatcher.join(remaining()) and self._video_consumer.join(
+            remaining()
+        )
+
+    def _handle_start(self):
         if self.status == "ready":
-            self.status = "running"
+            self._set_status("running")
             self._video_consumer.start()
             self.start_turn()
             self._emit_websocket("game", "started")
         else:
             return "Game already started."
 
-    def end(self):
-        """Ferma il gioco e cancella tutti i timer."""
+    def _handle_end(self):
         if self.status != "ended":
-            self.resume()  # Importante se viene chiuso mentre è in pausa
+            self._resume_timer()  # Importante se viene chiuso mentre è in pausa
             self._timer.end()
             self._video_consumer.end()
-            self.status = "ended"
+            self._set_status("ended")
             self._emit_websocket("game", "ended")
-            if self._buzzer:
-                self._buzzer.off()
-                self._buzzer.close()
+            # I comandi e gli eventi successivi vengono scartati
+            self._dispatcher.close()
             print("Gioco terminato.")
 
     """------MOVEMENT EVENTS CALLBACKS-----"""
 
-    def _start_movement(self):
+    def _start_movement(self, timestamp=None) -> Future:
+        """
+        Inizio di un tiro: il timer viene fermato all'istante del primo frame in movimento
+        (timestamp, tempo monotono di acquisizione), non al riconoscimento del movimento,
+        che arriva dopo il debounce del rilevatore.
+        """
+        return self._submit("start_movement", self._handle_start_movement, timestamp)
+
+    def _stop_movement(self, timestamp=None) -> Future:
+        """Fine di un tiro: il turno successivo inizia dall'istante in cui le biglie si sono fermate."""
+        return self._submit("stop_movement", self._handle_stop_movement, timestamp)
+
+    def _handle_start_movement(self, timestamp):
         if self.status == "running":
-            self.status = "waiting"
-            remaining_time = self._timer.pause()
-            if os.getenv("FLASK_ENV") == "api":
-                self.socketio.emit(
-                    "timer",
-                    {
-                        "timestamp": time.time(),
-                        "remaining_time": remaining_time,
-                        "status": "paused",
-                    },
-                )
-
-    def _stop_movement(self):
+            self._set_status("waiting")
+            remaining_time = self._timer.pause(at=timestamp)
+            self._emit_websocket(
+                "timer",
+                {
+                    "timestamp": self.clock.time(),
+                    "remaining_time": remaining_time,
+                    "status": "paused",
+                },
+            )
+
+    def _handle_stop_movement(self, timestamp):
         if self.status == "waiting":
-            self.status = "running"
-            self.next_turn()
+            self._set_status("running")
+            self._handle_next_turn(at=timestamp)
 
     """------TURN COMMANDS-----"""
 
-    def increment_time(self, player):
+    def increment_time(self, player) -> Future:
+        """Aggiunge increment_duration secondi al turno, se il giocatore ha ancora incrementi."""
+        return self._submit("increment_time", self._handle_increment_time, player)
+
+    def next_turn(self, at=None) -> Future:
+        """Passa al turno successivo, iniziato all'istante monotono at (Opzionale, ora)."""
+        return self._submit("next_turn", self._handle_next_turn, at)
+
+    def pause(self) -> Future:
+        """
+        Mette in pausa il timer del turno, NON LO TERMINA.
+        Per terminare il timer e passare al successivo utilizzare la funzione end_turn()
+        """
+        return self._submit("pause", self._handle_pause)
+
+    def resume(self) -> Future:
+        """
+        Riprende l'esecuzione del timer, funziona solo se il timer è in pausa, non fa nulla se non lo è
+        """
+        return self._submit("resume", self._handle_resume)
+
+    def end_turn(self) -> Future:
+        """Termina il turno corrente e passa al giocatore successivo."""
+        return self._submit("end_turn", self._handle_end_turn)
+
+    def _handle_increment_time(self, player):
         if self.status == "running":
             if self.increments[player] > 0:
                 self.increments[player] -= 1
@@ -134,105 +275,118 @@ class Game:
             else:
                 return f"Nessun incremento disponibile per il giocatore: {self.player_names[player]}"
 
-    def next_turn(self):
+    def _handle_next_turn(self, at=None):
         if self.status == "running":
             self._timer.end()
             self._timer = self._new_timer(duration=self.ruleset.turn_duration)
-            self.start_turn()
-
-    def start_turn(self):
-        """Inizia il turno per il giocatore corrente e avvia il timer."""
-        self._timer.start()
+            self.start_turn(at=at)
 
-    def pause(self):
+    def start_turn(self, at=None):
         """
-        Mette in pausa il timer del turno, NON LO TERMINA.
-        Per terminare il timer e passare al successivo utilizzare la funzione end_turn()
+        Inizia il turno per il giocatore corrente e avvia il timer.
+
+        Parametri:
+            at (float): Istante monotono in cui è iniziato il turno (Opzionale, ora).
         """
+        self._timer.start(at=at)
+
+    def _handle_pause(self):
         if self.status == "running":
             remaining_time = self._timer.pause()
             self._video_consumer.pause()
-            if os.getenv("FLASK_ENV") == "api":
-                self.socketio.emit(
-                    "timer",
-                    {
-                        "timestamp": time.time(),
-                        "remaining_time": remaining_time,
-                        "status": "paused",
-                    },
-                )
-            self.status = "paused"
-
-    def resume(self):
-        """
-        Riprende l'esecuzione del timer, funziona solo se il timer è in pausa, non fa nulla se non lo è
-        """
+            self._emit_websocket(
+                "timer",
+                {
+                    "timestamp": self.clock.time(),
+                    "remaining_time": remaining_time,
+                    "status": "paused",
+                },
+            )
+            self._set_status("paused")
+
+    def _handle_resume(self):
+        if self.status == "paused":
+            self._resume_timer()
+            # Scaduto mentre il gioco veniva messo in pausa: la scadenza è stata rinviata a ora
+            if self._timer.expired:
+                self._expire_turn()
+
+    def _resume_timer(self):
         if self.status == "paused":
             remaining_time = self._timer.resume()
             self._video_consumer.resume()
-            if os.getenv("FLASK_ENV") == "api":
-                self.socketio.emit(
-                    "timer",
-                    {
-                        "timestamp": time.time(),
-                        "remaining_time": remaining_time,
-                        "status": "running",
-                    },
-                )
-            self.status = "running"
-
-    def end_turn(self):
-        """Termina il turno corrente e passa al giocatore successivo."""
+            self._emit_websocket(
+                "timer",
+                {
+                    "timestamp": self.clock.time(),
+                    "remaining_time": remaining_time,
+                    "status": "running",
+                },
+            )
+            self._set_status("running")
+
+    def _handle_end_turn(self):
         self._timer.end()
-        self.next_turn()
+        self._handle_next_turn()
 
     """------BUZZER / SUONO-----"""
-    TIME_SOUND_BUZZER = 0.5
-    TIME_FINAL_BUZZER = 2.0  # Durata del suono finale (2 secondi)
-
-    def _buzzer(self, duration=TIME_SOUND_BUZZER):
-        if duration:
-            self._buzzer.beep(on_time=duration, off_time=duration, n=1)
 
     def _allarm(self, is_final=False):
-        duration = self.TIME_FINAL_BUZZER if is_final else self.TIME_SOUND_BUZZER
-
-        if self._is_running_rpi:
-            t = threading.Thread(target=self._buzzer, args=(duration))
-            t.start()
-        else:
-            # Quando viene eseguito su Windows
-            import winsound
+        """Allarme del turno, o suono finale alla scadenza: accodato, non attende il suono."""
+        self._sound.play(FINAL if is_final else WARNING)
 
-            winsound.Beep(1000, int(1000 * duration))
+    def _countdown(self, second):
+        """Secondo del countdown finale (5..1)."""
+        self._sound.play(TICK)
 
     """------ TIMER -----"""
 
     def _new_timer(self, duration: int):
-        return Timer(
+        timer = Timer(
             duration=duration,
             allarm_time=self.ruleset.allarm_time,
-            callback=self._time_up,
+            # La scadenza porta con sé il timer scaduto, per riconoscere quelle superate
+            callback=lambda: self._time_up(timer),
             allarm_callback=self._allarm,
+            countdown_callback=self._countdown,
             periodic_callback=self._periodic_callback,
             periodic_time=1,
+            clock=self.clock,
         )
+        return timer
 
-    def _time_up(self):
-        # Metodo chiamato quando il timer raggiunge 0
+    def _time_up(self, timer) -> Future:
+        """Chiamato dal thread del timer quando timer raggiunge 0."""
+        return self._submit("time_up", self._handle_time_up, timer)
+
+    def _handle_time_up(self, timer):
+        # La scadenza arriva in coda: nel frattempo un tiro può aver fermato il timer o iniziato
+        # un nuovo turno, e allora viene scartata
+        if timer is not self._timer or self.status not in ("running", "paused"):
+            self.stale_events += 1
+            logging.info("Scadenza di un turno già terminato scartata")
+            return
+        if self.status == "paused":
+            # Il timer è scaduto mentre il gioco veniva messo in pausa: il turno termina alla
+            # ripresa, in _handle_resume
+            logging.info("Scadenza durante la pausa rinviata alla ripresa")
+            return
+        self._expire_turn()
+
+    def _expire_turn(self):
+        """Tempo del turno scaduto: suono finale e turno successivo."""
         self._allarm(is_final=True)
-        self.next_turn()
+        self._handle_next_turn()
 
     def _periodic_callback(self, remaining_time, is_timer_running):
         self.last_remaining_time = remaining_time
-        if os.getenv("FLASK_ENV") == "api":
-            self.socketio.emit(
-                "timer",
-                {
-                    "timestamp": time.time(),
-                    "remaining_time": remaining_time,
-                    "status": "running" if is_timer_running else "paused",
-                },
-            )
+        self._emit_websocket(
+            "timer",
+            {
+                "timestamp": self.clock.time(),
+                "remaining_time": remaining_time,
+                "status": "running" if is_timer_running else "paused",
+            },
+        )
 
         logging.info(f"Remaining time: {remaining_time}")
@@ -0,0 +1,85 @@
+import time
+
+from device.game.scheduler import TimerScheduler, get_scheduler
+
+
+class Clock:
+    """
+    Orologio del dispositivo: tempo monotono, tempo di sistema, attese e scheduler dei timer.
+
+    Timer, Game e VideoConsumer leggono il tempo solo da un Clock, così nei test e nelle
+    simulazioni possono usare un VirtualClock al posto del tempo reale.
+    """
+
+    virtual = False
+
+    def monotonic(self) -> float:
+        """Istante monotono in secondi, come time.monotonic()."""
+        return time.monotonic()
+
+    def time(self) -> float:
+        """Secondi dall'epoch, come time.time()."""
+        return time.time()
+
+    def sleep(self, seconds):
+        """Attende seconds secondi."""
+        time.sleep(seconds)
+
+    def scheduler(self) -> TimerScheduler:
+        """Scheduler che esegue i timer con questo orologio."""
+        return get_scheduler()
+
+
+class VirtualClock(Clock):
+    """
+    Orologio virtuale: il tempo è fermo finché non viene fatto avanzare con advance() (o
+    sleep()), e avanza istantaneamente.
+
+    Ha un proprio TimerScheduler senza thread: advance() esegue in ordine, nel thread
+    chiamante, le chiamate che scadono nell'intervallo, portando il tempo alla scadenza di
+    ciascuna. Un turno di 35 secondi viene così simulato in pochi microsecondi, con le stesse
+    chiamate e nello stesso ordine del tempo reale, ma senza ritardi.
+
+    Il tempo deve essere fatto avanzare da un solo thread.
+    """
+
+    virtual = True
+
+    def __init__(self, start=0.0, epoch=None):
+        """
+        Parametri:
+            start (float): Istante monotono iniziale.
+            epoch (float): Valore di time() all'istante 0 (Opzionale, ricavato dal tempo reale).
+        """
+        self._now = float(start)
+        self._epoch = time.time() - self._now if epoch is None else epoch
+        self._scheduler = TimerScheduler("VirtualTimerScheduler", clock=self)
+
+    def monotonic(self) -> float:
+        return self._now
+
+    def time(self) -> float:
+        return self._epoch + self._now
+
+    def sleep(self, seconds):
+        self.advance(seconds)
+
+    def scheduler(self) -> TimerScheduler:
+        return self._scheduler
+
+    def advance(self, seconds):
+        """Fa avanzare il tempo di seconds secondi, eseguendo le chiamate che scadono."""
+        self.run_until(self._now + seconds)
+
+    def run_until(self, deadline):
+        """Fa avanzare il tempo fino all'istante deadline, eseguendo le chiamate che scadono."""
+        while True:
+            next_deadline = self._scheduler.next_deadline()
+            if next_deadline is None or next_deadline > deadline:
+                break
+            self._now = max(self._now, next_deadline)
+            self._scheduler.run_due()
+        self._now = max(self._now, deadline)
+
+
+SYSTEM_CLOCK = Clock()
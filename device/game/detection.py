@@ -0,0 +1,556 @@
+import json
+import time
+import cv2
+import numpy as np
+from device.game.motion_engines import MOTION_ENGINES
+from device.table import TablePreset
+
+
+def filter_blobs_contours(
+    combined_mask,
+    min_area_threshold,
+    circularity_threshold,
+    out=None,
+    workspace=None,
+):
+    """
+    Filtra le macchie della maschera per area e circolarità, un contorno alla volta.
+
+    Args:
+        combined_mask (Mat): Maschera binaria delle zone che non hanno il colore del tavolo.
+        min_area_threshold (int): Area minima delle biglie.
+        circularity_threshold (float): Circolarità minima (4*pi*area/perimetro^2).
+        out (Mat): Maschera in cui scrivere il risultato, grande quanto combined_mask (Opzionale).
+        workspace (DetectionWorkspace): Buffer preallocati del rilevatore (Opzionale).
+
+    Returns:
+        Mat: Maschera binaria con le sole macchie accettate.
+    """
+    contours, _ = cv2.findContours(
+        combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+    )
+    if out is None:
+        circularity_mask = np.zeros_like(combined_mask)
+    else:
+        circularity_mask = out
+        circularity_mask.fill(0)
+    for c in contours:
+        area = cv2.contourArea(c)
+        # Controllo sulla dimensione dell'area del contorno
+        if area < min_area_threshold:
+            continue
+        perimeter = cv2.arcLength(c, True)
+        if perimeter == 0:
+            continue
+        circularity = 4 * np.pi * area / (perimeter**2)
+        if circularity > circularity_threshold:
+            cv2.drawContours(circularity_mask, [c], -1, 255, thickness=cv2.FILLED)
+    return circularity_mask
+
+
+def filter_blobs_components(
+    combined_mask,
+    min_area_threshold,
+    circularity_threshold,
+    out=None,
+    workspace=None,
+):
+    """
+    Filtra le macchie della maschera per area e circolarità con operazioni vettoriali.
+
+    Area e rettangolo di ogni macchia arrivano in un'unica chiamata a
+    cv2.connectedComponentsWithStats. Il perimetro è stimato con la formula di Ramanujan
+    per l'ellisse inscritta nel rettangolo: per un'ellisse piena la circolarità stimata
+    coincide con quella reale, mentre le forme irregolari riempiono meno l'ellisse e
+    risultano meno circolari. Le macchie accettate vengono tenute con una sola LUT sulle etichette.
+
+    Con un workspace le etichette vengono scritte nei suoi buffer: restano allocate solo le
+    piccole tabelle con le statistiche di ogni macchia.
+
+    Args e Returns come filter_blobs_contours.
+    """
+    labels_dtype = label_dtype(combined_mask.shape)
+    ltype = cv2.CV_16U if labels_dtype == np.uint16 else cv2.CV_32S
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(
+        combined_mask,
+        labels=workspace.labels if workspace is not None else None,
+        connectivity=8,
+        ltype=ltype,
+    )
+    area = stats[1:, cv2.CC_STAT_AREA].astype(np.float64)
+    a = stats[1:, cv2.CC_STAT_WIDTH] / 2.0
+    b = stats[1:, cv2.CC_STAT_HEIGHT] / 2.0
+    perimeter = np.pi * (3 * (a + b) - np.sqrt((3 * a + b) * (a + 3 * b)))
+    circularity = 4 * np.pi * area / (perimeter**2)
+    keep = (area >= min_area_threshold) & (circularity > circularity_threshold)
+    if not keep.any():
+        if out is None:
+            return np.zeros_like(combined_mask)
+        out.fill(0)
+        return out
+
+    if count <= 256:
+        # Le etichette stanno in 8 bit: si può usare la LUT di OpenCV
+        lut = np.zeros(256, dtype=np.uint8)
+        lut[1:count][keep] = 255
+        if workspace is None:
+            labels8 = labels.astype(np.uint8)
+        else:
+            labels8 = workspace.labels8
+            np.copyto(labels8, labels, casting="unsafe")
+        return cv2.LUT(labels8, lut, dst=out)
+    lut = np.zeros(count, dtype=np.uint8)
+    lut[1:][keep] = 255
+    return np.take(lut, labels, out=out)
+
+
+def label_dtype(shape):
+    """
+    Tipo delle etichette delle macchie per una maschera di dimensioni shape.
+    Con la connettività 8 le etichette sono al più un quarto dei pixel:
+    quando possibile si usano etichette a 16 bit, più veloci da calcolare e da leggere.
+    """
+    return np.uint16 if shape[0] * shape[1] // 4 < 65535 else np.int32
+
+
+# Filtri delle macchie selezionabili per tavolo con TablePreset.detector["blob_filter"]
+BLOB_FILTERS = {
+    "contours": filter_blobs_contours,
+    "components": filter_blobs_components,
+}
+
+
+class DetectionWorkspace:
+    """
+    Immagini intermedie del rilevatore, preallocate una volta per le dimensioni della ROI.
+
+    Le funzioni di OpenCV ricevono questi buffer come dst=, così una volta a regime il ciclo
+    del rilevatore non alloca nuove immagini.
+
+    Attributi:
+        shape (tuple): (altezza, larghezza) della ROI.
+        allocations (int): Numero di immagini allocate dal workspace.
+        reallocations (int): Risultati che OpenCV non ha potuto scrivere nel buffer indicato
+            (dimensioni o tipo non compatibili) e per cui ha allocato una nuova immagine.
+    """
+
+    def __init__(self, shape):
+        height, width = shape
+        self.shape = tuple(shape)
+        self.blurred = np.empty((height, width, 3), dtype=np.uint8)
+        self.hsv = np.empty((height, width, 3), dtype=np.uint8)
+        self.color_mask = np.empty((height, width), dtype=np.uint8)
+        self.dilated_mask = np.empty((height, width), dtype=np.uint8)
+        self.combined_mask = np.empty((height, width), dtype=np.uint8)
+        self.labels = np.empty((height, width), dtype=label_dtype(shape))
+        self.labels8 = np.empty((height, width), dtype=np.uint8)
+        self.balls_mask = np.empty((height, width), dtype=np.uint8)
+        self.allocations = len(self.buffers())
+        self.reallocations = 0
+
+    def buffers(self):
+        """Tutte le immagini preallocate."""
+        return [
+            self.blurred,
+            self.hsv,
+            self.color_mask,
+            self.dilated_mask,
+            self.combined_mask,
+            self.labels,
+            self.labels8,
+            self.balls_mask,
+        ]
+
+    @property
+    def nbytes(self):
+        """Memoria occupata dalle immagini preallocate, in byte."""
+        return sum(buffer.nbytes for buffer in self.buffers())
+
+    def check(self, result, buffer):
+        """Conta come riallocazione un risultato che non è stato scritto in buffer."""
+        if result is not buffer:
+            self.reallocations += 1
+        return result
+
+    def prepare(self, image, blur_kernel):
+        """Sfoca image (la ROI del frame) e la converte in HSV nei buffer del workspace."""
+        self.check(
+            cv2.GaussianBlur(image, blur_kernel, 0, dst=self.blurred), self.blurred
+        )
+        self.check(
+            cv2.cvtColor(self.blurred, cv2.COLOR_BGR2HSV, dst=self.hsv), self.hsv
+        )
+        return self.blurred, self.hsv
+
+
+class PackedMaskHistory:
+    """
+    Anello delle ultime maschere delle biglie, compresse a un bit per pixel.
+
+    Ogni maschera (binaria, grande quanto la ROI) viene impacchettata con np.packbits in parole
+    da 64 bit. Al suo arrivo si calcola una sola differenza, con la maschera precedente, come
+    XOR e conteggio dei bit a 1: le differenze tra le coppie più vecchie restano quelle già
+    calcolate nei frame precedenti.
+
+    Attributi:
+        size (int): Numero di maschere conservate.
+        shape (tuple): (altezza, larghezza) delle maschere, None prima della prima maschera.
+    """
+
+    def __init__(self, size=3):
+        if size < 2:
+            raise ValueError("Servono almeno due maschere per calcolare una differenza")
+        self.size = size
+        self.shape = None
+        self._masks = None
+        self._diffs = None
+        self._diff_counts = [0] * (size - 1)
+        self.clear()
+
+    def clear(self):
+        """Svuota la storia, mantenendo i buffer già allocati."""
+        self._index = 0
+        self._diff_index = 0
+        self._count = 0
+
+    def _allocate(self, shape):
+        words = -(-shape[0] * shape[1] // 64)
+        self.shape = shape
+        self._masks = np.zeros((self.size, words), dtype=np.uint64)
+        self._diffs = np.zeros((self.size - 1, words), dtype=np.uint64)
+        self.clear()
+
+    def add(self, mask):
+        """
+        Aggiunge la maschera corrente e ne conta i pixel diversi dalla precedente.
+        Se cambiano le dimensioni delle maschere (nuova ROI) la storia riparte da capo.
+        """
+        if mask.shape != self.shape:
+            self._allocate(mask.shape)
+        current = self._masks[self._index]
+        packed = np.packbits(mask, axis=None)
+        current.view(np.uint8)[: packed.size] = packed
+        if self._count > 0:
+            previous = self._masks[(self._index - 1) % self.size]
+            diff = self._diffs[self._diff_index]
+            np.bitwise_xor(current, previous, out=diff)
+            self._diff_counts[self._diff_index] = int(np.bitwise_count(diff).sum())
+            self._diff_index = (self._diff_index + 1) % (self.size - 1)
+        self._index = (self._index + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def repeat(self):
+        """
+        Ripete l'ultima maschera, per un frame che ChangeGate ha riconosciuto come invariato:
+        la nuova differenza è zero e non serve impacchettare nulla.
+        """
+        if self._count == 0:
+            raise ValueError("Nessuna maschera da ripetere")
+        np.copyto(self._masks[self._index], self._masks[(self._index - 1) % self.size])
+        self._diffs[self._diff_index].fill(0)
+        self._diff_counts[self._diff_index] = 0
+        self._diff_index = (self._diff_index + 1) % (self.size - 1)
+        self._index = (self._index + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def is_full(self):
+        return self._count == self.size
+
+    def get_len(self):
+        return self._count
+
+    def _diff_slots(self):
+        """Posizioni delle differenze conservate, dalla più vecchia alla più recente."""
+        pairs = max(0, self._count - 1)
+        return [(self._diff_index - pairs + i) % (self.size - 1) for i in range(pairs)]
+
+    def diff_counts(self):
+        """Pixel diversi tra ogni coppia di maschere consecutive conservate, dalla più vecchia."""
+        return [self._diff_counts[slot] for slot in self._diff_slots()]
+
+    def diff_images(self):
+        """Differenze tra le maschere consecutive come immagini 0/255 (solo per debug)."""
+        pixels = self.shape[0] * self.shape[1] if self.shape else 0
+        return [
+            np.unpackbits(self._diffs[slot].view(np.uint8), count=pixels).reshape(
+                self.shape
+            )
+            * np.uint8(255)
+            for slot in self._diff_slots()
+        ]
+
+    @property
+    def nbytes(self):
+        """Memoria occupata dalle maschere e dalle differenze impacchettate, in byte."""
+        if self._masks is None:
+            return 0
+        return self._masks.nbytes + self._diffs.nbytes
+
+
+class ChangeGate:
+    """
+    Prefiltro economico che riconosce i frame invariati prima della pipeline completa.
+
+    Confronta una miniatura in scala di grigi della ROI (ridotta di scale volte per lato) con la
+    miniatura dell'ultimo frame elaborato: se nessun pixel differisce più di threshold livelli
+    di grigio il frame è invariato a meno del rumore, e il rilevatore riusa la maschera
+    precedente. Il confronto è sempre con l'ultimo frame elaborato, non con il precedente,
+    così anche un cambiamento lento prima o poi supera la soglia.
+
+    Attributi:
+        scale (int): Fattore di riduzione della miniatura.
+        threshold (int): Massima differenza di grigio considerata rumore.
+        checked (int): Frame confrontati.
+        skipped (int): Frame riconosciuti come invariati.
+        last_difference (int): Massima differenza dell'ultimo confronto.
+    """
+
+    def __init__(self, scale=8, threshold=6):
+        self.scale = scale
+        self.threshold = threshold
+        self.checked = 0
+        self.skipped = 0
+        self.last_difference = None
+        self._shape = None
+
+    def _allocate(self, shape):
+        height, width = shape
+        self._shape = shape
+        self._gray = np.empty((height * self.scale, width * self.scale), np.uint8)
+        self._thumbnail = np.empty(shape, np.uint8)
+        self._reference = np.empty(shape, np.uint8)
+        self._difference = np.empty(shape, np.uint8)
+        self._has_reference = False
+
+    def reset(self):
+        """Dimentica la miniatura di riferimento: il prossimo frame verrà elaborato."""
+        self._has_reference = False
+
+    def changed(self, image) -> bool:
+        """
+        True se image (ROI BGR del frame) va elaborata, False se è invariata rispetto
+        all'ultimo frame elaborato.
+        """
+        height, width = image.shape[0] // self.scale, image.shape[1] // self.scale
+        if height == 0 or width == 0:
+            return True
+        if self._shape != (height, width):
+            self._allocate((height, width))
+        # Il ritaglio a un multiplo esatto della scala permette a INTER_AREA di usare la
+        # media su blocchi interi, molto più veloce dell'interpolazione generica
+        cv2.cvtColor(
+            image[: height * self.scale, : width * self.scale],
+            cv2.COLOR_BGR2GRAY,
+            dst=self._gray,
+        )
+        cv2.resize(
+            self._gray,
+            (width, height),
+            dst=self._thumbnail,
+            interpolation=cv2.INTER_AREA,
+        )
+        self.checked += 1
+        if self._has_reference:
+            cv2.absdiff(self._thumbnail, self._reference, dst=self._difference)
+            self.last_difference = int(self._difference.max())
+            if self.last_difference <= self.threshold:
+                self.skipped += 1
+                return False
+        self._thumbnail, self._reference = self._reference, self._thumbnail
+        self._has_reference = True
+        return True
+
+    @property
+    def skip_ratio(self):
+        return self.skipped / self.checked if self.checked else 0.0
+
+
+class DetectionContext:
+    """
+    Contesto di rilevamento precompilato per un TablePreset.
+
+    Contiene tutto ciò che non cambia durante una partita: i limiti del colore del tavolo in HSV
+    come array numpy, il kernel della dilatazione e, per una data risoluzione del frame, la ROI
+    del tavolo e la maschera del poligono già rasterizzata.
+    Viene costruito una volta alla creazione del Game e ricostruito solo se cambia il preset
+    (vedi matches()) o la risoluzione del frame (vedi ensure_shape()).
+
+    Attributi:
+        table (TablePreset): Preset da cui è stato compilato il contesto.
+        color_lower (np.ndarray): Limite inferiore HSV del colore del tavolo.
+        color_upper (np.ndarray): Limite superiore HSV del colore del tavolo.
+        dilate_kernel (np.ndarray): Kernel usato per dilatare la maschera di colore.
+        frame_shape (tuple): (altezza, larghezza) del frame per cui sono calcolati ROI e maschera.
+        roi (tuple): (x, y, w, h) del rettangolo che contiene il tavolo.
+        roi_points (np.ndarray): Punti del tavolo in coordinate della ROI.
+        polygon_mask (np.ndarray): Maschera del poligono del tavolo, grande quanto la ROI.
+        preallocate (bool): Se True il rilevatore lavora nei buffer preallocati di workspace
+            (TablePreset.detector["preallocate"]).
+        workspace (DetectionWorkspace): Buffer preallocati per la ROI corrente, None se
+            preallocate è False.
+        gate (ChangeGate): Prefiltro dei frame invariati, None se disattivato con
+            TablePreset.detector["gate"] = false (soglia e scala in "gate_threshold" e "gate_scale").
+        blob_filter_name (str): Nome del filtro delle macchie scelto per il tavolo.
+        filter_blobs (callable): Filtro delle macchie, vedi BLOB_FILTERS.
+        engine_name (str): Motore di rilevamento del movimento scelto per il tavolo
+            (TablePreset.detector["engine"], vedi MOTION_ENGINES).
+        build_time (float): Tempo totale speso per compilare il contesto, in secondi.
+        builds (int): Numero di compilazioni (una iniziale più una per ogni risoluzione del frame).
+        rebuild_time (float): Costo misurato, in secondi, di ricalcolare limiti di colore, punti
+            e maschera del poligono per un frame, come faceva il rilevatore senza contesto.
+    """
+
+    REBUILD_SAMPLES = 5
+
+    def __init__(self, table: TablePreset, hsv_diff):
+        """
+        Compila la parte del contesto che non dipende dalla risoluzione del frame.
+
+        Parametri:
+            table (TablePreset): Preset del tavolo contenente punti, colori e area minima.
+            hsv_diff (tuple): Tolleranza (H, S, V) aggiunta ai colori del tavolo.
+        """
+        start = time.perf_counter()
+        self.table = table
+        self.hsv_diff = tuple(hsv_diff)
+        self._fingerprint = self.fingerprint(table)
+        colors = np.array(table.colors, dtype=np.float64).reshape((-1, 3))
+        self.color_lower = colors.min(axis=0) - self.hsv_diff
+        self.color_upper = colors.max(axis=0) + self.hsv_diff
+        self.dilate_kernel = np.ones((3, 3), dtype=np.uint8)
+        self.min_area_threshold = table.min_area_threshold
+        self.blob_filter_name = table.detector.get("blob_filter", "contours")
+        if self.blob_filter_name not in BLOB_FILTERS:
+            raise ValueError(
+                f"Filtro delle macchie sconosciuto: {self.blob_filter_name}"
+            )
+        self.filter_blobs = BLOB_FILTERS[self.blob_filter_name]
+        self.engine_name = table.detector.get("engine", "color")
+        if self.engine_name not in MOTION_ENGINES:
+            raise ValueError(f"Motore di rilevamento sconosciuto: {self.engine_name}")
+        self.preallocate = bool(table.detector.get("preallocate", False))
+        self.gate = (
+            ChangeGate(
+                scale=int(table.detector.get("gate_scale", 8)),
+                threshold=int(table.detector.get("gate_threshold", 6)),
+            )
+            if table.detector.get("gate", True)
+            else None
+        )
+        self.workspace = None
+        self.frame_shape = None
+        self.roi = None
+        self.roi_points = None
+        self.polygon_mask = None
+        self.rebuild_time = 0.0
+        self.build_time = time.perf_counter() - start
+        self.builds = 1
+
+    @staticmethod
+    def fingerprint(table: TablePreset):
+        """Valori del preset da cui dipende il contesto, per riconoscere un preset modificato."""
+        return (
+            tuple(map(tuple, table.points)),
+            tuple(map(tuple, table.colors)),
+            table.min_area_threshold,
+            json.dumps(table.detector, sort_keys=True),
+        )
+
+    def matches(self, table: TablePreset) -> bool:
+        """True se il contesto è stato compilato da un preset equivalente a table."""
+        return self._fingerprint == self.fingerprint(table)
+
+    def ensure_shape(self, frame_shape):
+        """
+        Calcola ROI e maschera del poligono per la risoluzione frame_shape = (altezza, larghezza).
+        Non fa nulla se sono già state calcolate per la stessa risoluzione.
+        """
+        if frame_shape == self.frame_shape:
+            return
+        start = time.perf_counter()
+        height, width = frame_shape
+        points = np.array(self.table.points, dtype=np.int32).reshape((-1, 2))
+        x0, y0 = np.clip(points.min(axis=0), 0, (width - 1, height - 1))
+        x1, y1 = np.clip(points.max(axis=0) + 1, 1, (width, height))
+        self.frame_shape = frame_shape
+        self.roi = (int(x0), int(y0), int(x1 - x0), int(y1 - y0))
+        self.roi_points = (points - (x0, y0)).reshape((-1, 1, 2)).astype(np.int32)
+        self.polygon_mask = cv2.fillPoly(
+            np.zeros((self.roi[3], self.roi[2]), dtype=np.uint8),
+            [self.roi_points],
+            255,
+        )
+        if self.preallocate:
+            self.workspace = DetectionWorkspace((self.roi[3], self.roi[2]))
+        self.build_time += time.perf_counter() - start
+        self.builds += 1
+        self.rebuild_time = self._measure_rebuild()
+
+    def _measure_rebuild(self):
+        """
+        Misura il lavoro che il contesto evita ad ogni frame: limiti di colore, punti e maschera
+        del poligono della ROI ricalcolati da capo. Restituisce il tempo minimo di
+        REBUILD_SAMPLES ripetizioni, in secondi.
+        """
+        colors = self.table.colors
+        samples = []
+        for _ in range(self.REBUILD_SAMPLES):
+            start = time.perf_counter()
+            tuple(
+                min(color[i] for color in colors) - diff
+                for i, diff in enumerate(self.hsv_diff)
+            )
+            tuple(
+                max(color[i] for color in colors) + diff
+                for i, diff in enumerate(self.hsv_diff)
+            )
+            cv2.fillPoly(
+                np.zeros((self.roi[3], self.roi[2]), dtype=np.uint8),
+                [np.array(self.roi_points, dtype=np.int32).reshape((-1, 1, 2))],
+                255,
+            )
+            samples.append(time.perf_counter() - start)
+        return min(samples)
+
+    def foreground_mask(self, hsv, workspace: DetectionWorkspace | None = None):
+        """
+        Maschera delle zone del tavolo che non hanno il colore del panno (biglie, mani, stecca...).
+
+        Args:
+            hsv (Mat): ROI del frame in formato HSV.
+            workspace (DetectionWorkspace): Buffer in cui scrivere le maschere intermedie
+                (Opzionale, senza workspace ogni passo alloca una nuova immagine).
+        """
+        if workspace is None:
+            # Crea la maschera di colore e la inverte
+            color_mask = cv2.inRange(hsv, self.color_lower, self.color_upper)
+            color_mask = cv2.dilate(color_mask, self.dilate_kernel, iterations=2)
+            color_mask = cv2.bitwise_not(color_mask)
+
+            # Combina la maschera di colore con quella del tavolo
+            return cv2.bitwise_and(color_mask, self.polygon_mask)
+
+        # Stessi passi, scrivendo nei buffer del workspace (l'inversione è fatta sul posto)
+        ws = workspace
+        ws.check(
+            cv2.inRange(hsv, self.color_lower, self.color_upper, dst=ws.color_mask),
+            ws.color_mask,
+        )
+        ws.check(
+            cv2.dilate(
+                ws.color_mask, self.dilate_kernel, dst=ws.dilated_mask, iterations=2
+            ),
+            ws.dilated_mask,
+        )
+        ws.check(cv2.bitwise_not(ws.dilated_mask, dst=ws.dilated_mask), ws.dilated_mask)
+        return ws.check(
+            cv2.bitwise_and(ws.dilated_mask, self.polygon_mask, dst=ws.combined_mask),
+            ws.combined_mask,
+        )
+
+    def to_frame_coordinates(self, roi_image):
+        """Riporta un'immagine della ROI nelle coordinate dell'intero frame (solo per debug)."""
+        x, y, w, h = self.roi
+        image = np.zeros(self.frame_shape + roi_image.shape[2:], dtype=roi_image.dtype)
+        image[y : y + h, x : x + w] = roi_image
+        return image
@@ -0,0 +1,150 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from device.game.detection import (
+    BLOB_FILTERS,
+    ChangeGate,
+    DetectionContext,
+    DetectionWorkspace,
+    PackedMaskHistory,
+)
+from device.table import TablePreset
+
+
+class DetectionContextTest(unittest.TestCase):
+    def setUp(self):
+        self.table = TablePreset(
+            id=0,
+            name="test_table_preset",
+            points=[(120, 80), (520, 80), (520, 280), (120, 280)],
+            colors=[(100, 200, 150), (104, 180, 170)],
+            min_area_threshold=50,
+        )
+        self.context = DetectionContext(self.table, (5, 10, 5))
+
+    def test_color_bounds(self):
+        np.testing.assert_array_equal(self.context.color_lower, (95, 170, 145))
+        np.testing.assert_array_equal(self.context.color_upper, (109, 210, 175))
+
+    def test_roi_and_polygon_mask(self):
+        self.context.ensure_shape((360, 640))
+        self.assertEqual(self.context.roi, (120, 80, 401, 201))
+        self.assertEqual(self.context.polygon_mask.shape, (201, 401))
+        self.assertTrue((self.context.polygon_mask == 255).all())
+
+    def test_measures_per_frame_rebuild(self):
+        self.assertEqual(self.context.rebuild_time, 0.0)
+        self.context.ensure_shape((360, 640))
+        self.assertGreater(self.context.rebuild_time, 0.0)
+
+    def test_roi_clipped_to_frame(self):
+        self.context.ensure_shape((240, 480))
+        self.assertEqual(self.context.roi, (120, 80, 360, 160))
+
+    def test_matches_changed_preset(self):
+        self.assertTrue(self.context.matches(self.table))
+        self.table.min_area_threshold = 60
+        self.assertFalse(self.context.matches(self.table))
+
+    def test_workspace_matches_allocating_pipeline(self):
+        self.table.detector = {"preallocate": True}
+        context = DetectionContext(self.table, (5, 10, 5))
+        context.ensure_shape((360, 640))
+        workspace = context.workspace
+        self.assertIsInstance(workspace, DetectionWorkspace)
+        self.assertEqual(workspace.shape, (201, 401))
+
+        rng = np.random.default_rng(0)
+        hsv = np.full((201, 401, 3), (102, 190, 160), dtype=np.uint8)
+        hsv[rng.random((201, 401)) < 0.01] = (0, 0, 0)
+        cv2.circle(hsv, (200, 100), 15, (0, 0, 0), thickness=cv2.FILLED)
+        for name, filter_blobs in BLOB_FILTERS.items():
+            with self.subTest(filter=name):
+                expected = filter_blobs(context.foreground_mask(hsv), 50, 0.7)
+                out = workspace.balls_mask
+                combined = context.foreground_mask(hsv, workspace)
+                result = filter_blobs(combined, 50, 0.7, out=out, workspace=workspace)
+                self.assertIs(combined, workspace.combined_mask)
+                self.assertIs(result, out)
+                np.testing.assert_array_equal(result, expected)
+        self.assertEqual(workspace.reallocations, 0)
+
+
+class BlobFiltersTest(unittest.TestCase):
+    def test_keep_balls_and_reject_lines(self):
+        mask = np.zeros((200, 300), dtype=np.uint8)
+        cv2.circle(mask, (60, 60), 12, 255, thickness=cv2.FILLED)
+        cv2.line(mask, (150, 20), (280, 40), 255, thickness=3)
+        cv2.circle(mask, (250, 150), 2, 255, thickness=cv2.FILLED)
+        ball = np.zeros_like(mask)
+        cv2.circle(ball, (60, 60), 12, 255, thickness=cv2.FILLED)
+        for name, filter_blobs in BLOB_FILTERS.items():
+            with self.subTest(filter=name):
+                result = filter_blobs(mask, 50, 0.7)
+                np.testing.assert_array_equal(result, ball)
+
+
+class PackedMaskHistoryTest(unittest.TestCase):
+    def test_diff_counts_match_absdiff(self):
+        rng = np.random.default_rng(0)
+        masks = [
+            np.where(rng.random((37, 53)) < 0.2, 255, 0).astype(np.uint8)
+            for _ in range(5)
+        ]
+        history = PackedMaskHistory(3)
+        for i, mask in enumerate(masks):
+            history.add(mask)
+            expected = [
+                cv2.countNonZero(cv2.absdiff(masks[j], masks[j - 1]))
+                for j in range(max(1, i - 1), i + 1)
+            ]
+            self.assertEqual(history.diff_counts(), expected)
+        self.assertTrue(history.is_full())
+        np.testing.assert_array_equal(
+            history.diff_images()[-1], cv2.absdiff(masks[4], masks[3])
+        )
+
+    def test_clear_and_new_shape(self):
+        history = PackedMaskHistory(3)
+        history.add(np.zeros((10, 10), dtype=np.uint8))
+        history.add(np.full((10, 10), 255, dtype=np.uint8))
+        self.assertEqual(history.diff_counts(), [100])
+        history.clear()
+        self.assertEqual(history.get_len(), 0)
+        history.add(np.full((10, 10), 255, dtype=np.uint8))
+        history.add(np.zeros((12, 10), dtype=np.uint8))
+        self.assertEqual(history.get_len(), 1)
+        self.assertEqual(history.diff_counts(), [])
+
+    def test_repeat_adds_zero_difference(self):
+        history = PackedMaskHistory(3)
+        history.add(np.zeros((10, 10), dtype=np.uint8))
+        history.add(np.full((10, 10), 255, dtype=np.uint8))
+        history.repeat()
+        self.assertTrue(history.is_full())
+        self.assertEqual(history.diff_counts(), [100, 0])
+        history.add(np.zeros((10, 10), dtype=np.uint8))
+        self.assertEqual(history.diff_counts(), [0, 100])
+
+
+class ChangeGateTest(unittest.TestCase):
+    def test_skips_noise_and_detects_ball(self):
+        rng = np.random.default_rng(0)
+        image = np.full((160, 240, 3), 90, dtype=np.uint8)
+        gate = ChangeGate(scale=8, threshold=6)
+        self.assertTrue(gate.changed(image))
+        noisy = cv2.add(image, rng.integers(0, 4, image.shape, dtype=np.uint8))
+        self.assertFalse(gate.changed(noisy))
+        moved = image.copy()
+        cv2.circle(moved, (120, 80), 10, (255, 255, 255), -1)
+        self.assertTrue(gate.changed(moved))
+        self.assertFalse(gate.changed(moved))
+        self.assertEqual((gate.checked, gate.skipped), (4, 2))
+        gate.reset()
+        self.assertTrue(gate.changed(moved))
+
+
+if __name__ == "__main__":
+    unittest.main()
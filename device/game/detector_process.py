@@ -0,0 +1,465 @@
+"""
+Esecuzione del rilevatore di movimento in un processo separato.
+
+VideoConsumer, VideoProducer, lo stream MJPEG e il server Flask-SocketIO condividono lo stesso
+GIL: quando uno spettatore apre lo stream il rilevatore rallenta. DetectorProcess ha la stessa
+interfaccia di VideoConsumer ma esegue la pipeline in un processo figlio, che può avere un core
+dedicato (config VIDEO/DetectorCpu).
+
+I frame passano al processo figlio attraverso un anello di slot in multiprocessing.shared_memory:
+sulla pipe viaggiano solo numero di sequenza, istante di acquisizione, slot e formato. Il figlio
+restituisce lo slot quando ha finito di leggerlo e invia sulla stessa pipe gli eventi di inizio
+e fine movimento, con il loro istante di acquisizione, che vengono passati ai callback del Game.
+
+Classi:
+    SharedFrameRing
+    SharedFrameSource
+    DetectorProcess
+Funzioni:
+    detector_process_enabled() -> bool
+"""
+
+import logging
+import multiprocessing
+import os
+import threading
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from device.config import get_config
+from device.debug_frames import DebugFrames
+from device.game.detection import DetectionContext
+from device.game.video_consumer import VideoConsumer
+from device.table import TablePreset
+from device.video_producer import Frame, VideoProducer
+
+
+def detector_process_enabled() -> bool:
+    """True se il rilevatore deve girare in un processo separato (config VIDEO/DetectorProcess)."""
+    return get_config().getboolean("VIDEO", "DetectorProcess", fallback=False)
+
+
+class SharedFrameRing:
+    """
+    Anello di slot in memoria condivisa, ognuno grande abbastanza per un frame.
+    Il processo principale crea i blocchi (e li rimuove con close()), il processo del
+    rilevatore vi si collega per nome.
+    """
+
+    def __init__(self, slots, slot_size, names=None):
+        """
+        Parametri:
+            slots (int): Numero di slot.
+            slot_size (int): Dimensione di ogni slot in byte.
+            names (list of str): Nomi dei blocchi a cui collegarsi, None per crearne di nuovi.
+        """
+        self.owner = names is None
+        self.slot_size = slot_size
+        self._blocks = [
+            shared_memory.SharedMemory(
+                name=None if self.owner else names[slot],
+                create=self.owner,
+                size=slot_size,
+            )
+            for slot in range(slots)
+        ]
+
+    @property
+    def names(self):
+        return [block.name for block in self._blocks]
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def view(self, slot, shape, dtype):
+        """Immagine di forma shape contenuta nello slot, senza copia."""
+        return np.ndarray(shape, dtype=dtype, buffer=self._blocks[slot].buf)
+
+    def close(self):
+        """Chiude i blocchi e, nel processo che li ha creati, li rimuove."""
+        for block in self._blocks:
+            try:
+                block.close()
+            except BufferError:
+                # Qualche frame fa ancora riferimento al blocco: verrà chiuso all'uscita
+                continue
+            if self.owner:
+                block.unlink()
+
+
+class SharedFrameSource:
+    """
+    Sorgente dei frame nel processo del rilevatore.
+    Ha la stessa interfaccia di attesa del VideoProducer (wait_for_frame(), is_opened()), così il
+    VideoConsumer la usa senza modifiche. I frame sono viste degli slot dell'anello: quando
+    l'ultimo riferimento viene rilasciato lo slot torna al processo principale.
+    """
+
+    def __init__(self, release_slot):
+        """
+        Parametri:
+            release_slot (callable): Chiamata con (generazione, slot) quando uno slot è libero.
+        """
+        self._release_slot = release_slot
+        self._rings = {}  # Generazione -> SharedFrameRing
+        self._slots = {}  # Numero di sequenza -> (generazione, slot)
+        self._latest_frame = None
+        self._frame_condition = threading.Condition()
+        self._refs_lock = threading.Lock()
+        self.is_running = True
+
+    def attach(self, generation, names, slot_size):
+        """Si collega a un nuovo anello (il primo, o uno più grande dopo un cambio di risoluzione)."""
+        # Gli anelli precedenti restano aperti: frame ancora in uso possono puntare ai loro slot
+        self._rings[generation] = SharedFrameRing(len(names), slot_size, names=names)
+
+    def publish(self, generation, slot, seq, timestamp, shape, dtype):
+        """Pubblica il frame appena copiato nello slot e sveglia il VideoConsumer."""
+        image = self._rings[generation].view(slot, shape, dtype)
+        with self._refs_lock:
+            self._slots[seq] = (generation, slot)
+        frame = Frame(seq, timestamp, image, pool=self)
+        with self._frame_condition:
+            previous, self._latest_frame = self._latest_frame, frame
+            self._frame_condition.notify_all()
+        if previous is not None:
+            previous.release()
+
+    def _retain(self, frame):
+        with self._refs_lock:
+            frame._refs += 1
+
+    def _release(self, frame):
+        with self._refs_lock:
+            if frame._refs <= 0:
+                return
+            frame._refs -= 1
+            if frame._refs > 0:
+                return
+            frame._buffer = None
+            generation, slot = self._slots.pop(frame.seq)
+        self._release_slot(generation, slot)
+
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        """Come VideoProducer.wait_for_frame()."""
+        with self._frame_condition:
+            self._frame_condition.wait_for(
+                lambda: not self.is_running
+                or (
+                    self._latest_frame is not None
+                    and self._latest_frame.seq > after_seq
+                ),
+                timeout=timeout,
+            )
+            latest = self._latest_frame
+            if latest is None or latest.seq <= after_seq:
+                return None
+            return latest.retain()
+
+    def is_opened(self):
+        return self.is_running
+
+    def stop(self):
+        with self._frame_condition:
+            self.is_running = False
+            self._frame_condition.notify_all()
+        for ring in self._rings.values():
+            ring.close()
+
+
+def _run_detector(conn, table: TablePreset, cpu=None):
+    """
+    Corpo del processo del rilevatore: esegue un VideoConsumer headless sui frame ricevuti
+    e inoltra sulla pipe gli eventi di movimento e gli slot liberati.
+    """
+    if cpu is not None and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, {cpu})
+    send_lock = threading.Lock()
+
+    def send(message):
+        with send_lock:
+            try:
+                conn.send(message)
+            except (BrokenPipeError, OSError):
+                pass  # Il processo principale ha già chiuso la pipe
+
+    source = SharedFrameSource(
+        lambda generation, slot: send(("release", generation, slot))
+    )
+    consumer = VideoConsumer(
+        table=table,
+        # Il tempo monotono è lo stesso per tutti i processi: gli istanti restano validi
+        start_movement_callback=lambda timestamp: send(("start", timestamp)),
+        stop_movement_callback=lambda timestamp: send(("stop", timestamp)),
+        video_producer=source,
+        headless=True,
+    )
+    try:
+        while True:
+            message = conn.recv()
+            command = message[0]
+            if command == "frame":
+                source.publish(*message[1:])
+            elif command == "ring":
+                source.attach(*message[1:])
+            elif command == "start":
+                consumer.start()
+            elif command == "pause":
+                consumer.pause()
+            elif command == "table":
+                consumer.set_table(message[1])
+            elif command == "stats":
+                send(("stats", consumer.get_stats()))
+            elif command == "end":
+                break
+    except (EOFError, OSError):
+        pass  # Il processo principale è terminato
+    finally:
+        consumer.end()
+        consumer.join(timeout=2)
+        source.stop()
+        conn.close()
+
+
+def _plain_table(table) -> TablePreset:
+    """Copia del preset come TablePreset semplice, da inviare al processo del rilevatore."""
+    return TablePreset(
+        id=table.id,
+        name=table.name,
+        points=[tuple(point) for point in table.points],
+        colors=[tuple(color) for color in table.colors],
+        min_area_threshold=table.min_area_threshold,
+        detector=dict(getattr(table, "detector", None) or {}),
+    )
+
+
+class DetectorProcess:
+    """
+    VideoConsumer eseguito in un processo separato.
+
+    Ha la stessa interfaccia di VideoConsumer (start, pause, resume, end, set_table, get_stats)
+    e chiama i callback di movimento dal thread che ascolta la pipe. Un thread di alimentazione
+    copia ogni nuovo frame del VideoProducer in uno slot libero dell'anello condiviso; se il
+    rilevatore li sta ancora usando tutti il frame viene scartato (frames_dropped), così il
+    rilevatore lavora sempre sul frame più recente.
+
+    Le immagini di debug restano nel processo del rilevatore: debug_frames non riceve immagini.
+    """
+
+    SLOTS = 3
+    FRAME_TIMEOUT = VideoConsumer.FRAME_TIMEOUT
+
+    def __init__(
+        self,
+        table: TablePreset,
+        start_movement_callback,
+        stop_movement_callback,
+        video_producer: VideoProducer,
+        detection_context: DetectionContext | None = None,
+        headless: bool | None = None,
+        clock=None,
+    ):
+        """
+        Avvia il processo del rilevatore.
+
+        Args:
+            come VideoConsumer. Il contesto di rilevamento viene compilato nel processo figlio,
+            detection_context, headless (il figlio è sempre headless) e clock (il figlio usa
+            sempre il tempo reale) sono accettati solo per compatibilità.
+        """
+        self.table = table
+        self.start_movement_callback = start_movement_callback
+        self.stop_movement_callback = stop_movement_callback
+        self._video_producer = video_producer
+        self.headless = True
+        self.debug_frames = DebugFrames()
+
+        self._ring = None
+        self._generation = 0
+        self._free_slots = []
+        self._slots_lock = threading.Lock()
+        self._send_lock = threading.Lock()
+        self._is_running = threading.Event()
+        self._end_event = threading.Event()
+        self._stats = None
+        self._stats_event = threading.Event()
+        self._shutdown_thread = None
+        self.frames_sent = 0
+        self.frames_dropped = 0
+
+        cpu = get_config().get("VIDEO", "DetectorCpu", fallback="").strip()
+        context = multiprocessing.get_context("spawn")
+        self._conn, child_conn = context.Pipe()
+        self._process = context.Process(
+            target=_run_detector,
+            args=(child_conn, _plain_table(table), int(cpu) if cpu else None),
+            name="DetectorProcess",
+            daemon=True,
+        )
+        self._process.start()
+        child_conn.close()
+
+        self._listener_thread = threading.Thread(
+            target=self._listen, name="DetectorListenerThread", daemon=True
+        )
+        self._listener_thread.start()
+        self._feeder_thread = threading.Thread(
+            target=self._feed, name="DetectorFeederThread", daemon=True
+        )
+        self._feeder_thread.start()
+
+    def _send(self, message):
+        with self._send_lock:
+            try:
+                self._conn.send(message)
+            except (BrokenPipeError, OSError):
+                logging.error("Processo del rilevatore non raggiungibile")
+
+    def _listen(self):
+        """Riceve dal processo del rilevatore gli slot liberati e gli eventi di movimento."""
+        while True:
+            try:
+                message = self._conn.recv()
+            except (EOFError, OSError):
+                break
+            event = message[0]
+            if event == "release":
+                with self._slots_lock:
+                    if message[1] == self._generation:
+                        self._free_slots.append(message[2])
+            elif event == "start":
+                self.start_movement_callback(message[1])
+            elif event == "stop":
+                self.stop_movement_callback(message[1])
+            elif event == "stats":
+                self._stats = message[1]
+                self._stats_event.set()
+
+    def _acquire_slot(self, nbytes):
+        """
+        Slot libero per un frame di nbytes byte, None se sono tutti in uso.
+        Crea l'anello al primo frame e lo ricrea se i frame diventano più grandi degli slot.
+        """
+        with self._slots_lock:
+            if self._ring is None or nbytes > self._ring.slot_size:
+                old_ring = self._ring
+                self._ring = SharedFrameRing(self.SLOTS, nbytes)
+                self._generation += 1
+                self._free_slots = list(range(self.SLOTS))
+                self._send(
+                    ("ring", self._generation, self._ring.names, self._ring.slot_size)
+                )
+                if old_ring is not None:
+                    # Il processo del rilevatore resta collegato ai vecchi blocchi finché li usa
+                    old_ring.close()
+            if not self._free_slots:
+                return None
+            return self._free_slots.pop(0)
+
+    def _feed(self):
+        """Copia i nuovi frame del VideoProducer negli slot condivisi mentre il rilevatore è attivo."""
+        last_seq = 0
+        while not self._end_event.is_set() and self._video_producer.is_opened():
+            if not self._is_running.wait(timeout=self.FRAME_TIMEOUT):
+                continue
+            frame = self._video_producer.wait_for_frame(
+                after_seq=last_seq, timeout=self.FRAME_TIMEOUT
+            )
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            with frame:
+                image = frame.image
+                slot = self._acquire_slot(image.nbytes)
+                if slot is None:
+                    self.frames_dropped += 1
+                    continue
+                np.copyto(self._ring.view(slot, image.shape, image.dtype), image)
+            self._send(
+                (
+                    "frame",
+                    self._generation,
+                    slot,
+                    frame.seq,
+                    frame.timestamp,
+                    image.shape,
+                    image.dtype.str,
+                )
+            )
+            self.frames_sent += 1
+
+    def start(self):
+        """Avvia il ciclo di elaborazione del video."""
+        self._is_running.set()
+        self._send(("start",))
+
+    def pause(self):
+        """Pausa il ciclo di elaborazione e resetta le cronologie."""
+        self._is_running.clear()
+        self._send(("pause",))
+
+    def resume(self):
+        """Riprende il ciclo di elaborazione dopo una pausa."""
+        self.start()
+
+    def set_table(self, table: TablePreset):
+        """Aggiorna il preset del tavolo nel processo del rilevatore."""
+        self.table = table
+        self._send(("table", _plain_table(table)))
+
+    def get_stats(self, timeout=1.0):
+        """Statistiche del VideoConsumer nel processo figlio e dello scambio dei frame."""
+        self._stats_event.clear()
+        self._send(("stats",))
+        self._stats_event.wait(timeout)
+        with self._slots_lock:
+            free_slots = len(self._free_slots)
+        return {
+            **(self._stats or {}),
+            "pid": self._process.pid,
+            "frames_sent": self.frames_sent,
+            "frames_dropped": self.frames_dropped,
+            "shared_slots": self.SLOTS,
+            "free_slots": free_slots,
+        }
+
+    def end(self):
+        """
+        Termina il rilevatore senza attendere: il processo viene fermato e la memoria condivisa
+        rimossa da un thread di chiusura, di cui join() attende la fine.
+        """
+        if self._end_event.is_set():
+            return
+        self._end_event.set()
+        self._is_running.set()  # Sblocca il thread di alimentazione
+        self._shutdown_thread = threading.Thread(
+            target=self._shutdown, name="DetectorShutdownThread", daemon=True
+        )
+        self._shutdown_thread.start()
+
+    def join(self, timeout=None) -> bool:
+        """
+        Attende, dopo end(), la fine del processo del rilevatore.
+
+        Returns:
+            bool: False se timeout è scaduto prima.
+        """
+        thread = self._shutdown_thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    def _shutdown(self):
+        """Ferma il thread di alimentazione e il processo, poi rimuove la memoria condivisa."""
+        self._feeder_thread.join(timeout=2)
+        self._send(("end",))
+        self._process.join(timeout=3)
+        if self._process.is_alive():
+            self._process.terminate()
+        self._conn.close()
+        with self._slots_lock:
+            if self._ring is not None:
+                self._ring.close()
+                self._ring = None
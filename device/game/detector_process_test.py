@@ -0,0 +1,82 @@
+import time
+import unittest
+
+import numpy as np
+
+from device.game.detector_process import (
+    DetectorProcess,
+    SharedFrameRing,
+    SharedFrameSource,
+)
+from device.table import TablePreset
+from device.video_producer import get_producer, remove_producer
+
+
+class SharedFrameSourceTest(unittest.TestCase):
+    def setUp(self):
+        self.ring = SharedFrameRing(2, 4 * 6 * 3)
+        self.released = []
+        self.source = SharedFrameSource(
+            lambda generation, slot: self.released.append((generation, slot))
+        )
+        self.source.attach(1, self.ring.names, self.ring.slot_size)
+
+    def tearDown(self):
+        self.source.stop()
+        self.ring.close()
+
+    def publish(self, slot, seq, value):
+        self.ring.view(slot, (4, 6, 3), np.uint8)[:] = value
+        self.source.publish(1, slot, seq, 0.0, (4, 6, 3), "|u1")
+
+    def test_frames_share_slot_memory(self):
+        self.publish(0, 1, 7)
+        with self.source.wait_for_frame(after_seq=0, timeout=1) as frame:
+            self.assertEqual(frame.seq, 1)
+            self.assertTrue((frame.image == 7).all())
+            self.assertFalse(frame.image.flags.writeable)
+        self.assertIsNone(self.source.wait_for_frame(after_seq=1, timeout=0.05))
+
+    def test_slot_released_after_last_reference(self):
+        self.publish(0, 1, 1)
+        frame = self.source.wait_for_frame(after_seq=0, timeout=1)
+        self.publish(1, 2, 2)
+        self.assertEqual(self.released, [])
+        frame.release()
+        self.assertEqual(self.released, [(1, 0)])
+
+
+class DetectorProcessTest(unittest.TestCase):
+    def test_frames_reach_detector_process(self):
+        image = np.zeros((360, 640, 3), dtype=np.uint8)
+        producer = get_producer("test_detector_process", frame=image)
+        table = TablePreset(
+            id=0,
+            name="test_table_preset",
+            points=[(120, 80), (520, 80), (520, 280), (120, 280)],
+            colors=[(100, 200, 150)],
+            min_area_threshold=50,
+        )
+        detector = DetectorProcess(
+            table, lambda timestamp: None, lambda timestamp: None, producer
+        )
+        try:
+            detector.start()
+            deadline = time.monotonic() + 20
+            while time.monotonic() < deadline:
+                producer._publish(image.copy())
+                time.sleep(0.05)
+                stats = detector.get_stats()
+                if stats.get("frames", 0) >= 3:
+                    break
+            self.assertGreaterEqual(stats["frames"], 3)
+            self.assertGreater(stats["frames_sent"], 0)
+        finally:
+            detector.end()
+            self.assertTrue(detector.join(10))
+            remove_producer("test_detector_process")
+        self.assertEqual(detector._process.exitcode, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,177 @@
+import logging
+import time
+from collections import Counter, deque
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+
+class CommandDispatcher:
+    """
+    Esegue i comandi di un oggetto uno alla volta, nell'ordine di arrivo (modello ad attori).
+
+    Chi invia un comando con submit() riceve subito un Future con il risultato (o l'eccezione)
+    del comando, senza attenderne l'esecuzione. I comandi possono arrivare da qualsiasi thread:
+    lo stato dell'oggetto viene modificato solo da chi li esegue, quindi non servono lock.
+
+    Con threaded=True i comandi vengono eseguiti dal thread del dispatcher. Con threaded=False
+    (usato con l'orologio virtuale) vengono eseguiti subito dal thread che li invia; un comando
+    inviato durante l'esecuzione di un altro viene eseguito appena questo termina, dallo stesso
+    thread. In entrambi i casi un comando non deve attendere il Future di un comando successivo.
+
+    Dopo close() i nuovi comandi non vengono eseguiti e il loro Future restituisce None; quelli
+    già in coda vengono eseguiti comunque.
+    """
+
+    def __init__(self, name, threaded=True):
+        """
+        Parametri:
+            name (str): Nome del dispatcher e del suo thread.
+            threaded (bool): Se False i comandi vengono eseguiti dal thread che li invia.
+        """
+        self.name = name
+        self.threaded = threaded
+        self._queue = deque()  # (nome, funzione, argomenti, Future, istante di invio)
+        self._condition = Condition()
+        self._closed = False
+        # Con threaded=False, True mentre un thread esegue i comandi in coda
+        self._draining = False
+        self._thread = None
+        self.current = None  # Nome del comando in esecuzione
+        self.submitted = 0
+        self.executed = 0
+        self.rejected = 0
+        self.errors = 0
+        self.max_depth = 0
+        self._wait_total = 0.0
+        self.max_wait = 0.0
+        self._run_total = 0.0
+        self.max_run = 0.0
+        self.commands = Counter()
+
+    def submit(self, name, function, *args) -> Future:
+        """
+        Accoda il comando function(*args).
+
+        Args:
+            name (str): Nome del comando, per le statistiche e le transizioni.
+
+        Returns:
+            Future: Risultato del comando.
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                self.rejected += 1
+                future.set_result(None)
+                return future
+            self._queue.append((name, function, args, future, time.perf_counter()))
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, len(self._queue))
+            if self.threaded:
+                if self._thread is None:
+                    self._thread = Thread(target=self._run, name=self.name)
+                    # Non deve impedire la chiusura del processo se il gioco non viene terminato
+                    self._thread.daemon = True
+                    self._thread.start()
+                else:
+                    self._condition.notify()
+                return future
+            if self._draining:
+                return future
+            self._draining = True
+        self._drain()
+        return future
+
+    def close(self):
+        """Non accetta più comandi; il thread termina dopo aver eseguito quelli in coda."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+
+    def join(self, timeout=None) -> bool:
+        """
+        Attende la fine del thread del dispatcher, dopo close().
+
+        Returns:
+            bool: False se timeout è scaduto prima.
+        """
+        thread = self._thread
+        if thread is None:
+            return True
+        thread.join(timeout)
+        return not thread.is_alive()
+
+    @property
+    def depth(self) -> int:
+        """Comandi in coda, non ancora eseguiti."""
+        with self._condition:
+            return len(self._queue)
+
+    def get_stats(self):
+        """
+        Contatori dei comandi e loro tempi, in millisecondi: attesa in coda (dall'invio
+        all'esecuzione) e durata dell'esecuzione.
+        """
+        with self._condition:
+            executed = self.executed
+            return {
+                "depth": len(self._queue),
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "executed": executed,
+                "rejected": self.rejected,
+                "errors": self.errors,
+                "avg_wait_ms": self._wait_total * 1000 / executed if executed else 0.0,
+                "max_wait_ms": self.max_wait * 1000,
+                "avg_run_ms": self._run_total * 1000 / executed if executed else 0.0,
+                "max_run_ms": self.max_run * 1000,
+                "commands": dict(self.commands),
+            }
+
+    def _drain(self):
+        """Esegue i comandi in coda nel thread chiamante (threaded=False)."""
+        while True:
+            with self._condition:
+                if not self._queue:
+                    self._draining = False
+                    return
+                command = self._queue.popleft()
+            self._execute(command)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._queue and not self._closed:
+                    self._condition.wait()
+                if not self._queue:
+                    return
+                command = self._queue.popleft()
+            self._execute(command)
+
+    def _execute(self, command):
+        name, function, args, future, submitted_at = command
+        started = time.perf_counter()
+        if not future.set_running_or_notify_cancel():
+            return
+        self.current = name
+        result = error = None
+        try:
+            result = function(*args)
+        except Exception as e:
+            logging.exception(f"Errore nel comando {name} di {self.name}")
+            error = e
+        self.current = None
+        elapsed = time.perf_counter() - started
+        # Statistiche aggiornate prima del Future: chi lo attende le trova già aggiornate
+        with self._condition:
+            self.executed += 1
+            self.errors += error is not None
+            self.commands[name] += 1
+            self._wait_total += started - submitted_at
+            self.max_wait = max(self.max_wait, started - submitted_at)
+            self._run_total += elapsed
+            self.max_run = max(self.max_run, elapsed)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
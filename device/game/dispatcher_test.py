@@ -0,0 +1,77 @@
+import threading
+import unittest
+
+from device.game.dispatcher import CommandDispatcher
+
+
+class CommandDispatcherTest(unittest.TestCase):
+    def test_commands_run_in_order_on_one_thread(self):
+        dispatcher = CommandDispatcher("DispatcherTest")
+        executed = []
+        threads_seen = set()
+
+        def command(sender, index):
+            threads_seen.add(threading.current_thread().name)
+            executed.append((sender, index))
+            return index
+
+        def send(sender):
+            for index in range(200):
+                dispatcher.submit("command", command, sender, index)
+
+        senders = [threading.Thread(target=send, args=(sender,)) for sender in range(4)]
+        for thread in senders:
+            thread.start()
+        for thread in senders:
+            thread.join()
+        last = dispatcher.submit("command", command, "main", 0)
+        self.assertEqual(last.result(timeout=5), 0)
+        dispatcher.close()
+        dispatcher.join(timeout=5)
+
+        self.assertEqual(threads_seen, {"DispatcherTest"})
+        self.assertEqual(len(executed), 801)
+        for sender in range(4):
+            indexes = [index for name, index in executed if name == sender]
+            self.assertEqual(indexes, list(range(200)))
+        stats = dispatcher.get_stats()
+        self.assertEqual(stats["executed"], 801)
+        self.assertEqual(stats["depth"], 0)
+        self.assertGreaterEqual(stats["max_depth"], 1)
+        self.assertEqual(stats["commands"], {"command": 801})
+
+    def test_future_carries_result_and_errors(self):
+        dispatcher = CommandDispatcher("DispatcherTest")
+
+        def fail():
+            raise ValueError("comando fallito")
+
+        with self.assertLogs(level="ERROR"):
+            failed = dispatcher.submit("fail", fail)
+            with self.assertRaises(ValueError):
+                failed.result(timeout=5)
+        self.assertEqual(dispatcher.submit("sum", sum, [1, 2]).result(timeout=5), 3)
+        self.assertEqual(dispatcher.get_stats()["errors"], 1)
+        dispatcher.close()
+        dispatcher.join(timeout=5)
+        # Dopo close() i comandi vengono scartati
+        self.assertIsNone(dispatcher.submit("sum", sum, [1, 2]).result(timeout=0))
+        self.assertEqual(dispatcher.get_stats()["rejected"], 1)
+
+    def test_inline_dispatch_runs_nested_commands_after_current(self):
+        dispatcher = CommandDispatcher("DispatcherTest", threaded=False)
+        executed = []
+
+        def outer():
+            nested = dispatcher.submit("inner", executed.append, "inner")
+            executed.append("outer")
+            self.assertFalse(nested.done())
+
+        future = dispatcher.submit("outer", outer)
+        self.assertTrue(future.done())
+        self.assertEqual(executed, ["outer", "inner"])
+        self.assertIsNone(dispatcher._thread)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,96 @@
+import time
+
+from device.config import get_config
+
+
+class AdaptiveFrameRate:
+    """
+    Frequenza adattiva del rilevatore di movimento.
+
+    Finché c'è attività (movimento rilevato o biglie in moto) il rilevatore lavora alla frequenza
+    massima, così la fine del movimento viene riconosciuta il prima possibile. Quando il tavolo
+    resta fermo (il giocatore sta mirando) la frequenza rimane massima per hold secondi e poi
+    scende linearmente fino alla minima in ramp_down secondi, risparmiando CPU.
+    Alla prima attività torna subito alla frequenza massima.
+
+    I valori predefiniti si leggono dalla sezione VIDEO della configurazione:
+    DetectorMinFps, DetectorMaxFps, DetectorHold, DetectorRampDown.
+
+    Attributi:
+        min_fps (float): Frequenza minima, a tavolo fermo.
+        max_fps (float): Frequenza massima, durante il movimento.
+        hold (float): Secondi a frequenza massima dopo l'ultima attività.
+        ramp_down (float): Secondi per scendere dalla frequenza massima alla minima.
+        target_fps (float): Frequenza scelta per il prossimo frame.
+        effective_fps (float): Frequenza effettiva dei frame elaborati (media mobile esponenziale).
+    """
+
+    SMOOTHING = 0.2  # Peso dell'ultimo intervallo nella media di effective_fps
+
+    def __init__(self, min_fps=None, max_fps=None, hold=None, ramp_down=None):
+        config = get_config()
+        if min_fps is None:
+            min_fps = config.getfloat("VIDEO", "DetectorMinFps", fallback=3.0)
+        if max_fps is None:
+            max_fps = config.getfloat("VIDEO", "DetectorMaxFps", fallback=30.0)
+        if hold is None:
+            hold = config.getfloat("VIDEO", "DetectorHold", fallback=1.0)
+        if ramp_down is None:
+            ramp_down = config.getfloat("VIDEO", "DetectorRampDown", fallback=2.0)
+        if not 0 < min_fps <= max_fps:
+            raise ValueError("Serve 0 < min_fps <= max_fps")
+        self.min_fps = min_fps
+        self.max_fps = max_fps
+        self.hold = hold
+        self.ramp_down = ramp_down
+        self.target_fps = max_fps
+        self.effective_fps = 0.0
+        self._last_activity = time.monotonic()
+        self._last_frame = None
+
+    def boost(self, now=None):
+        """Torna subito alla frequenza massima (es. all'avvio o alla ripresa del gioco)."""
+        self._last_activity = time.monotonic() if now is None else now
+        self.target_fps = self.max_fps
+
+    def update(self, active: bool, now=None) -> float:
+        """
+        Aggiorna la frequenza in base all'attività dell'ultimo frame e la restituisce.
+
+        Args:
+            active (bool): True se nell'ultimo frame c'è stato movimento o le biglie sono in moto.
+        """
+        now = time.monotonic() if now is None else now
+        if active:
+            self._last_activity = now
+        idle = now - self._last_activity - self.hold
+        if idle <= 0:
+            self.target_fps = self.max_fps
+        elif idle >= self.ramp_down:
+            self.target_fps = self.min_fps
+        else:
+            fraction = idle / self.ramp_down
+            self.target_fps = self.max_fps + (self.min_fps - self.max_fps) * fraction
+        return self.target_fps
+
+    def frame_started(self, now=None):
+        """Registra l'inizio dell'elaborazione di un frame e aggiorna effective_fps."""
+        now = time.monotonic() if now is None else now
+        if self._last_frame is not None and now > self._last_frame:
+            fps = 1 / (now - self._last_frame)
+            if self.effective_fps == 0.0:
+                self.effective_fps = fps
+            else:
+                self.effective_fps += self.SMOOTHING * (fps - self.effective_fps)
+        self._last_frame = now
+
+    def delay(self, now=None) -> float:
+        """Secondi da attendere prima del prossimo frame per rispettare target_fps."""
+        if self._last_frame is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._last_frame + 1 / self.target_fps - now)
+
+    def reset_timing(self):
+        """Dimentica l'ultimo frame (dopo una pausa) per non contarne l'attesa in effective_fps."""
+        self._last_frame = None
@@ -0,0 +1,36 @@
+import unittest
+
+from device.game.frame_rate import AdaptiveFrameRate
+
+
+class AdaptiveFrameRateTest(unittest.TestCase):
+    def setUp(self):
+        self.rate = AdaptiveFrameRate(min_fps=3, max_fps=30, hold=1.0, ramp_down=2.0)
+        self.rate.boost(now=100.0)
+
+    def test_ramp_down_when_idle(self):
+        self.assertEqual(self.rate.update(False, now=100.5), 30)
+        self.assertAlmostEqual(self.rate.update(False, now=102.0), 16.5)
+        self.assertEqual(self.rate.update(False, now=103.5), 3)
+
+    def test_activity_restores_max_rate(self):
+        self.rate.update(False, now=110.0)
+        self.assertEqual(self.rate.target_fps, 3)
+        self.assertEqual(self.rate.update(True, now=110.1), 30)
+
+    def test_delay_and_effective_fps(self):
+        self.assertEqual(self.rate.delay(now=100.0), 0.0)
+        self.rate.frame_started(now=100.0)
+        self.assertAlmostEqual(self.rate.delay(now=100.01), 1 / 30 - 0.01)
+        self.rate.frame_started(now=100.1)
+        self.assertAlmostEqual(self.rate.effective_fps, 10)
+        self.rate.reset_timing()
+        self.assertEqual(self.rate.delay(now=200.0), 0.0)
+
+    def test_invalid_limits(self):
+        with self.assertRaises(ValueError):
+            AdaptiveFrameRate(min_fps=10, max_fps=5)
+
+
+if __name__ == "__main__":
+    unittest.main()
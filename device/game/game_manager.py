@@ -1,63 +1,124 @@
 """
 Il modulo `game_manager` fornisce i metodi essenziali per la gestione base del gioco di biliardo.
-Il suo scopo è limitato a ottenere il riferimento al gioco corrente, creare un nuovo gioco o terminare quello esistente.
+Il suo scopo è limitato a ottenere il riferimento ai giochi in corso, creare un nuovo gioco o terminare quelli esistenti.
+Un dispositivo può gestire più tavoli contemporaneamente: ogni gioco è associato a un TablePreset
+(identificato dal suo id) e alla telecamera che inquadra quel tavolo.
 
 Classi:
     Nessuna
 Funzioni:
-    get_game() -> Game:
-    new_game(ruleset: Ruleset, player1_name: str, player2_name: str) -> Game:
-    end_game() -> None:
+    get_game(table_id: int | None = None) -> Game:
+    get_games() -> dict[int, Game]:
+    new_game(ruleset: Ruleset, table: TablePreset, player1_name: str, player2_name: str, socketio, video_source=None) -> Game:
+    end_game(table_id: int | None = None) -> None:
 Variabili:
-    _game: Game
-        Variabile globale che mantiene il riferimento al gioco attualmente in esecuzione.
+    _games: dict[int, Game]
+        Variabile globale che mantiene i riferimenti ai giochi in esecuzione, indicizzati per id del tavolo.
+    _ending: dict[int, Game]
+        Giochi terminati che potrebbero non aver ancora rilasciato il rilevatore, indicizzati per id del tavolo.
 """
 
+import threading
+
 from .ruleset import Ruleset
 from . import Game
 from device.table import TablePreset
-from device.video_producer import VideoProducer
+from device.video_producer import get_producer
+
+_games: dict[int, Game] = {}
+_ending: dict[int, Game] = {}
+_games_lock = threading.Lock()
 
-_game: Game | None = None
+# Secondi di attesa della chiusura di un gioco (comandi in coda, thread e processo del rilevatore)
+SHUTDOWN_TIMEOUT = 8.0
 
 
-def get_game() -> Game:
+def get_game(table_id: int | None = None) -> Game:
     """
-    Restituisce il gioco attualmente in esecuzione.
+    Restituisce il gioco in esecuzione sul tavolo indicato.
+    Se table_id è None restituisce l'ultimo gioco creato.
     Se non c'è alcun gioco in esecuzione, restituisce None.
     """
-    return _game
+    with _games_lock:
+        if table_id is None:
+            return next(reversed(_games.values()), None)
+        return _games.get(table_id)
+
+
+def get_games() -> dict[int, Game]:
+    """
+    Restituisce una copia dei giochi in esecuzione, indicizzati per id del tavolo.
+    """
+    with _games_lock:
+        return dict(_games)
 
 
 def new_game(
-    ruleset: Ruleset, table: TablePreset, player1_name: str, player2_name, socketio
+    ruleset: Ruleset,
+    table: TablePreset,
+    player1_name: str,
+    player2_name,
+    socketio,
+    video_source=None,
 ) -> Game:
     """
-    Crea un nuovo gioco con le regole specificate e i nomi dei giocatori.
-    Se esiste già un gioco in corso, lo termina e ne crea uno nuovo.
+    Crea un nuovo gioco sul tavolo indicato con le regole specificate e i nomi dei giocatori.
+    Se esiste già un gioco in corso sullo stesso tavolo, lo termina e ne crea uno nuovo. Prima
+    attende che il gioco precedente del tavolo abbia rilasciato il rilevatore, al massimo
+    SHUTDOWN_TIMEOUT secondi: oltre solleva TimeoutError e non crea il gioco.
+    I giochi sugli altri tavoli non vengono toccati.
+    Il gioco usa il VideoProducer della sorgente video_source (None per la sorgente predefinita).
     """
-    global _game
-    if _game is not None:
-        _game.end()
-    _game = Game(
+    with _games_lock:
+        old_game = _games.pop(table.id, None)
+        if old_game is not None:
+            _ending[table.id] = old_game
+    if old_game is not None:
+        old_game.end()
+    _wait_shutdown(table.id, SHUTDOWN_TIMEOUT)
+    game = Game(
         ruleset=ruleset,
         table=table,
         player1_name=player1_name,
         player2_name=player2_name,
-        video_producer=VideoProducer.get_instance(),
+        video_producer=get_producer(video_source),
         socketio=socketio,
     )
-    socketio.emit("game", "created")
-    return _game
+    with _games_lock:
+        _games[table.id] = game
+    game._emit_websocket("game", "created")
+    return game
 
 
-def end_game():
+def end_game(table_id: int | None = None):
     """
-    Termina il gioco attualmente in esecuzione.
+    Termina il gioco in esecuzione sul tavolo indicato (l'ultimo creato se table_id è None).
+    Il gioco viene terminato dal suo dispatcher: la funzione non ne attende la fine, che viene
+    attesa dal prossimo new_game() sullo stesso tavolo.
     """
-    global _game
-    if _game is not None:
-        _game.end()
-        _game = None
+    with _games_lock:
+        if table_id is None:
+            table_id = next(reversed(_games.keys()), None)
+        game = _games.pop(table_id, None)
+        if game is not None:
+            _ending[table_id] = game
+    if game is not None:
+        game.end()
     else:
         return "No game in progress"
+
+
+def _wait_shutdown(table_id: int, timeout: float):
+    """
+    Attende che il gioco terminato sul tavolo table_id, se c'è, abbia rilasciato il rilevatore.
+    Solleva TimeoutError se non termina entro timeout secondi: resta tra quelli in chiusura.
+    """
+    with _games_lock:
+        game = _ending.get(table_id)
+    if game is None:
+        return
+    if not game.join(timeout):
+        raise TimeoutError(f"Il gioco precedente sul tavolo {table_id} non è terminato")
+    with _games_lock:
+        if _ending.get(table_id) is game:
+            del _ending[table_id]
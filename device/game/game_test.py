@@ -1,18 +1,37 @@
 import unittest
 
-from device.game import Game, game_manager
+import numpy as np
+
+from device.config import get_config
+from device.game import game_manager
+from device.game.clock import VirtualClock
 from device.game.ruleset import Ruleset
+from device.game.timer import Timer
+from device.simulation import SIMULATION_TABLE, SimulatedGame, stopped_producer
+from device.video_producer import get_producer
 
-TEST_RULESET = Ruleset(0, "test_ruleset", 60, 35, 25, 1)
+TEST_RULESET = Ruleset(0, "test_ruleset", 60, 35, 10, 25, 1)
 
 
 class GameTest(unittest.TestCase):
     """
-    Classe che viene utilizzata per unit testing
+    Classe che viene utilizzata per unit testing.
+    Il gioco usa un orologio virtuale: il tempo avanza solo con clock.advance().
     """
 
     def setUp(self):
-        self.game = Game(TEST_RULESET, "Giovanni", "Paolo")
+        self.clock = VirtualClock()
+        self.game = SimulatedGame(
+            TEST_RULESET,
+            SIMULATION_TABLE,
+            "Giovanni",
+            "Paolo",
+            stopped_producer(),
+            clock=self.clock,
+        )
+
+    def tearDown(self):
+        self.game.end()
 
     def test_game_creation(self):
         self.assertEqual(
@@ -22,12 +41,117 @@ class GameTest(unittest.TestCase):
     def test_timer_init(self):
         self.assertEqual(
             self.game._timer.remaining_time,
-            TEST_RULESET.turn_duration,
-            "Alla creazione del gioco, la durata del timer non corrisponde alla durata impostata nel ruleset",
+            TEST_RULESET.initial_duration,
+            "Alla creazione del gioco, la durata del timer non corrisponde alla durata iniziale del ruleset",
+        )
+
+    def test_shot_starts_next_turn(self):
+        self.game.start()
+        self.clock.advance(Timer.START_DELAY + 10)
+        # Movimento riconosciuto con mezzo secondo di ritardo: il timer si ferma prima
+        self.game._start_movement(self.clock.monotonic() - 0.5)
+        self.assertEqual(self.game.status, "waiting")
+        self.clock.advance(5)
+        self.assertEqual(self.game._timer.remaining_time, 50.5)
+        self.game._stop_movement(self.clock.monotonic())
+        self.assertEqual(self.game.status, "running")
+        self.assertEqual(self.game._timer.remaining_time, TEST_RULESET.turn_duration)
+
+    def test_time_up_starts_next_turn(self):
+        self.game.start()
+        self.clock.advance(Timer.START_DELAY + TEST_RULESET.initial_duration)
+        self.assertEqual(self.game.expiries, [62])
+        self.assertEqual(self.game.status, "running")
+        self.clock.advance(Timer.START_DELAY + 5)
+        self.assertEqual(
+            self.game._timer.remaining_time, TEST_RULESET.turn_duration - 5
+        )
+
+    def test_stale_expiry_is_discarded(self):
+        self.game.start()
+        self.clock.advance(Timer.START_DELAY + 10)
+        timer = self.game._timer
+        self.game._start_movement(self.clock.monotonic())
+        # Scadenza arrivata in coda dopo l'inizio del tiro
+        self.game._time_up(timer)
+        self.assertEqual(self.game.stale_events, 1)
+        self.assertEqual(self.game.status, "waiting")
+        self.assertIs(self.game._timer, timer)
+        self.assertEqual(
+            [
+                (transition["command"], transition["to"])
+                for transition in self.game.transitions
+            ],
+            [("start", "running"), ("start_movement", "waiting")],
+        )
+
+    def test_expiry_while_pausing_ends_turn_on_resume(self):
+        # La scadenza viene trattenuta per arrivare in coda dopo la pausa
+        expired = []
+        self.game._time_up = expired.append
+        self.game.start()
+        self.clock.advance(Timer.START_DELAY + TEST_RULESET.initial_duration)
+        self.game.pause()
+        self.assertEqual(self.game.status, "paused")
+        del self.game._time_up
+        self.game._time_up(expired[0])
+        self.assertEqual(self.game.stale_events, 0)
+        self.assertEqual(self.game.expiries, [])
+        self.clock.advance(30)
+        self.game.resume()
+        self.assertEqual(self.game.status, "running")
+        self.assertEqual(self.game.expiries, [92])
+        self.assertIsNot(self.game._timer, expired[0])
+        self.assertEqual(self.game._timer.remaining_time, TEST_RULESET.turn_duration)
+        self.clock.advance(Timer.START_DELAY + TEST_RULESET.turn_duration)
+        self.assertEqual(self.game.expiries, [92, 129])
+
+    def test_pause_and_increment(self):
+        self.game.start()
+        self.clock.advance(Timer.START_DELAY + 20)
+        self.game.pause()
+        self.assertEqual(self.game.status, "paused")
+        self.clock.advance(600)
+        self.game.resume()
+        self.assertEqual(self.game._timer.remaining_time, 40)
+        self.assertIsNone(self.game.increment_time(0).result())
+        self.assertEqual(self.game._timer.remaining_time, 65)
+        self.assertIsNotNone(self.game.increment_time(0).result())
+
+
+class GameManagerTest(unittest.TestCase):
+    VIDEO_SOURCE = "game_test"
+
+    @classmethod
+    def setUpClass(cls):
+        # Il rilevatore elabora davvero i frame: senza finestre di debug
+        cls.headless = get_config()["VIDEO"].get("Headless")
+        get_config()["VIDEO"]["Headless"] = "true"
+        cls.producer = get_producer(
+            cls.VIDEO_SOURCE, frame=np.zeros((36, 64, 3), np.uint8)
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        game_manager.end_game(SIMULATION_TABLE.id)
+        cls.producer.stop()
+        if cls.headless is None:
+            get_config()["VIDEO"].pop("Headless")
+        else:
+            get_config()["VIDEO"]["Headless"] = cls.headless
+
+    def new_game(self, player2_name="Paolo"):
+        return game_manager.new_game(
+            TEST_RULESET,
+            SIMULATION_TABLE,
+            "Giovanni",
+            player2_name,
+            socketio=None,
+            video_source=self.VIDEO_SOURCE,
         )
 
     def test_game_manager_new_game(self):
-        game = game_manager.new_game(TEST_RULESET, "Giovanni", "Paolo")
+        game = self.new_game()
         self.assertEqual(
             game,
             game_manager.get_game(),
@@ -35,14 +159,23 @@ class GameTest(unittest.TestCase):
         )
 
     def test_game_manager_new_game_replace_old_game(self):
-        game = game_manager.new_game(TEST_RULESET, "Giovanni", "Paolo")
-        game2 = game_manager.new_game(TEST_RULESET, "Giovanni", "Marco")
+        game = self.new_game()
+        game2 = self.new_game("Marco")
         self.assertEqual(
             game2,
             game_manager.get_game(),
             "Il gioco creato non corrisponde al gioco attuale",
         )
-        self.assertEqual(game._status, "ended", "Il gioco vecchio non è terminato")
+        self.assertEqual(game.status, "ended", "Il gioco vecchio non è terminato")
+
+    def test_new_game_waits_for_ended_game(self):
+        game = self.new_game()
+        game_manager.end_game(SIMULATION_TABLE.id)
+        self.assertIsNone(game_manager.get_game(SIMULATION_TABLE.id))
+        self.new_game("Marco")
+        self.assertEqual(game.status, "ended")
+        self.assertFalse(game._video_consumer._thread.is_alive())
+        self.assertNotIn(SIMULATION_TABLE.id, game_manager._ending)
 
 
 if __name__ == "__main__":
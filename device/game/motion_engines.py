@@ -0,0 +1,430 @@
+"""
+Motori di rilevamento del movimento selezionabili per tavolo con TablePreset.detector["engine"].
+
+Ogni motore trasforma i frame in un punteggio di movimento, confrontato con la propria soglia:
+VideoConsumer si occupa del resto (prefiltro dei frame invariati, debounce, callback).
+L'elaborazione di un frame è divisa in due fasi: read_frame() copia dal frame ciò che serve
+finché il buffer di acquisizione è trattenuto, motion_score() lavora solo sulle copie.
+
+Motori disponibili (vedi MOTION_ENGINES):
+    color: segmentazione del colore del panno, maschere delle biglie e differenza tra 3 frame
+        (il comportamento storico del rilevatore).
+    mog2, knn: sottrazione dello sfondo di OpenCV sulla ROI del tavolo, ridotta di bg_scale.
+    flow: flusso ottico sparso (Lucas-Kanade) sui centroidi delle biglie, che vengono rilevati
+        con la maschera del motore color solo ogni flow_redetect frame.
+"""
+
+from abc import ABC, abstractmethod
+
+import cv2
+import numpy as np
+
+from device.video_producer import Frame
+
+
+def mask_centroids(mask):
+    """Centroidi (x, y) delle macchie di una maschera binaria, forma (N, 2)."""
+    _, _, _, centroids = cv2.connectedComponentsWithStats(mask, connectivity=8)
+    return centroids[1:]
+
+
+class MotionEngine(ABC):
+    """
+    Interfaccia comune dei motori di rilevamento del movimento.
+    Un motore che non implementa i metodi astratti fallisce già alla creazione.
+
+    Attributi:
+        name (str): Nome del motore in MOTION_ENGINES.
+        context (DetectionContext): Contesto per cui è stato creato il motore.
+        preview (Mat): Ultima immagine elaborata, su cui il rilevatore disegna lo stato.
+        frames (int): Frame elaborati (esclusi quelli saltati dal prefiltro).
+        total_time (float): Tempo totale speso nel motore, in secondi.
+        last_time (float): Tempo speso nel motore per l'ultimo frame, in secondi.
+    """
+
+    name = None
+
+    def __init__(self, consumer, context):
+        """
+        Args:
+            consumer (VideoConsumer): Rilevatore che usa il motore (soglie e immagini di debug).
+            context (DetectionContext): Contesto compilato per il tavolo.
+        """
+        self.consumer = consumer
+        self.context = context
+        self.options = context.table.detector
+        self.preview = None
+        self._last_raw_score = None
+        self.frames = 0
+        self.total_time = 0.0
+        self.last_time = 0.0
+
+    @property
+    @abstractmethod
+    def ready(self) -> bool:
+        """True se il motore ha già elaborato un frame a cui riferire i frame invariati."""
+
+    @abstractmethod
+    def reset(self):
+        """Dimentica i frame precedenti (dopo una pausa)."""
+
+    @abstractmethod
+    def read_frame(self, frame: Frame, context):
+        """Copia dal frame ciò che serve al motore. Chiamato con il frame ancora trattenuto."""
+
+    @abstractmethod
+    def motion_score(self, context, frame_interval=None):
+        """
+        Punteggio di movimento dell'ultimo frame letto con read_frame().
+
+        Returns:
+            float: Punteggio da confrontare con threshold(), None se servono altri frame.
+        """
+
+    def unchanged(self):
+        """Punteggio per un frame che il prefiltro ha riconosciuto come invariato."""
+        return self._combine(0.0)
+
+    def _combine(self, raw_score):
+        """
+        Punteggio del frame come massimo tra raw_score e il punteggio grezzo del frame precedente,
+        come la differenza tra 3 frame del motore color: un singolo frame ripetuto dalla
+        sorgente (o saltato dal prefiltro) non interrompe un movimento.
+        """
+        previous, self._last_raw_score = self._last_raw_score, raw_score
+        if raw_score is None or previous is None:
+            return raw_score
+        return max(raw_score, previous)
+
+    @abstractmethod
+    def threshold(self, frame_interval=None):
+        """Punteggio oltre cui un frame è considerato in movimento."""
+
+    def centroids(self):
+        """
+        Centroidi (x, y) delle biglie nell'ultimo frame, in coordinate della ROI, per il
+        tracciamento (BallTracker). None se il motore non rileva le singole biglie.
+        """
+        return None
+
+    def record(self, elapsed):
+        """Registra il tempo speso nel motore per un frame."""
+        self.frames += 1
+        self.total_time += elapsed
+        self.last_time = elapsed
+
+    @property
+    def avg_ms(self):
+        return self.total_time * 1000 / self.frames if self.frames else 0.0
+
+
+class ColorMaskEngine(MotionEngine):
+    """
+    Motore storico: maschera di ciò che non ha il colore del panno, filtrata per area e
+    circolarità, e pixel diversi tra le maschere degli ultimi 3 frame (PackedMaskHistory
+    del rilevatore). Il punteggio è la massima delle due differenze.
+    """
+
+    name = "color"
+
+    def __init__(self, consumer, context):
+        super().__init__(consumer, context)
+        self.history = consumer._balls_mask_history
+        self._blurred = None
+        self._hsv = None
+        self._mask = None
+        self._centroids = None
+
+    @property
+    def ready(self):
+        return self.history.get_len() > 0
+
+    def reset(self):
+        self.history.clear()
+        self._mask = None
+        self._centroids = None
+
+    def read_frame(self, frame, context):
+        workspace = context.workspace
+        if workspace is not None:
+            self._blurred, self._hsv = workspace.prepare(
+                frame.crop(context.roi), Frame.BLUR_KERNEL
+            )
+        else:
+            # Le immagini derivate sono condivise con gli altri consumatori dello
+            # stesso frame e non dipendono dal buffer di acquisizione, che può
+            # essere rilasciato subito
+            self._blurred = frame.blurred(context.roi)
+            self._hsv = frame.hsv(context.roi)
+
+    def motion_score(self, context, frame_interval=None):
+        self.consumer._show_blurred_image(self._blurred)
+        self._mask = self.consumer._create_mask(self._hsv, context)
+        self._centroids = None
+        self.history.add(self._mask)
+        self.preview = self._blurred
+        return self._history_score()
+
+    def unchanged(self):
+        # Si riusa la maschera precedente (nuova differenza nulla)
+        self.history.repeat()
+        return self._history_score()
+
+    def _history_score(self):
+        if not self.history.is_full():
+            return None
+        self.consumer._show_difference_frames(self.history)
+        return max(self.history.diff_counts())
+
+    def threshold(self, frame_interval=None):
+        return self.consumer.motion_threshold(frame_interval)
+
+    def centroids(self):
+        # Calcolati solo se richiesti, dalla maschera dell'ultimo frame elaborato (un frame
+        # invariato ha le stesse biglie del precedente)
+        if self._centroids is None and self._mask is not None:
+            self._centroids = mask_centroids(self._mask)
+        return self._centroids
+
+
+class BackgroundSubtractorEngine(MotionEngine):
+    """
+    Sottrazione dello sfondo di OpenCV sulla ROI del tavolo ridotta di bg_scale per lato.
+
+    Il punteggio è l'area in primo piano dentro il poligono del tavolo, ripulita dai pixel
+    isolati e riportata alla scala del frame. Una biglia ferma entra nello sfondo in circa
+    bg_history frame; la soglia predefinita è l'area minima di una biglia
+    (engine_threshold per cambiarla).
+    Ombre disattivate: sul panno illuminato dall'alto generano solo rumore.
+    I primi WARMUP frame servono solo a imparare lo sfondo e non hanno un punteggio.
+    """
+
+    HISTORY = 300  # Frame per cui un oggetto fermo resta in primo piano
+    WARMUP = 30  # Frame elaborati prima del primo punteggio
+    SCALE = 2  # Riduzione per lato della ROI prima della sottrazione
+
+    def __init__(self, consumer, context):
+        super().__init__(consumer, context)
+        self.scale = max(1, int(self.options.get("bg_scale", self.SCALE)))
+        self.bg_history = int(self.options.get("bg_history", self.HISTORY))
+        self._subtractor = None
+        self._learned = 0
+        self._polygon_source = None
+        self._small = None
+        self._kernel = np.ones((3, 3), dtype=np.uint8)
+
+    @abstractmethod
+    def _create_subtractor(self):
+        """Sottrattore di sfondo di OpenCV usato dal motore."""
+
+    @property
+    def ready(self):
+        return self._subtractor is not None
+
+    def reset(self):
+        self._subtractor = None
+        self._learned = 0
+        self._last_raw_score = None
+
+    def _allocate(self, context, shape):
+        height, width = shape
+        self._polygon_source = context.polygon_mask
+        self._polygon = cv2.resize(
+            context.polygon_mask[: height * self.scale, : width * self.scale],
+            (width, height),
+            interpolation=cv2.INTER_NEAREST,
+        )
+        self._small = np.empty((height, width, 3), dtype=np.uint8)
+        self._foreground = np.empty((height, width), dtype=np.uint8)
+        self._cleaned = np.empty((height, width), dtype=np.uint8)
+        self._subtractor = None
+
+    def read_frame(self, frame, context):
+        roi = frame.crop(context.roi)
+        height, width = roi.shape[0] // self.scale, roi.shape[1] // self.scale
+        if (
+            self._polygon_source is not context.polygon_mask
+            or self._small is None
+            or self._small.shape[:2] != (height, width)
+        ):
+            self._allocate(context, (height, width))
+        if self.scale == 1:
+            np.copyto(self._small, roi)
+        else:
+            # Ritaglio a un multiplo esatto della scala, come in ChangeGate
+            cv2.resize(
+                roi[: height * self.scale, : width * self.scale],
+                (width, height),
+                dst=self._small,
+                interpolation=cv2.INTER_AREA,
+            )
+
+    def motion_score(self, context, frame_interval=None):
+        if self._subtractor is None:
+            self._subtractor = self._create_subtractor()
+            self._learned = 0
+        self._subtractor.apply(self._small, fgmask=self._foreground)
+        cv2.bitwise_and(self._foreground, self._polygon, dst=self._foreground)
+        cv2.morphologyEx(
+            self._foreground, cv2.MORPH_OPEN, self._kernel, dst=self._cleaned
+        )
+        self.preview = self._small
+        if self.consumer._debugging():
+            self.consumer._debug_output("Foreground", self._cleaned)
+        self._learned += 1
+        if self._learned <= self.WARMUP:
+            return None
+        return self._combine(cv2.countNonZero(self._cleaned) * self.scale**2)
+
+    def unchanged(self):
+        # Un frame invariato conferma lo sfondo già imparato
+        self._learned += 1
+        if self._learned <= self.WARMUP:
+            return None
+        return super().unchanged()
+
+    def threshold(self, frame_interval=None):
+        return float(
+            self.options.get("engine_threshold", self.context.min_area_threshold)
+        )
+
+
+class MOG2Engine(BackgroundSubtractorEngine):
+    """Sottrazione dello sfondo con misture di gaussiane (cv2.createBackgroundSubtractorMOG2)."""
+
+    name = "mog2"
+
+    def _create_subtractor(self):
+        return cv2.createBackgroundSubtractorMOG2(
+            history=self.bg_history,
+            varThreshold=float(self.options.get("bg_threshold", 16)),
+            detectShadows=False,
+        )
+
+
+class KNNEngine(BackgroundSubtractorEngine):
+    """Sottrazione dello sfondo con i K vicini più prossimi (cv2.createBackgroundSubtractorKNN)."""
+
+    name = "knn"
+
+    def _create_subtractor(self):
+        return cv2.createBackgroundSubtractorKNN(
+            history=self.bg_history,
+            dist2Threshold=float(self.options.get("bg_threshold", 400)),
+            detectShadows=False,
+        )
+
+
+class OpticalFlowEngine(MotionEngine):
+    """
+    Flusso ottico sparso sui centroidi delle biglie.
+
+    I centroidi vengono rilevati con la maschera delle biglie del motore color solo ogni
+    flow_redetect frame, o subito se un punto viene perso; negli altri frame sono seguiti
+    con cv2.calcOpticalFlowPyrLK sull'immagine in scala di grigi, molto più economica.
+    Il punteggio è la velocità della biglia più veloce in pixel al secondo: mani e stecca
+    non vengono seguite e non contano come movimento.
+    """
+
+    name = "flow"
+    REDETECT_INTERVAL = 10  # Frame tra due rilevamenti dei centroidi
+    THRESHOLD = 20.0  # Velocità in pixel al secondo oltre cui una biglia è in moto
+    WINDOW = (15, 15)  # Finestra di Lucas-Kanade
+    LEVELS = 2  # Livelli della piramide di Lucas-Kanade
+
+    def __init__(self, consumer, context):
+        super().__init__(consumer, context)
+        self.redetect_interval = int(
+            self.options.get("flow_redetect", self.REDETECT_INTERVAL)
+        )
+        self._gray = None
+        self._previous = None
+        self.reset()
+
+    @property
+    def ready(self):
+        return self._has_previous
+
+    def reset(self):
+        self._last_raw_score = None
+        self._has_previous = False
+        self._points = None
+        self._since_detection = 0
+        self._hsv = None
+
+    def read_frame(self, frame, context):
+        roi = frame.crop(context.roi)
+        if self._gray is None or self._gray.shape != roi.shape[:2]:
+            self._gray = np.empty(roi.shape[:2], dtype=np.uint8)
+            self._previous = np.empty(roi.shape[:2], dtype=np.uint8)
+            self.reset()
+        self._previous, self._gray = self._gray, self._previous
+        cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY, dst=self._gray)
+        self._redetect = (
+            self._points is None or self._since_detection >= self.redetect_interval
+        )
+        if self._redetect:
+            workspace = context.workspace
+            if workspace is not None:
+                _, self._hsv = workspace.prepare(roi, Frame.BLUR_KERNEL)
+            else:
+                self._hsv = frame.hsv(context.roi)
+
+    def motion_score(self, context, frame_interval=None):
+        score = None
+        if self._has_previous:
+            score = 0.0
+            if self._points is not None and len(self._points):
+                points, status, _ = cv2.calcOpticalFlowPyrLK(
+                    self._previous,
+                    self._gray,
+                    self._points,
+                    None,
+                    winSize=self.WINDOW,
+                    maxLevel=self.LEVELS,
+                )
+                found = status.ravel() == 1
+                displacement = np.linalg.norm(
+                    points[found] - self._points[found], axis=-1
+                ).max(initial=0.0)
+                if not found.all():
+                    # Un punto perso (biglia in buca o troppo veloce per la piramide) conta come
+                    # il massimo spostamento misurabile e forza un nuovo rilevamento
+                    displacement = max(displacement, self.WINDOW[0] * 2**self.LEVELS)
+                    self._since_detection = self.redetect_interval
+                interval = frame_interval or 1 / self.consumer.REFERENCE_FPS
+                score = float(displacement / interval)
+                self._points = points[found].reshape((-1, 1, 2))
+        if self._redetect:
+            self._points = self._detect(context)
+        else:
+            self._since_detection += 1
+        self._hsv = None
+        self._has_previous = True
+        self.preview = self._gray
+        return self._combine(score)
+
+    def _detect(self, context):
+        """Centroidi delle biglie nella maschera del motore color, come punti per LK."""
+        mask = self.consumer._create_mask(self._hsv, context)
+        self._since_detection = 0
+        return mask_centroids(mask).astype(np.float32).reshape((-1, 1, 2))
+
+    def centroids(self):
+        if self._points is None:
+            return None
+        return self._points.reshape((-1, 2))
+
+    def unchanged(self):
+        self._since_detection += 1
+        return super().unchanged()
+
+    def threshold(self, frame_interval=None):
+        return float(self.options.get("engine_threshold", self.THRESHOLD))
+
+
+# Motori selezionabili per tavolo con TablePreset.detector["engine"]
+MOTION_ENGINES = {
+    engine.name: engine
+    for engine in (ColorMaskEngine, MOG2Engine, KNNEngine, OpticalFlowEngine)
+}
@@ -0,0 +1,123 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from device.game.motion_engines import (
+    MOTION_ENGINES,
+    BackgroundSubtractorEngine,
+    MotionEngine,
+)
+from device.game.video_consumer import VideoConsumer
+from device.table import TablePreset
+from device.video_producer import Frame, get_producer, remove_producer
+
+CLOTH_BGR = (60, 140, 60)
+FPS = 30
+
+
+class MotionEnginesTest(unittest.TestCase):
+    def setUp(self):
+        self.background = np.full((240, 320, 3), CLOTH_BGR, dtype=np.uint8)
+        self.producer = get_producer("test_motion_engines", frame=self.background)
+        self.events = []
+
+    def tearDown(self):
+        remove_producer("test_motion_engines")
+
+    def consumer(self, engine, **options):
+        cloth = cv2.cvtColor(np.uint8([[CLOTH_BGR]]), cv2.COLOR_BGR2HSV)[0, 0]
+        table = TablePreset(
+            id=0,
+            name="test_table_preset",
+            points=[(20, 20), (300, 20), (300, 220), (20, 220)],
+            colors=[tuple(int(c) for c in cloth)],
+            min_area_threshold=50,
+            detector={"engine": engine, **options},
+        )
+        consumer = VideoConsumer(
+            table,
+            lambda timestamp: self.events.append("start"),
+            lambda timestamp: self.events.append("stop"),
+            None,
+            headless=True,
+            threaded=False,
+        )
+        return consumer
+
+    def play(self, consumer, positions):
+        for position in positions:
+            image = self.background.copy()
+            if position is not None:
+                # Coordinate con 2 bit di frazione, per spostamenti inferiori al pixel
+                center = (round(position * 4), 120 * 4)
+                cv2.circle(image, center, 12 * 4, (230, 230, 230), -1, shift=2)
+            seq = consumer._frames_processed + 1
+            consumer.process_frame(Frame(seq, seq / FPS, image), 1 / FPS)
+
+    def test_engines_detect_start_and_stop(self):
+        static = [40] * 60
+        moving = list(range(40, 280, 6))
+        for name in MOTION_ENGINES:
+            with self.subTest(engine=name):
+                self.events = []
+                consumer = self.consumer(name)
+                self.play(consumer, static)
+                self.assertEqual(self.events, [])
+                self.play(consumer, moving)
+                self.assertEqual(self.events, ["start"])
+                self.play(consumer, [moving[-1]] * 60)
+                self.assertEqual(self.events, ["start", "stop"])
+                stats = consumer.get_stats()
+                self.assertEqual(stats["engine"], name)
+                self.assertGreater(stats["engine_frames"], 0)
+                self.assertGreater(stats["start_latency"], 0)
+
+    def test_tracking_avoids_false_stop_on_slow_roll(self):
+        fast = list(range(40, 220, 6))
+        # 15 pixel al secondo: poche differenze tra le maschere, ma la biglia è ancora in moto
+        slow = [220 + 0.5 * i for i in range(60)]
+        for tracking in (False, True):
+            with self.subTest(tracking=tracking):
+                self.events = []
+                consumer = self.consumer("color", tracking=tracking)
+                self.play(consumer, [40] * 40 + fast + slow)
+                expected = ["start"] if tracking else ["start", "stop"]
+                self.assertEqual(self.events, expected)
+                self.play(consumer, [slow[-1]] * 20)
+                self.assertEqual(self.events, ["start", "stop"])
+                if tracking:
+                    self.assertLess(consumer.get_stats()["stop_latency"], 0.3)
+
+    def test_unknown_engine(self):
+        with self.assertRaises(ValueError):
+            self.consumer("unknown")
+
+    def test_incomplete_engine_fails_on_creation(self):
+        consumer = self.consumer("color")
+
+        # Manca threshold()
+        class NoThreshold(MotionEngine):
+            ready = True
+
+            def reset(self):
+                pass
+
+            def read_frame(self, frame, context):
+                pass
+
+            def motion_score(self, context, frame_interval=None):
+                return 0.0
+
+        # Manca il sottrattore di sfondo
+        class NoSubtractor(BackgroundSubtractorEngine):
+            name = "incomplete"
+
+        for engine in (NoThreshold, NoSubtractor):
+            with self.subTest(engine=engine.__name__):
+                with self.assertRaises(TypeError):
+                    engine(consumer, consumer._context)
+
+
+if __name__ == "__main__":
+    unittest.main()
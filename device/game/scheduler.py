@@ -0,0 +1,244 @@
+import heapq
+import itertools
+import logging
+import time
+from threading import Condition, Lock, Thread
+
+
+class ScheduledCall:
+    """
+    Chiamata programmata da TimerScheduler.
+
+    Attributi:
+        deadline (float): Istante monotono (time.monotonic) in cui eseguire la chiamata.
+        callback (callable): Funzione da chiamare, con args.
+        cancelled (bool): True se la chiamata è stata annullata prima dell'esecuzione.
+        done (bool): True se la chiamata è già stata eseguita.
+    """
+
+    __slots__ = ("deadline", "callback", "args", "cancelled", "done")
+
+    def __init__(self, deadline, callback, args):
+        self.deadline = deadline
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+        self.done = False
+
+    @property
+    def pending(self) -> bool:
+        """True se la chiamata deve ancora essere eseguita."""
+        return not (self.cancelled or self.done)
+
+
+class TimerScheduler:
+    """
+    Esegue le chiamate programmate di tutti i timer da un solo thread.
+
+    Le chiamate sono in un heap ordinato per scadenza: programmare una chiamata costa
+    O(log n), annullarla O(1) (la voce viene solo segnata e scartata quando arriva in cima
+    all'heap; quando le voci annullate sono più della metà l'heap viene ricostruito).
+    Il thread dormiente si sveglia solo alla scadenza della prima chiamata, o quando ne viene
+    programmata una che scade prima.
+
+    Le chiamate vengono eseguite fuori dal lock, quindi possono programmare o annullare altre
+    chiamate; un'eccezione in una chiamata viene registrata nel log e non ferma lo scheduler.
+    Una chiamata lenta ritarda tutte le successive: le chiamate devono durare poco.
+
+    Con un orologio virtuale (VirtualClock) lo scheduler non ha un thread: le chiamate vengono
+    eseguite da run_due(), che l'orologio chiama quando il suo tempo avanza.
+    """
+
+    # Voci annullate oltre cui l'heap viene ricostruito, se sono anche più della metà
+    COMPACT_THRESHOLD = 64
+
+    def __init__(self, name="TimerScheduler", clock=None):
+        """
+        Parametri:
+            name (str): Nome del thread dello scheduler.
+            clock (VirtualClock): Orologio virtuale che esegue le chiamate (Opzionale, senza le
+                chiamate vengono eseguite in tempo reale dal thread dello scheduler).
+        """
+        self.name = name
+        self._clock = clock
+        self._heap = []  # (scadenza, numero progressivo, ScheduledCall)
+        self._sequence = itertools.count()
+        self._condition = Condition()
+        self._cancelled_entries = 0
+        self._stopped = False
+        self._thread = None
+        self.scheduled = 0
+        self.fired = 0
+        self.cancelled = 0
+        self.errors = 0
+        self.wakeups = 0
+        self.max_lateness = 0.0
+
+    def schedule(self, deadline, callback, *args) -> ScheduledCall:
+        """
+        Programma callback(*args) all'istante monotono deadline (subito se è già passato).
+
+        Returns:
+            ScheduledCall: Riferimento per annullare la chiamata con cancel().
+        """
+        call = ScheduledCall(deadline, callback, args)
+        with self._condition:
+            if self._stopped:
+                raise RuntimeError(f"{self.name} è stato fermato")
+            heapq.heappush(self._heap, (deadline, next(self._sequence), call))
+            self.scheduled += 1
+            if self._clock is not None:
+                pass  # Eseguita da run_due() quando l'orologio virtuale avanza
+            elif self._thread is None:
+                self._thread = Thread(target=self._run, name=self.name)
+                # Servizio condiviso da tutti i giochi: non deve impedire la chiusura del processo
+                self._thread.daemon = True
+                self._thread.start()
+            elif self._heap[0][2] is call:
+                # La nuova chiamata scade prima di quella attesa dal thread
+                self._condition.notify()
+        return call
+
+    def call_later(self, delay, callback, *args) -> ScheduledCall:
+        """Programma callback(*args) tra delay secondi."""
+        return self.schedule(self._monotonic() + delay, callback, *args)
+
+    def cancel(self, call: ScheduledCall | None) -> bool:
+        """
+        Annulla una chiamata programmata.
+
+        Returns:
+            bool: True se la chiamata era in attesa ed è stata annullata.
+        """
+        if call is None:
+            return False
+        with self._condition:
+            if not call.pending:
+                return False
+            call.cancelled = True
+            self.cancelled += 1
+            self._cancelled_entries += 1
+            if (
+                self._cancelled_entries > self.COMPACT_THRESHOLD
+                and self._cancelled_entries * 2 > len(self._heap)
+            ):
+                self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+                heapq.heapify(self._heap)
+                self._cancelled_entries = 0
+            return True
+
+    def stop(self):
+        """Ferma il thread dello scheduler; le chiamate ancora in attesa non vengono eseguite."""
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+
+    @property
+    def pending(self) -> int:
+        """Numero di chiamate in attesa."""
+        with self._condition:
+            return len(self._heap) - self._cancelled_entries
+
+    def get_stats(self):
+        """Contatori dello scheduler: chiamate programmate, eseguite, annullate e risvegli."""
+        with self._condition:
+            return {
+                "pending": len(self._heap) - self._cancelled_entries,
+                "scheduled": self.scheduled,
+                "fired": self.fired,
+                "cancelled": self.cancelled,
+                "errors": self.errors,
+                "wakeups": self.wakeups,
+                "max_lateness_ms": self.max_lateness * 1000,
+            }
+
+    def _monotonic(self):
+        return self._clock.monotonic() if self._clock is not None else time.monotonic()
+
+    def next_deadline(self) -> float | None:
+        """Scadenza della prima chiamata in attesa, None se non ce ne sono."""
+        with self._condition:
+            self._discard_cancelled()
+            return self._heap[0][0] if self._heap else None
+
+    def run_due(self) -> int:
+        """
+        Esegue nel thread chiamante, in ordine, le chiamate già scadute (anche quelle
+        programmate durante l'esecuzione). Usato dall'orologio virtuale.
+
+        Returns:
+            int: Numero di chiamate eseguite.
+        """
+        executed = 0
+        while True:
+            with self._condition:
+                self._discard_cancelled()
+                call = self._pop_due(self._monotonic())
+            if call is None:
+                return executed
+            self._execute(call)
+            executed += 1
+
+    def _discard_cancelled(self):
+        heap = self._heap
+        while heap and heap[0][2].cancelled:
+            heapq.heappop(heap)
+            self._cancelled_entries -= 1
+
+    def _pop_due(self, now):
+        """Toglie dall'heap la prima chiamata se è scaduta e la restituisce, altrimenti None."""
+        if not self._heap or self._heap[0][0] > now:
+            return None
+        deadline, _, call = heapq.heappop(self._heap)
+        call.done = True
+        self.fired += 1
+        self.max_lateness = max(self.max_lateness, now - deadline)
+        return call
+
+    def _execute(self, call):
+        try:
+            call.callback(*call.args)
+        except Exception:
+            with self._condition:
+                self.errors += 1
+            logging.exception(f"Errore in una chiamata di {self.name}")
+
+    def _next_call(self):
+        """Attende la prima chiamata scaduta e la toglie dall'heap; None se lo scheduler è fermo."""
+        with self._condition:
+            while not self._stopped:
+                self._discard_cancelled()
+                if not self._heap:
+                    self._condition.wait()
+                    self.wakeups += 1
+                    continue
+                now = time.monotonic()
+                call = self._pop_due(now)
+                if call is not None:
+                    return call
+                self._condition.wait(self._heap[0][0] - now)
+                self.wakeups += 1
+            return None
+
+    def _run(self):
+        while True:
+            call = self._next_call()
+            if call is None:
+                return
+            self._execute(call)
+
+
+_scheduler = None
+_scheduler_lock = Lock()
+
+
+def get_scheduler() -> TimerScheduler:
+    """Restituisce lo scheduler condiviso da tutti i timer del dispositivo."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = TimerScheduler()
+        return _scheduler
@@ -0,0 +1,90 @@
+import threading
+import time
+import unittest
+
+from device.game.scheduler import TimerScheduler
+from device.game.timer import Timer
+
+
+class TimerSchedulerTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = TimerScheduler(name="TestScheduler")
+        self.calls = []
+        self.done = threading.Event()
+
+    def tearDown(self):
+        self.scheduler.stop()
+
+    def record(self, name):
+        self.calls.append((name, threading.current_thread().name))
+        if name == "last":
+            self.done.set()
+
+    def test_calls_in_deadline_order_on_one_thread(self):
+        now = time.monotonic()
+        self.scheduler.schedule(now + 0.06, self.record, "last")
+        self.scheduler.schedule(now + 0.02, self.record, "first")
+        self.scheduler.schedule(now + 0.04, self.record, "second")
+        self.assertTrue(self.done.wait(1))
+        self.assertEqual(
+            self.calls,
+            [(name, "TestScheduler") for name in ("first", "second", "last")],
+        )
+
+    def test_cancel(self):
+        call = self.scheduler.call_later(0.02, self.record, "cancelled")
+        self.scheduler.call_later(0.04, self.record, "last")
+        self.assertTrue(self.scheduler.cancel(call))
+        self.assertTrue(self.done.wait(1))
+        self.assertEqual([name for name, _ in self.calls], ["last"])
+        self.assertFalse(self.scheduler.cancel(call))
+        self.assertEqual(self.scheduler.get_stats()["cancelled"], 1)
+
+    def test_callback_can_schedule_and_errors_do_not_stop(self):
+        def fail():
+            raise RuntimeError("errore di prova")
+
+        self.scheduler.call_later(0, fail)
+        self.scheduler.call_later(
+            0.01, lambda: self.scheduler.call_later(0.01, self.record, "last")
+        )
+        self.assertTrue(self.done.wait(1))
+        stats = self.scheduler.get_stats()
+        self.assertEqual(stats["errors"], 1)
+        self.assertEqual(stats["fired"], 3)
+        self.assertEqual(stats["pending"], 0)
+
+    def test_timers_share_the_scheduler_thread(self):
+        expired = []
+        threads_before = threading.active_count()
+        timers = [
+            Timer(
+                0.2,
+                0,
+                lambda index=index: expired.append(index),
+                lambda: None,
+                lambda *args: None,
+                scheduler=self.scheduler,
+            )
+            for index in range(50)
+        ]
+        for timer in timers:
+            # Turno iniziato START_DELAY secondi fa: il tempo scorre subito
+            timer.start(at=time.monotonic() - Timer.START_DELAY)
+        timers[0].pause()
+        timers[1].end()
+        deadline = time.monotonic() + 2
+        while len(expired) < 48 and time.monotonic() < deadline:
+            time.sleep(0.02)
+        self.assertEqual(sorted(expired), list(range(2, 50)))
+        # Un solo thread in più, quello dello scheduler
+        self.assertLessEqual(threading.active_count(), threads_before + 1)
+        self.assertEqual(self.scheduler.pending, 0)
+        self.assertGreater(timers[0].resume(), 0)
+        self.assertEqual(self.scheduler.pending, 1)
+        timers[0].end()
+        self.assertEqual(self.scheduler.pending, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
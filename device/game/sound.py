@@ -0,0 +1,296 @@
+"""
+Segnali sonori del gioco, riprodotti da un thread dedicato.
+
+Timer e Game chiedono un suono con SoundWorker.play(), che accoda il pattern e ritorna subito:
+il thread del timer non attende mai la fine di un suono. I pattern sono tre, in ordine di
+importanza: TICK (ogni secondo del countdown finale), WARNING (allarme del turno) e FINAL
+(tempo scaduto).
+
+L'uscita è scelta con la chiave Output della sezione SOUND della configurazione:
+    auto      buzzer sul Raspberry Pi, winsound su Windows, null altrove (predefinito)
+    buzzer    buzzer collegato al GPIO BuzzerPin (gpiozero)
+    winsound  altoparlante del PC, solo su Windows
+    wav       scrive i suoni nel file WavPath, per verificarli su qualsiasi sistema
+    null      nessun suono
+"""
+
+import logging
+import math
+import struct
+import sys
+import time
+import wave
+from collections import deque
+from dataclasses import dataclass
+from threading import Condition, Lock, Thread
+
+from device.config import get_config
+from device.utils import is_raspberry_pi
+
+
+@dataclass(frozen=True)
+class SoundPattern:
+    """
+    Sequenza di toni da riprodurre.
+
+    Attributi:
+        name (str): Nome del pattern.
+        priority (int): Importanza: un pattern più importante sostituisce quelli in attesa.
+        beeps (tuple): Coppie (secondi di suono, secondi di silenzio successivi).
+        frequency (int): Frequenza del tono in Hz.
+    """
+
+    name: str
+    priority: int
+    beeps: tuple
+    frequency: int = 1000
+
+    @property
+    def duration(self) -> float:
+        """Durata del pattern in secondi, silenzi compresi."""
+        return sum(on + off for on, off in self.beeps)
+
+
+TICK = SoundPattern("tick", 0, ((0.25, 0.0),))
+WARNING = SoundPattern("warning", 1, ((0.5, 0.5),))
+FINAL = SoundPattern("final", 2, ((2.0, 0.0),))
+
+
+class NullOutput:
+    """Uscita muta: registra solo i nomi dei pattern riprodotti."""
+
+    def __init__(self):
+        self.played = []
+
+    def play(self, pattern: SoundPattern):
+        self.played.append(pattern.name)
+
+    def close(self):
+        pass
+
+
+class WavOutput:
+    """Scrive i pattern, uno dopo l'altro, in un file WAV mono a 16 bit."""
+
+    AMPLITUDE = 0.5
+
+    def __init__(self, path, sample_rate=8000):
+        self.path = path
+        self.sample_rate = sample_rate
+        self._file = None
+
+    def _samples(self, seconds, frequency=None):
+        count = round(seconds * self.sample_rate)
+        if frequency is None:
+            return bytes(2 * count)
+        peak = self.AMPLITUDE * 32767
+        step = 2 * math.pi * frequency / self.sample_rate
+        return struct.pack(
+            f"<{count}h", *(round(peak * math.sin(step * i)) for i in range(count))
+        )
+
+    def play(self, pattern: SoundPattern):
+        if self._file is None:
+            self._file = wave.open(self.path, "wb")
+            self._file.setnchannels(1)
+            self._file.setsampwidth(2)
+            self._file.setframerate(self.sample_rate)
+        for on, off in pattern.beeps:
+            self._file.writeframes(self._samples(on, pattern.frequency))
+            self._file.writeframes(self._samples(off))
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+class BuzzerOutput:
+    """Buzzer collegato a un GPIO del Raspberry Pi."""
+
+    def __init__(self, pin=11):
+        from gpiozero import Buzzer
+
+        self._buzzer = Buzzer(pin)
+
+    def play(self, pattern: SoundPattern):
+        for on, off in pattern.beeps:
+            self._buzzer.on()
+            time.sleep(on)
+            self._buzzer.off()
+            time.sleep(off)
+
+    def close(self):
+        self._buzzer.off()
+        self._buzzer.close()
+
+
+class WinsoundOutput:
+    """Altoparlante del PC, con winsound (solo Windows)."""
+
+    def play(self, pattern: SoundPattern):
+        import winsound
+
+        for on, off in pattern.beeps:
+            winsound.Beep(pattern.frequency, int(1000 * on))
+            time.sleep(off)
+
+    def close(self):
+        pass
+
+
+def create_output(name=None):
+    """
+    Crea l'uscita audio name (Opzionale, config SOUND/Output): "auto", "buzzer", "winsound",
+    "wav" o "null".
+    """
+    config = get_config()
+    if name is None:
+        name = config.get("SOUND", "Output", fallback="auto")
+    if name == "auto":
+        if is_raspberry_pi():
+            name = "buzzer"
+        elif sys.platform == "win32":
+            name = "winsound"
+        else:
+            name = "null"
+    if name == "buzzer":
+        return BuzzerOutput(config.getint("SOUND", "BuzzerPin", fallback=11))
+    if name == "winsound":
+        return WinsoundOutput()
+    if name == "wav":
+        return WavOutput(config.get("SOUND", "WavPath", fallback="sound.wav"))
+    if name == "null":
+        return NullOutput()
+    raise ValueError(f"Uscita audio sconosciuta: {name}")
+
+
+class SoundWorker:
+    """
+    Thread che riproduce i pattern sonori richiesti con play(), uno alla volta.
+
+    Le richieste in attesa vengono unite: un pattern già in attesa non viene accodato di nuovo,
+    e un pattern più importante sostituisce quelli meno importanti in attesa (es. FINAL scarta
+    i TICK del countdown non ancora suonati). La coda ha al massimo max_pending pattern: oltre,
+    le nuove richieste vengono scartate. Il pattern in riproduzione non viene interrotto.
+    """
+
+    MAX_PENDING = 3
+
+    def __init__(self, output, max_pending=MAX_PENDING, name="SoundWorker"):
+        """
+        Parametri:
+            output: Uscita audio (NullOutput, WavOutput, BuzzerOutput o WinsoundOutput).
+            max_pending (int): Pattern in attesa oltre cui le richieste vengono scartate.
+            name (str): Nome del thread.
+        """
+        self.output = output
+        self.max_pending = max_pending
+        self.name = name
+        self._pending = deque()
+        self._condition = Condition()
+        self._thread = None
+        self._stopped = False
+        self.playing = None  # Pattern in riproduzione
+        self.requested = 0
+        self.played = 0
+        self.collapsed = 0
+        self.dropped = 0
+        self.errors = 0
+
+    def play(self, pattern: SoundPattern) -> bool:
+        """
+        Accoda pattern senza attenderne la riproduzione.
+
+        Returns:
+            bool: True se il pattern è stato accodato, False se è stato unito a uno in attesa
+                o scartato.
+        """
+        with self._condition:
+            self.requested += 1
+            if self._stopped:
+                self.dropped += 1
+                return False
+            if pattern in self._pending:
+                self.collapsed += 1
+                return False
+            superseded = [p for p in self._pending if p.priority < pattern.priority]
+            for replaced in superseded:
+                self._pending.remove(replaced)
+            self.collapsed += len(superseded)
+            if len(self._pending) >= self.max_pending:
+                self.dropped += 1
+                return False
+            self._pending.append(pattern)
+            if self._thread is None:
+                self._thread = Thread(target=self._run, name=self.name)
+                # Un suono in coda non deve impedire la chiusura del processo
+                self._thread.daemon = True
+                self._thread.start()
+            else:
+                # Anche wait_idle() attende sulla stessa condizione
+                self._condition.notify_all()
+            return True
+
+    def stop(self, timeout=None):
+        """Ferma il thread dopo il pattern in riproduzione e chiude l'uscita audio."""
+        with self._condition:
+            self._stopped = True
+            self._pending.clear()
+            self._condition.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.output.close()
+
+    def wait_idle(self, timeout=None) -> bool:
+        """Attende che non ci siano pattern in attesa o in riproduzione."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and self.playing is None, timeout
+            )
+
+    def get_stats(self):
+        """Contatori delle richieste: riprodotte, unite ad altre, scartate e in errore."""
+        with self._condition:
+            return {
+                "pending": len(self._pending),
+                "requested": self.requested,
+                "played": self.played,
+                "collapsed": self.collapsed,
+                "dropped": self.dropped,
+                "errors": self.errors,
+            }
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+                self.playing = self._pending.popleft()
+            try:
+                self.output.play(self.playing)
+                failed = False
+            except Exception:
+                logging.exception(f"Errore nella riproduzione di {self.playing.name}")
+                failed = True
+            with self._condition:
+                self.errors += failed
+                self.played += not failed
+                self.playing = None
+                self._condition.notify_all()
+
+
+_worker = None
+_worker_lock = Lock()
+
+
+def get_sound_worker() -> SoundWorker:
+    """Restituisce il SoundWorker del dispositivo, con l'uscita scelta dalla configurazione."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = SoundWorker(create_output())
+        return _worker
@@ -0,0 +1,100 @@
+import os
+import tempfile
+import threading
+import unittest
+import wave
+
+from device.game.sound import (
+    FINAL,
+    TICK,
+    WARNING,
+    NullOutput,
+    SoundPattern,
+    SoundWorker,
+    WavOutput,
+    create_output,
+)
+
+
+class BlockingOutput(NullOutput):
+    """Uscita che resta in riproduzione finché il test non chiama release.set()."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def play(self, pattern):
+        super().play(pattern)
+        self.started.set()
+        self.release.wait(2)
+
+
+class SoundWorkerTest(unittest.TestCase):
+    def setUp(self):
+        self.output = BlockingOutput()
+        self.worker = SoundWorker(self.output, max_pending=2, name="TestSoundWorker")
+
+    def tearDown(self):
+        self.output.release.set()
+        self.worker.stop(1)
+
+    def test_play_does_not_wait_for_output(self):
+        self.assertTrue(self.worker.play(WARNING))
+        self.assertTrue(self.output.started.wait(1))
+        # L'uscita è ferma sul primo pattern: play() ritorna comunque subito
+        self.assertTrue(self.worker.play(TICK))
+        self.assertFalse(self.worker.wait_idle(0.05))
+        self.output.release.set()
+        self.assertTrue(self.worker.wait_idle(1))
+        self.assertEqual(self.output.played, ["warning", "tick"])
+
+    def test_pending_patterns_are_collapsed(self):
+        self.worker.play(WARNING)
+        self.assertTrue(self.output.started.wait(1))
+        self.assertTrue(self.worker.play(TICK))
+        # Già in attesa
+        self.assertFalse(self.worker.play(TICK))
+        # Più importante: sostituisce il TICK in attesa
+        self.assertTrue(self.worker.play(FINAL))
+        self.assertEqual(self.worker.get_stats()["pending"], 1)
+        self.output.release.set()
+        self.assertTrue(self.worker.wait_idle(1))
+        self.assertEqual(self.output.played, ["warning", "final"])
+        stats = self.worker.get_stats()
+        self.assertEqual(stats["requested"], 4)
+        self.assertEqual(stats["played"], 2)
+        self.assertEqual(stats["collapsed"], 2)
+        self.assertEqual(stats["dropped"], 0)
+
+    def test_full_queue_drops_requests(self):
+        patterns = [SoundPattern(name, 0, ((0.1, 0.0),)) for name in "abc"]
+        self.worker.play(WARNING)
+        self.assertTrue(self.output.started.wait(1))
+        self.assertEqual([self.worker.play(p) for p in patterns], [True, True, False])
+        self.output.release.set()
+        self.assertTrue(self.worker.wait_idle(1))
+        self.assertEqual(self.output.played, ["warning", "a", "b"])
+        self.assertEqual(self.worker.get_stats()["dropped"], 1)
+
+
+class OutputTest(unittest.TestCase):
+    def test_wav_output_duration(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "sound.wav")
+            output = WavOutput(path)
+            output.play(TICK)
+            output.play(WARNING)
+            output.close()
+            with wave.open(path, "rb") as file:
+                duration = file.getnframes() / file.getframerate()
+        self.assertAlmostEqual(duration, TICK.duration + WARNING.duration)
+
+    def test_create_null_output(self):
+        self.assertIsInstance(create_output("null"), NullOutput)
+        with self.assertRaises(ValueError):
+            create_output("organo")
+
+
+if __name__ == "__main__":
+    unittest.main()
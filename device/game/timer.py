@@ -1,9 +1,33 @@
-import time
-from threading import Lock, Thread, Event
+from threading import Lock, Event
 import math
 
+from device.game.clock import SYSTEM_CLOCK, Clock
+from device.game.scheduler import TimerScheduler
+
 
 class Timer:
+    """
+    Timer del turno, con conto alla rovescia eseguito dal TimerScheduler del suo orologio
+    (quello condiviso, in tempo reale): il timer non ha un thread proprio.
+
+    Il timer conserva la scadenza assoluta (istante monotono in cui il tempo finirebbe senza
+    pause) e il tempo passato in pausa: il tempo rimanente viene calcolato quando serve, senza
+    accumulare errori. Lo scheduler lo sveglia solo per il prossimo evento: l'aggiornamento
+    periodico (periodic_time), l'allarme (allarm_time), ogni secondo del countdown finale
+    (5..1) e la scadenza. Pausa e fine annullano il risveglio programmato, avvio, ripresa e
+    aggiunta di tempo lo ricalcolano.
+
+    Con un VirtualClock il conto alla rovescia avanza solo con l'orologio, istantaneamente.
+
+    start, pause e resume accettano l'istante monotono (clock.monotonic) in cui l'evento è
+    avvenuto davvero: il rilevatore di movimento riconosce l'inizio e la fine di un tiro con
+    qualche frame di ritardo, e il tempo trascorso nel frattempo viene restituito o scalato.
+    """
+
+    START_DELAY = 2  # Secondi dopo start() prima che il tempo inizi a scorrere
+    # Secondi finali segnalati uno per uno con countdown_callback (o allarm_callback)
+    COUNTDOWN_SECONDS = 5
+
     def __init__(
         self,
         duration: int,
@@ -12,100 +36,249 @@ class Timer:
         allarm_callback,
         periodic_callback,
         periodic_time=1,
+        scheduler: TimerScheduler | None = None,
+        clock: Clock | None = None,
+        countdown_callback=None,
     ):
         """
         Inizializza un timer.
         :param duration: Durata del timer in secondi.
         :param callback: Funzione da chiamare quando il timer scade.
+        :param scheduler: Scheduler che esegue il conto alla rovescia (Opzionale, quello
+            dell'orologio). I callback vengono chiamati dal suo thread.
+        :param clock: Orologio da cui leggere il tempo (Opzionale, tempo reale).
+        :param countdown_callback: Funzione chiamata con il secondo (5..1) del countdown finale
+            (Opzionale, altrimenti viene chiamata allarm_callback).
         """
         self.duration = duration
-        self.remaining_time = duration
         self._remaining_time_lock = Lock()
         self.callback = callback
         self.allarm_time = allarm_time
         self.allarm_callback = allarm_callback
+        self.countdown_callback = countdown_callback
         self.periodic_callback = periodic_callback
         self.periodic_time = periodic_time
         self._allarm_triggered = False
-        self._countdown_triggered = False
-        self._last_countdown_second = 6
+        self._expired = False
+        self._last_countdown_second = self.COUNTDOWN_SECONDS + 1
         self._is_running_event = Event()
         self._end_event = Event()
-        self.thread = None
+        self._clock = clock if clock is not None else SYSTEM_CLOCK
+        self._scheduler = (
+            scheduler if scheduler is not None else self._clock.scheduler()
+        )
+        self._next_step = None  # Prossimo risveglio programmato
+        self._next_step_at = None
+        self._next_tick = None
+        # Istante da cui il tempo scorre (avvio più START_DELAY), None prima di start()
+        self._counting_start = None
+        # Istante in cui il tempo finirebbe senza pause; prima di start() vale la durata
+        self._deadline = duration
+        self._paused_time = 0.0  # Secondi di pause già concluse
+        self._paused_at = None  # Istante di inizio della pausa in corso
+        # Istante da cui il tempo scorre senza interruzioni (ultimo avvio o ripresa)
+        self._counting_since = None
+        self.wakeups = 0
+        self._drift_total = 0.0
+        self.max_drift = 0.0
+        self.expiry_drift = None
 
-    def _run(self):
-        """
-        Esegue il conto alla rovescia del timer. Se il timer è scaduto oppure viene formato il termine del timer,
-        allora viene eseguita la funzione di callback.
-        """
-        time.sleep(2)
-        _last_time_check = time.monotonic()
-        while (not self._end_event.is_set()) and (self.remaining_time > 0):
-            start_time = time.monotonic()
-            if not self._is_running_event.is_set():
-                self._is_running_event.wait()  # Attende che il timer venga ripreso
-                start_time = time.monotonic()
+    def _pause_overlap(self, start, end):
+        """Secondi di [start, end] in cui il tempo sarebbe scorso (dopo START_DELAY)."""
+        return max(0.0, end - max(start, self._counting_start))
 
-            if self._end_event.is_set():
-                break
-            time.sleep(max(0.001, min(self.remaining_time / 10, 0.1)))
+    def _remaining(self, now):
+        """Tempo rimanente all'istante now."""
+        if self._counting_start is None:
+            return max(0.0, self._deadline)
+        deadline = self._deadline + self._paused_time
+        if self._paused_at is not None:
+            deadline += self._pause_overlap(self._paused_at, now)
+        return max(0.0, deadline - max(now, self._counting_start))
 
-            elapsed = time.monotonic() - start_time
-            with self._remaining_time_lock:
-                self.remaining_time = max(0, self.remaining_time - elapsed)
+    @property
+    def remaining_time(self):
+        """Tempo rimanente, in secondi."""
+        with self._remaining_time_lock:
+            return self._remaining(self._clock.monotonic())
 
-            current_time = time.monotonic()
-            if current_time - _last_time_check >= self.periodic_time:
-                self.periodic_callback(
-                    self.remaining_time, self._is_running_event.isSet()
-                )
-                _last_time_check = current_time
+    @property
+    def expired(self) -> bool:
+        """True se il timer ha raggiunto 0 ed è stata chiamata la funzione di callback."""
+        with self._remaining_time_lock:
+            return self._expired
 
-            if self.remaining_time <= self.allarm_time and not self._allarm_triggered:
-                self.allarm_callback()
-                self._allarm_triggered = True
+    def _next_countdown_second(self, remaining):
+        """Prossimo secondo del countdown finale da segnalare, 0 se non ce ne sono."""
+        return max(
+            0,
+            min(
+                self.COUNTDOWN_SECONDS,
+                self._last_countdown_second - 1,
+                math.ceil(remaining),
+            ),
+        )
 
+    def _reschedule(self, now):
+        """Programma il risveglio per il prossimo evento, se il timer sta scorrendo."""
+        self._scheduler.cancel(self._next_step)
+        self._next_step = None
+        if (
+            self._counting_start is None
+            or self._paused_at is not None
+            or self._end_event.is_set()
+            or self._expired
+        ):
+            return
+        deadline = self._deadline + self._paused_time
+        events = [deadline, self._next_tick]
+        if not self._allarm_triggered:
+            events.append(deadline - self.allarm_time)
+        second = self._next_countdown_second(self._remaining(now))
+        if second > 0:
+            events.append(deadline - second)
+        self._next_step_at = max(min(events), self._counting_start)
+        self._next_step = self._scheduler.schedule(self._next_step_at, self._step)
+
+    def _step(self):
+        """
+        Risveglio programmato: esegue i callback degli eventi arrivati e programma il
+        successivo. Se il timer è scaduto viene eseguita la funzione di callback.
+        """
+        with self._remaining_time_lock:
+            if self._end_event.is_set() or self._paused_at is not None or self._expired:
+                return
+            now = self._clock.monotonic()
+            self.wakeups += 1
+            drift = now - self._next_step_at
+            self._drift_total += drift
+            self.max_drift = max(self.max_drift, drift)
+            remaining = self._remaining(now)
+
+            tick = now >= self._next_tick
+            if tick:
+                while self._next_tick <= now:
+                    self._next_tick += self.periodic_time
+            allarm = remaining <= self.allarm_time and not self._allarm_triggered
+            if allarm:
+                self._allarm_triggered = True
             # Allarme per il countdown finale (5,4,3,2,1)
+            second = self._next_countdown_second(remaining)
+            countdown = second > 0 and remaining <= second
+            if countdown:
+                self._last_countdown_second = second
+            expired = remaining <= 0
+            if expired:
+                self._expired = True
+                self.expiry_drift = now - (self._deadline + self._paused_time)
+            self._reschedule(now)
+            running = self._is_running_event.is_set()
 
-            current_second = math.ceil(self.remaining_time)
-            if (
-                current_second <= 5
-                and current_second > 0
-                and current_second < self._last_countdown_second
-            ):
-                self._last_countdown_second = current_second
+        # Callback fuori dal lock: possono fermare il timer o crearne uno nuovo
+        if tick:
+            self.periodic_callback(remaining, running)
+        if allarm:
+            self.allarm_callback()
+        if countdown:
+            if self.countdown_callback:
+                self.countdown_callback(second)
+            else:
                 self.allarm_callback()
+        if expired:
+            self.callback()
 
-            elif self.remaining_time <= 0:
-                self.callback()
+    def get_stats(self):
+        """
+        Risvegli del timer e loro ritardo (drift) rispetto all'istante programmato;
+        expiry_drift_ms è il ritardo della scadenza, None se il timer non è scaduto.
+        """
+        with self._remaining_time_lock:
+            return {
+                "wakeups": self.wakeups,
+                "avg_drift_ms": (
+                    self._drift_total * 1000 / self.wakeups if self.wakeups else 0.0
+                ),
+                "max_drift_ms": self.max_drift * 1000,
+                "expiry_drift_ms": (
+                    self.expiry_drift * 1000 if self.expiry_drift is not None else None
+                ),
+            }
 
-    def start(self):
-        """Avvia il timer."""
-        self._is_running_event.set()
-        self.thread = Thread(target=self._run, daemon=False)
-        self.thread.name = "TimerThread"
-        self.thread.start()
+    def start(self, at=None):
+        """
+        Avvia il timer.
+        :param at: Istante monotono in cui è iniziato il turno, se precedente a ora.
+        """
+        with self._remaining_time_lock:
+            now = self._clock.monotonic()
+            # Il tempo inizia a scorrere dopo START_DELAY, anticipato se il turno è iniziato prima
+            start = now + self.START_DELAY
+            if at is not None:
+                start -= now - min(at, now)
+            # Il tempo aggiunto prima dell'avvio è già nella durata
+            self._deadline = start + self._deadline
+            self._counting_start = start
+            self._counting_since = start
+            self._next_tick = start + self.periodic_time
+            self._is_running_event.set()
+            self._reschedule(now)
 
-    def add_time(self, time):
+    def add_time(self, seconds):
+        """Aggiunge seconds secondi al tempo rimanente."""
         with self._remaining_time_lock:
-            self.remaining_time = self.remaining_time + time
-        self.periodic_callback(self.remaining_time, self._is_running_event.isSet())
+            self._deadline += seconds
+            self._reschedule(self._clock.monotonic())
+        self.periodic_callback(self.remaining_time, self._is_running_event.is_set())
 
-    def pause(self):
-        """Metti in pausa il timer."""
-        self._is_running_event.clear()
-        return self.remaining_time
+    def pause(self, at=None):
+        """
+        Metti in pausa il timer.
+        :param at: Istante monotono in cui il timer avrebbe dovuto fermarsi, se precedente a ora:
+            il tempo scalato da allora viene restituito.
+        :return: Tempo rimanente.
+        """
+        with self._remaining_time_lock:
+            now = self._clock.monotonic()
+            if self._is_running_event.is_set():
+                self._is_running_event.clear()
+                paused_at = now
+                if at is not None:
+                    # Non prima dell'ultimo avvio o ripresa: quel tempo è già stato restituito
+                    paused_at = min(now, max(at, self._counting_since))
+                self._paused_at = paused_at
+                self._reschedule(now)
+            return self._remaining(now)
 
-    def resume(self):
-        """Riprendi il timer dalla pausa."""
-        self._is_running_event.set()
-        return self.remaining_time
+    def resume(self, at=None):
+        """
+        Riprendi il timer dalla pausa.
+        :param at: Istante monotono in cui il timer avrebbe dovuto ripartire, se precedente a ora:
+            il tempo trascorso da allora viene scalato.
+        :return: Tempo rimanente.
+        """
+        with self._remaining_time_lock:
+            now = self._clock.monotonic()
+            if not self._is_running_event.is_set():
+                self._is_running_event.set()
+                if self._paused_at is not None:
+                    resumed_at = now
+                    if at is not None:
+                        resumed_at = max(min(at, now), self._paused_at)
+                    self._paused_time += self._pause_overlap(
+                        self._paused_at, resumed_at
+                    )
+                    self._paused_at = None
+                    # Durante START_DELAY il tempo riprende a scorrere solo alla sua fine
+                    self._counting_since = max(resumed_at, self._counting_start)
+                    self._reschedule(now)
+            return self._remaining(now)
 
     def end(self):
         """
         Ferma il timer.
-        Viene mandato l'evento end_event e viene terminato il thread.
+        Viene mandato l'evento end_event e annullato il risveglio programmato.
         """
-        if self.thread and self.thread.is_alive():
+        with self._remaining_time_lock:
             self._end_event.set()
-            self._is_running_event.set()  # Sblocca il thread se è in attesa
+            self._scheduler.cancel(self._next_step)
+            self._next_step = None
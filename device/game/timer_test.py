@@ -1,13 +1,29 @@
+import time
 import unittest
+from threading import Event
+
+from device.game.clock import VirtualClock
+from device.game.scheduler import TimerScheduler
 from device.game.timer import Timer
 
 
 class TimerTest(unittest.TestCase):
     def setUp(self):
-        self.timer = Timer(10, self.end_callback)
+        self.clock = VirtualClock()
+        self.expired = []
+        self.allarms = []
+        self.ticks = []
+        self.timer = Timer(
+            10,
+            3,
+            self.end_callback,
+            lambda: self.allarms.append(self.clock.monotonic()),
+            lambda remaining, running: self.ticks.append(remaining),
+            clock=self.clock,
+        )
 
     def end_callback(self):
-        print("END CALLBACK")
+        self.expired.append(self.clock.monotonic())
 
     def test_init_timer(self):
         self.assertIsInstance(
@@ -15,6 +31,101 @@ class TimerTest(unittest.TestCase):
             Timer,
             "new timer is not an instance of Timer",
         )
+        self.assertEqual(self.timer.remaining_time, 10)
+
+    def test_expires_after_start_delay(self):
+        self.timer.start()
+        self.clock.advance(Timer.START_DELAY + 9.5)
+        self.assertEqual(self.timer.remaining_time, 0.5)
+        self.assertEqual(self.expired, [])
+        self.clock.advance(60)
+        self.assertEqual(self.expired, [Timer.START_DELAY + 10])
+        self.assertEqual(self.ticks, [9, 8, 7, 6, 5, 4, 3, 2, 1, 0])
+        # Allarme a 3 secondi dalla fine e countdown 5..1
+        self.assertEqual(self.allarms, [7, 8, 9, 9, 10, 11])
+        self.assertEqual(self.timer.get_stats()["expiry_drift_ms"], 0)
+
+    def test_pause_resume_and_add_time(self):
+        self.timer.start()
+        self.clock.advance(Timer.START_DELAY + 4)
+        self.assertEqual(self.timer.pause(), 6)
+        self.clock.advance(100)
+        self.assertEqual(self.timer.resume(), 6)
+        self.timer.add_time(5)
+        self.clock.advance(10.5)
+        self.assertEqual(self.expired, [])
+        self.clock.advance(1)
+        self.assertEqual(self.expired, [Timer.START_DELAY + 4 + 100 + 11])
+
+    def test_end_cancels_expiry(self):
+        self.timer.start()
+        self.clock.advance(5)
+        self.timer.end()
+        self.clock.advance(60)
+        self.assertEqual(self.expired, [])
+        self.assertEqual(self.clock.scheduler().pending, 0)
+
+
+class TimerBackdatingTest(unittest.TestCase):
+    def setUp(self):
+        self.timer = Timer(60, 5, lambda: None, lambda: None, lambda *args: None)
+
+    def tearDown(self):
+        self.timer.end()
+
+    def test_pause_and_resume_at_past_instants(self):
+        now = time.monotonic()
+        # Turno iniziato 5 secondi fa: il tempo scorre da 3 secondi (START_DELAY = 2)
+        self.timer.start(at=now - 5)
+        # Tiro iniziato 1 secondo fa: quel secondo viene restituito
+        self.assertAlmostEqual(self.timer.pause(at=now - 1), 58, delta=0.05)
+        self.assertAlmostEqual(
+            self.timer.resume(at=time.monotonic() - 0.5), 57.5, delta=0.05
+        )
+
+    def test_pause_not_before_resume(self):
+        self.timer.start(at=time.monotonic() - 3)
+        self.timer.pause()
+        self.timer.resume()
+        # L'istante della pausa precede la ripresa: nessun tempo da restituire
+        remaining = self.timer.pause(at=time.monotonic() - 10)
+        self.assertAlmostEqual(remaining, 59, delta=0.05)
+
+
+class TimerWakeupTest(unittest.TestCase):
+    def setUp(self):
+        self.scheduler = TimerScheduler("TimerWakeupTest")
+        self.expired = Event()
+        self.ticks = []
+        self.allarms = []
+        self.timer = Timer(
+            2.5,
+            2,
+            self.expired.set,
+            lambda: self.allarms.append(time.monotonic()),
+            lambda remaining, running: self.ticks.append(remaining),
+            scheduler=self.scheduler,
+        )
+
+    def tearDown(self):
+        self.timer.end()
+        self.scheduler.stop()
+
+    def test_wakes_only_for_events(self):
+        start = time.monotonic()
+        # Il tempo scorre da subito: countdown 3 a 0, allarme e countdown 2 a 0.5, tick a 1.0,
+        # countdown 1 a 1.5, tick a 2.0 e scadenza a 2.5
+        self.timer.start(at=start - Timer.START_DELAY)
+        self.assertTrue(self.expired.wait(5))
+        elapsed = time.monotonic() - start
+
+        self.assertAlmostEqual(elapsed, 2.5, delta=0.1)
+        stats = self.timer.get_stats()
+        self.assertEqual(stats["wakeups"], 6)
+        self.assertLess(stats["expiry_drift_ms"], 50)
+        self.assertEqual(len(self.ticks), 2)
+        self.assertEqual(len(self.allarms), 4)
+        self.assertEqual(self.timer.remaining_time, 0)
 
 
 if __name__ == "__main__":
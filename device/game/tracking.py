@@ -0,0 +1,178 @@
+from collections import deque
+from dataclasses import dataclass, field
+
+import numpy as np
+
+
+@dataclass
+class BallTrack:
+    """Traccia di una biglia: posizioni recenti, velocità e ultimo rilevamento."""
+
+    id: int
+    position: np.ndarray  # (x, y) in coordinate della ROI
+    last_seen: float  # Timestamp dell'ultimo frame in cui la biglia è stata rilevata
+    velocity: np.ndarray = field(default_factory=lambda: np.zeros(2))
+    # Pixel al secondo, None finché la traccia è più giovane della finestra della velocità
+    speed: float | None = None
+    history: deque = field(default_factory=deque)  # (timestamp, x, y)
+
+
+class BallTracker:
+    """
+    Segue i centroidi delle biglie da un frame all'altro e stima la loro velocità.
+
+    Ogni nuovo centroide viene associato alla traccia più vicina alla posizione prevista
+    (posizione + velocità per il tempo trascorso), in ordine di distanza crescente; i centroidi
+    rimasti senza traccia ne aprono una nuova. La velocità è lo spostamento nell'ultima finestra
+    di speed_window secondi, meno sensibile al tremolio dei centroidi di quella tra due frame.
+    Una traccia non rilevata per più di max_missing secondi (biglia in buca o coperta) viene
+    eliminata; fino ad allora conserva l'ultima velocità.
+
+    Le biglie sono ferme quando tutte le tracce hanno velocità nota sotto stop_speed da almeno
+    stop_dwell secondi. Centroidi che tremano più di stop_speed, o macchie che spariscono e
+    ricompaiono aprendo sempre nuove tracce, possono non risultare mai ferme: per questo il
+    VideoConsumer, dopo fallback_timeout secondi in cui il debounce vede il tavolo fermo,
+    dichiara comunque l'arresto.
+
+    Attributi:
+        stop_speed (float): Velocità sotto cui una biglia è ferma, in pixel al secondo.
+        stop_dwell (float): Secondi in cui tutte le biglie devono restare ferme.
+        speed_window (float): Secondi su cui viene misurata la velocità.
+        max_distance (float): Distanza massima, in pixel, tra posizione prevista e centroide.
+        max_missing (float): Secondi dopo cui una traccia non rilevata viene eliminata.
+        fallback_timeout (float): Secondi di debounce fermo dopo cui l'arresto viene dichiarato
+            anche se il tracker non vede tutte le biglie ferme.
+        tracks (list of BallTrack): Tracce correnti.
+        stopped_since (float): Timestamp da cui tutte le biglie sono ferme, None se qualcuna si muove.
+    """
+
+    STOP_SPEED = 10.0
+    STOP_DWELL = 0.15
+    SPEED_WINDOW = 0.1
+    MAX_DISTANCE = 40.0
+    MAX_MISSING = 0.3
+    FALLBACK_TIMEOUT = 3.0
+
+    def __init__(
+        self,
+        stop_speed=STOP_SPEED,
+        stop_dwell=STOP_DWELL,
+        speed_window=SPEED_WINDOW,
+        max_distance=MAX_DISTANCE,
+        max_missing=MAX_MISSING,
+        fallback_timeout=FALLBACK_TIMEOUT,
+    ):
+        self.stop_speed = stop_speed
+        self.stop_dwell = stop_dwell
+        self.speed_window = speed_window
+        self.max_distance = max_distance
+        self.max_missing = max_missing
+        self.fallback_timeout = fallback_timeout
+        self._next_id = 1
+        self.clear()
+
+    @classmethod
+    def from_options(cls, options: dict):
+        """
+        Crea il tracker con le opzioni del rilevatore di un tavolo (TablePreset.detector):
+        stop_speed, stop_dwell e tracking_timeout (fallback_timeout). Il tracciamento va
+        attivato con "tracking": true, altrimenti restituisce None.
+        """
+        if not options.get("tracking", False):
+            return None
+        return cls(
+            stop_speed=float(options.get("stop_speed", cls.STOP_SPEED)),
+            stop_dwell=float(options.get("stop_dwell", cls.STOP_DWELL)),
+            fallback_timeout=float(
+                options.get("tracking_timeout", cls.FALLBACK_TIMEOUT)
+            ),
+        )
+
+    def clear(self):
+        """Elimina tutte le tracce."""
+        self.tracks = []
+        self.stopped_since = None
+
+    def update(self, centroids, timestamp):
+        """
+        Aggiorna le tracce con i centroidi delle biglie di un frame.
+
+        Args:
+            centroids (np.ndarray): Centroidi (x, y) delle biglie, forma (N, 2).
+            timestamp (float): Tempo di acquisizione del frame, in secondi.
+        """
+        centroids = np.asarray(centroids, dtype=np.float64).reshape((-1, 2))
+        matched_tracks, matched_centroids = self._associate(centroids, timestamp)
+        for track_index, centroid_index in zip(matched_tracks, matched_centroids):
+            self._move(self.tracks[track_index], centroids[centroid_index], timestamp)
+        for index in set(range(len(centroids))) - set(matched_centroids):
+            track = BallTrack(self._next_id, centroids[index], timestamp)
+            track.history.append((timestamp, *centroids[index]))
+            self._next_id += 1
+            self.tracks.append(track)
+        self.tracks = [
+            track
+            for track in self.tracks
+            if timestamp - track.last_seen <= self.max_missing
+        ]
+
+        stopped = bool(self.tracks) and all(
+            track.speed is not None and track.speed < self.stop_speed
+            for track in self.tracks
+        )
+        if not stopped:
+            self.stopped_since = None
+        elif self.stopped_since is None:
+            self.stopped_since = timestamp
+
+    def _associate(self, centroids, timestamp):
+        """Coppie (traccia, centroide) più vicine, entro la distanza massima."""
+        if not self.tracks or not len(centroids):
+            return [], []
+        predicted = np.array(
+            [
+                track.position + track.velocity * (timestamp - track.last_seen)
+                for track in self.tracks
+            ]
+        )
+        distances = np.linalg.norm(
+            predicted[:, None, :] - centroids[None, :, :], axis=2
+        )
+        used_tracks, used_centroids = [], []
+        for flat_index in np.argsort(distances, axis=None):
+            track_index, centroid_index = np.unravel_index(flat_index, distances.shape)
+            if distances[track_index, centroid_index] > self.max_distance:
+                break
+            if track_index in used_tracks or centroid_index in used_centroids:
+                continue
+            used_tracks.append(int(track_index))
+            used_centroids.append(int(centroid_index))
+        return used_tracks, used_centroids
+
+    def _move(self, track: BallTrack, position, timestamp):
+        """Aggiunge una posizione alla traccia e ne ricalcola la velocità."""
+        history = track.history
+        history.append((timestamp, *position))
+        # Si tiene una sola posizione più vecchia della finestra, da cui misurare lo spostamento
+        while len(history) > 2 and history[1][0] <= timestamp - self.speed_window:
+            history.popleft()
+        reference_time, x, y = history[0]
+        elapsed = timestamp - reference_time
+        if elapsed >= self.speed_window:
+            track.velocity = (position - (x, y)) / elapsed
+            track.speed = float(np.linalg.norm(track.velocity))
+        track.position = position
+        track.last_seen = timestamp
+
+    def all_stopped(self, timestamp) -> bool:
+        """True se tutte le biglie sono ferme da almeno stop_dwell secondi."""
+        return (
+            self.stopped_since is not None
+            and timestamp - self.stopped_since >= self.stop_dwell
+        )
+
+    @property
+    def max_speed(self):
+        """Velocità della biglia più veloce, None se nessuna traccia ha una velocità nota."""
+        speeds = [track.speed for track in self.tracks if track.speed is not None]
+        return max(speeds) if speeds else None
@@ -0,0 +1,58 @@
+import unittest
+
+from device.game.tracking import BallTracker
+
+
+class BallTrackerTest(unittest.TestCase):
+    def setUp(self):
+        self.tracker = BallTracker(stop_speed=10, stop_dwell=0.15, speed_window=0.1)
+
+    def test_association_and_speed(self):
+        for i in range(10):
+            t = i / 30
+            # Due biglie che si incrociano in verticale: la previsione le tiene distinte
+            self.tracker.update([(100 + 90 * t, 50), (200, 60 + 60 * t)], t)
+        first, second = self.tracker.tracks
+        self.assertEqual((first.id, second.id), (1, 2))
+        self.assertAlmostEqual(first.speed, 90, places=5)
+        self.assertAlmostEqual(second.speed, 60, places=5)
+        self.assertAlmostEqual(self.tracker.max_speed, 90, places=5)
+
+    def test_stop_after_dwell(self):
+        t = 0.0
+        for _ in range(10):
+            self.tracker.update([(100 + 60 * t, 50)], t)
+            t += 1 / 30
+        self.assertIsNone(self.tracker.stopped_since)
+        position = 100 + 60 * t
+        stopped = None
+        while stopped is None and t < 2:
+            self.tracker.update([(position, 50)], t)
+            if self.tracker.all_stopped(t):
+                stopped = t
+            t += 1 / 30
+        self.assertIsNotNone(stopped)
+        # Finestra della velocità più dwell, arrotondati al frame successivo
+        self.assertLess(stopped - 10 / 30, 0.1 + 0.15 + 2 / 30)
+
+    def test_missing_track_blocks_stop_until_dropped(self):
+        for i in range(10):
+            self.tracker.update([(100, 50), (200 + 3 * i, 50)], i / 30)
+        # La biglia veloce sparisce (in buca): conta come in moto finché non viene eliminata
+        self.tracker.update([(100, 50)], 11 / 30)
+        self.assertEqual(len(self.tracker.tracks), 2)
+        self.assertIsNone(self.tracker.stopped_since)
+        self.tracker.update([(100, 50)], 11 / 30 + 0.5)
+        self.assertEqual(len(self.tracker.tracks), 1)
+        self.assertIsNotNone(self.tracker.stopped_since)
+
+    def test_opt_in_from_options(self):
+        self.assertIsNone(BallTracker.from_options({}))
+        self.assertIsNone(BallTracker.from_options({"tracking": False}))
+        tracker = BallTracker.from_options({"tracking": True, "stop_dwell": 0.3})
+        self.assertEqual(tracker.stop_dwell, 0.3)
+        self.assertEqual(tracker.fallback_timeout, BallTracker.FALLBACK_TIMEOUT)
+
+
+if __name__ == "__main__":
+    unittest.main()
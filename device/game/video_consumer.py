@@ -1,12 +1,19 @@
+from collections import deque
 from threading import Event, Thread
 import time
+import tracemalloc
 import cv2
-import numpy as np
 import logging
-from device.video_producer import VideoProducer
+from device.video_producer import Frame, VideoProducer
 from device.table import TablePreset
+from device.game.clock import SYSTEM_CLOCK, Clock
+from device.game.detection import DetectionContext, PackedMaskHistory
+from device.game.frame_rate import AdaptiveFrameRate
+from device.game.motion_engines import MOTION_ENGINES
+from device.game.tracking import BallTracker
+from device.debug_frames import DebugFrames
 from device.utils import CircularArray
-from device.utils import is_raspberry_pi
+from device.utils import is_headless, is_raspberry_pi
 
 
 class VideoConsumer:
@@ -14,49 +21,247 @@ class VideoConsumer:
     VideoConsumer riconosce il movimento delle biglie da gioco.
     Viene eseguito in un thread separato e utilizza un meccanismo di debounce
     per evitare falsi positivi dovuti a variazioni troppo rapide.
+
+    Tutta la pipeline lavora sulla regione rettangolare (ROI) che contiene il poligono del tavolo,
+    calcolata una sola volta per TablePreset: le maschere hanno le dimensioni della ROI e vengono
+    riportate alle coordinate del frame solo per la visualizzazione di debug.
+    ROI, maschera del poligono e limiti di colore fanno parte di un DetectionContext precompilato.
+    Se il preset lo richiede (TablePreset.detector["preallocate"]) le immagini intermedie
+    vengono scritte nei buffer preallocati del DetectionWorkspace del contesto.
+    Le ultime maschere delle biglie sono conservate compresse a un bit per pixel
+    (PackedMaskHistory), che calcola una sola nuova differenza per frame.
+
+    La frequenza di elaborazione è adattiva (AdaptiveFrameRate): massima durante il movimento,
+    minima quando il tavolo resta fermo.
+
+    Un prefiltro sulle miniature della ROI (ChangeGate) salta la pipeline completa per i frame
+    invariati, riusando la maschera precedente.
+
+    Il punteggio di movimento di ogni frame è calcolato dal motore scelto per il tavolo
+    (TablePreset.detector["engine"], vedi motion_engines): quello predefinito, "color", usa
+    le maschere delle biglie descritte sopra.
+    Con TablePreset.detector["tracking"] = true, se il motore rileva le singole biglie, durante
+    il movimento i loro centroidi vengono tracciati (BallTracker) e l'arresto viene dichiarato
+    quando tutte le biglie sono ferme da stop_dwell secondi, senza attendere il debounce; se il
+    tracker non le vede ferme, decide il debounce dopo fallback_timeout secondi di tavolo fermo.
+
+    Le soglie del rilevatore hanno i valori delle costanti della classe, ma si possono cambiare
+    per tavolo con le chiavi di TABLE_OPTIONS in TablePreset.detector (ad esempio con i valori
+    trovati da python -m device tune).
+
+    Le immagini di debug vengono mostrate in finestre OpenCV solo fuori dal Raspberry Pi e
+    fuori dalla modalità headless (config VIDEO/Headless o opzione --headless). In ogni caso
+    possono essere pubblicate su debug_frames, a frequenza limitata e solo se un client le
+    richiede.
     """
 
-    NUMBER_OF_MOTION_COUNT = 10
+    NUMBER_OF_MOTION_COUNT = 10  # Finestra minima del debounce, in frame
+    MOTION_WINDOW_SECONDS = (
+        0.9  # Durata predefinita della finestra alla frequenza massima
+    )
+    MOTION_RATIO = (
+        0.9  # Frazione della finestra con movimento per considerare le biglie in moto
+    )
     CURRENT_MOTION_THRESHOLD = 100  # Soglia per considerare che vi sia movimento
+    # Frequenza a cui è tarata CURRENT_MOTION_THRESHOLD: a frequenze più alte una biglia si sposta
+    # meno tra due frame e la soglia viene ridotta in proporzione, fino a MIN_THRESHOLD_SCALE
+    REFERENCE_FPS = 11
+    MIN_THRESHOLD_SCALE = 0.3
     CIRCULARITY_THRESHOLD = 0.7  # Soglia per filtrare contorni non circolari
     H_DIFF, S_DIFF, V_DIFF = 5, 10, 5  # Differenze per il filtro colore in HSV
+    FRAME_TIMEOUT = 0.5  # Attesa massima di un nuovo frame, in secondi
+    # Frazione di CURRENT_MOTION_THRESHOLD oltre cui un frame alza la frequenza del rilevatore
+    ACTIVITY_RATIO = 0.5
+    # Chiavi di TablePreset.detector che sostituiscono per un tavolo le costanti della classe
+    TABLE_OPTIONS = {
+        "motion_threshold": "CURRENT_MOTION_THRESHOLD",
+        "circularity": "CIRCULARITY_THRESHOLD",
+        "hsv_diff": ("H_DIFF", "S_DIFF", "V_DIFF"),
+        "min_motion_count": "NUMBER_OF_MOTION_COUNT",
+        "motion_ratio": "MOTION_RATIO",
+    }
 
     def __init__(
         self,
         table: TablePreset,
         start_movement_callback,
         stop_movement_callback,
-        video_producer: VideoProducer,
+        video_producer: VideoProducer | None,
+        detection_context: DetectionContext | None = None,
+        headless: bool | None = None,
+        clock: Clock | None = None,
+        threaded: bool = True,
     ):
         """
         Inizializza il VideoConsumer.
 
         Args:
             table (TablePreset): Preset del tavolo contenente punti e colori.
-            start_movement_callback (callable): Funzione chiamata al rilevamento del movimento.
-            stop_movement_callback (callable): Funzione chiamata al passaggio allo stato fermo.
-            video_producer (VideoProducer): Istanza del produttore video.
+            start_movement_callback (callable): Funzione chiamata al rilevamento del movimento,
+                con il tempo di acquisizione (time.monotonic) del primo frame in moto della
+                finestra del debounce che lo ha confermato.
+            stop_movement_callback (callable): Funzione chiamata al passaggio allo stato fermo,
+                con il tempo di acquisizione del primo frame in cui le biglie erano ferme.
+            video_producer (VideoProducer): Istanza del produttore video (None se threaded è
+                False).
+            detection_context (DetectionContext): Contesto già compilato per table (Opzionale).
+            headless (bool): Se True non apre finestre di debug e non legge la tastiera
+                (Opzionale, predefinito dalla configurazione).
+            clock (Clock): Orologio da cui leggere il tempo (Opzionale, tempo reale). I tempi di
+                acquisizione dei frame vengono invece dal VideoProducer.
+            threaded (bool): Se False non avvia il thread del ciclo di elaborazione: i frame già
+                letti (es. da un video registrato) vengono elaborati con process_frame().
         """
         self.table = table
+        self._context = (
+            detection_context
+            if detection_context is not None and detection_context.matches(table)
+            else self.compile_context(table)
+        )
         self.start_movement_callback = start_movement_callback
         self.stop_movement_callback = stop_movement_callback
         self._video_producer = video_producer
+        self._clock = clock if clock is not None else SYSTEM_CLOCK
 
         self._is_running = Event()
         self._is_running.clear()
         self._end_event = Event()
 
-        self._thread = Thread(target=self.run, name="VideoConsumerThread")
-        self._thread.daemon = False  # Non è daemon per garantire una chiusura ordinata
-        self._thread.start()
-
         self._last_state_change_time = 0  # Tempo dell'ultimo cambio di stato
-        self._prev_frame_time = 0
-        self._current_fps = 0
-        self._is_raspberry_pi = is_raspberry_pi()
+        self._frame_rate = AdaptiveFrameRate()
+        self._last_motion_score = 0
+        self.headless = is_headless() if headless is None else headless
+        self._show_windows = not self.headless and not is_raspberry_pi()
+        self.debug_frames = DebugFrames()
+        self._debug_images = None  # Immagini di debug raccolte nel frame corrente
+        self._frames_processed = 0
+        self._processing_time = 0.0
+        self._last_frame_reallocations = 0
+        self._last_frame_peak_bytes = None
+        self._balls_mask_history = PackedMaskHistory(3)
+        self._engine = MOTION_ENGINES[self._context.engine_name](self, self._context)
+        self._tracker = BallTracker.from_options(self._context.table.detector)
+        self._motion_history = CircularArray(self.motion_window())
+        # Tempo di acquisizione ed esito dei frame nella finestra del debounce
+        self._motion_times = deque(maxlen=self.motion_window())
+        self._is_moving = False
+        self._last_motion = False  # Esito dell'ultimo frame (movimento o no)
+        self._motion_onset = None  # Tempo del primo frame con l'esito attuale
+        # Tempo del primo frame da cui il debounce vede il tavolo fermo, durante il movimento
+        self._debounce_stopped_since = None
+        self._tracking_fallbacks = 0
+        self._start_latency = None
+        self._stop_latency = None
+
+        self._thread = None
+        if threaded:
+            self._thread = Thread(target=self.run, name="VideoConsumerThread")
+            self._thread.daemon = (
+                False  # Non è daemon per garantire una chiusura ordinata
+            )
+            self._thread.start()
+
+    @classmethod
+    def table_option(cls, table: TablePreset, key):
+        """
+        Soglia del rilevatore per table: TablePreset.detector[key] se presente, altrimenti
+        la costante (o le costanti) della classe indicata da TABLE_OPTIONS[key].
+        """
+        if key in table.detector:
+            return table.detector[key]
+        names = cls.TABLE_OPTIONS[key]
+        if isinstance(names, tuple):
+            return tuple(getattr(cls, name) for name in names)
+        return getattr(cls, names)
+
+    @classmethod
+    def compile_context(cls, table: TablePreset) -> DetectionContext:
+        """Compila il DetectionContext di table con le tolleranze di colore del VideoConsumer."""
+        return DetectionContext(table, cls.table_option(table, "hsv_diff"))
+
+    def set_table(self, table: TablePreset):
+        """Aggiorna il preset del tavolo, ricompilando il contesto solo se il preset è cambiato."""
+        if not self._context.matches(table):
+            self._context = self.compile_context(table)
+        self.table = table
+
+    def get_stats(self):
+        """
+        Statistiche dei tempi del rilevatore.
+        context_build_ms è il tempo totale speso a compilare il contesto (limiti di colore e
+        maschera del poligono), context_builds il numero di compilazioni. context_rebuild_ms è
+        il costo, misurato alla compilazione, di ricalcolarli per un frame; context_saved_ms il
+        tempo risparmiato sui frame elaborati, al netto delle compilazioni.
+        Con i buffer preallocati riporta anche la memoria del workspace, le immagini che
+        OpenCV ha dovuto allocare nell'ultimo frame (0 a regime) e, se tracemalloc è attivo,
+        il picco di memoria allocata durante l'elaborazione dell'ultimo frame.
+        Le voci gate_* riportano quanti frame il prefiltro ha esaminato e saltato.
+        Le voci engine_* riportano il costo per frame del motore di rilevamento; start_latency
+        e stop_latency sono i secondi, in tempo di acquisizione, tra il primo frame con il
+        nuovo stato e il frame in cui il debounce lo ha confermato (ultimo avvio e arresto).
+        """
+        frames = self._frames_processed
+        context = self._context
+        workspace = context.workspace
+        gate = context.gate
+        return {
+            "frames": frames,
+            "avg_frame_ms": self._processing_time * 1000 / frames if frames else 0.0,
+            "fps": self._frame_rate.effective_fps,
+            "target_fps": self._frame_rate.target_fps,
+            "min_fps": self._frame_rate.min_fps,
+            "max_fps": self._frame_rate.max_fps,
+            "context_build_ms": context.build_time * 1000,
+            "context_builds": context.builds,
+            "context_rebuild_ms": context.rebuild_time * 1000,
+            "context_saved_ms": max(
+                0.0, (context.rebuild_time * frames - context.build_time) * 1000
+            ),
+            "preallocate": context.preallocate,
+            "workspace_bytes": workspace.nbytes if workspace is not None else 0,
+            "workspace_allocations": (
+                workspace.allocations if workspace is not None else 0
+            ),
+            "last_frame_reallocations": self._last_frame_reallocations,
+            "last_frame_peak_bytes": self._last_frame_peak_bytes,
+            "mask_history_bytes": self._balls_mask_history.nbytes,
+            "gate_threshold": gate.threshold if gate is not None else None,
+            "gate_checked": gate.checked if gate is not None else 0,
+            "gate_skipped": gate.skipped if gate is not None else 0,
+            "gate_skip_ratio": gate.skip_ratio if gate is not None else 0.0,
+            "gate_last_difference": gate.last_difference if gate is not None else None,
+            "engine": self._engine.name,
+            "engine_frames": self._engine.frames,
+            "engine_avg_ms": self._engine.avg_ms,
+            "engine_last_ms": self._engine.last_time * 1000,
+            "engine_threshold": self._engine.threshold(),
+            "last_motion_score": self._last_motion_score,
+            "start_latency": self._start_latency,
+            "stop_latency": self._stop_latency,
+            "tracking": self._tracker is not None,
+            "tracked_balls": len(self._tracker.tracks) if self._tracker else 0,
+            "max_ball_speed": self._tracker.max_speed if self._tracker else None,
+            "tracking_fallbacks": self._tracking_fallbacks,
+        }
+
+    def motion_window(self):
+        """
+        Numero di frame della finestra del debounce per il tavolo corrente.
+        Il valore predefinito copre MOTION_WINDOW_SECONDS alla frequenza massima del rilevatore,
+        che è quella usata durante il movimento. Si può cambiare per tavolo con
+        TablePreset.detector["motion_window"]: la somma della finestra è mantenuta in modo
+        incrementale, quindi il costo per frame non dipende dalla sua lunghezza.
+        """
+        table = self._context.table
+        default = max(
+            int(self.table_option(table, "min_motion_count")),
+            round(self.MOTION_WINDOW_SECONDS * self._frame_rate.max_fps),
+        )
+        return int(table.detector.get("motion_window", default))
 
     def start(self):
-        """Avvia il ciclo di elaborazione del video."""
+        """Avvia il ciclo di elaborazione del video, alla frequenza massima."""
+        self._frame_rate.boost(now=self._clock.monotonic())
         self._is_running.set()
 
     def pause(self):
@@ -72,51 +277,133 @@ class VideoConsumer:
         if self._thread and self._thread.is_alive():
             self._end_event.set()
 
+    def join(self, timeout=None) -> bool:
+        """
+        Attende, dopo end(), la fine del thread del ciclo di elaborazione.
+
+        Returns:
+            bool: False se timeout è scaduto prima.
+        """
+        if self._thread is None:
+            return True
+        self._thread.join(timeout)
+        return not self._thread.is_alive()
+
     def run(self):
         """
         Ciclo principale del VideoConsumer.
-        - Acquisisce il frame, applica i filtri e aggiorna il buffer dei frame.
-        - Calcola il movimento tramite confronto tra 3 frame.
-        - Rileva lo stato di movimento basandosi sulla storia recente del movimento.
-        - Notifica i cambiamenti di stato attraverso i callback appropriati.
+        - Attende un frame nuovo alla frequenza scelta da AdaptiveFrameRate.
+        - Lo elabora con process_frame(), che notifica i cambiamenti di stato.
         """
-        balls_mask_history = CircularArray(3)
-        motion_history = CircularArray(self.NUMBER_OF_MOTION_COUNT)
-        isMoving = False
-        frame_count = 0
-        fps_update_interval = 10
+        last_seq = 0
+        last_timestamp = None
+        frame_rate = self._frame_rate
 
         while self._video_producer.is_opened() and not self._end_event.is_set():
-            time.sleep(1 / 11)
-
-            # Calcola gli FPS per il debug
-            current_time = time.time()
-            if self._prev_frame_time != 0:
-                self._current_fps = 1 / (current_time - self._prev_frame_time)
-                frame_count += 1
-                if frame_count >= fps_update_interval:
-                    # logging.info(f"FPS: {self._current_fps:.2f}")
-                    frame_count = 0
-            self._prev_frame_time = current_time
+            # Attende quanto serve per rispettare la frequenza scelta da AdaptiveFrameRate
+            delay = frame_rate.delay(now=self._clock.monotonic())
+            if delay > 0 and self._end_event.wait(delay):
+                break
 
             if not self._is_running.is_set():
-                balls_mask_history = CircularArray(3)
-                motion_history = CircularArray(self.NUMBER_OF_MOTION_COUNT)
+                self._reset_motion()
+                frame_rate.reset_timing()
+                last_timestamp = None
+                self._is_running.wait(self.FRAME_TIMEOUT)
                 continue
 
-            self._last_state_change_time = time.time()
-            blurred = self._video_producer.get_frame_blurred()
-            self._show_blurred_image(blurred)
-            hsv = cv2.cvtColor(blurred, cv2.COLOR_BGR2HSV)
-            current_balls_mask = self._create_mask(
-                hsv, self.table.points, self.table.colors, self.table.min_area_threshold
+            # Attende un frame più recente dell'ultimo elaborato, senza rielaborare duplicati
+            frame = self._video_producer.wait_for_frame(
+                after_seq=last_seq, timeout=self.FRAME_TIMEOUT
             )
-            balls_mask_history.add(current_balls_mask)
-
-            if balls_mask_history.get_len() == 3:
-                current_motion = self._motion_count(balls_mask_history.get_array())
-                motion_history.add(current_motion)
+            if frame is None:
+                continue
+            last_seq = frame.seq
+            frame_interval = (
+                frame.timestamp - last_timestamp if last_timestamp is not None else None
+            )
+            last_timestamp = frame.timestamp
+            frame_rate.frame_started(now=self._clock.monotonic())
+            self.process_frame(frame, frame_interval)
+
+    def _reset_motion(self):
+        """Dimentica i frame precedenti, come dopo una pausa."""
+        self._engine.reset()
+        self._motion_history.clear()
+        self._motion_times.clear()
+        self._last_motion = False
+        self._debounce_stopped_since = None
+        if self._tracker is not None:
+            self._tracker.clear()
+        if self._context.gate is not None:
+            self._context.gate.reset()
+
+    def process_frame(self, frame: Frame, frame_interval=None):
+        """
+        Elabora un frame e lo rilascia. Chiamata dal ciclo di elaborazione, o direttamente se il
+        VideoConsumer è stato creato con threaded=False.
+        - Calcola il punteggio di movimento con il motore scelto per il tavolo.
+        - Rileva lo stato di movimento basandosi sulla storia recente del movimento.
+        - Notifica i cambiamenti di stato attraverso i callback appropriati.
 
+        Args:
+            frame (Frame): Frame da elaborare.
+            frame_interval (float): Secondi dal frame elaborato in precedenza (Opzionale).
+        """
+        self._last_state_change_time = self._clock.time()
+        processing_start = time.perf_counter()
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            start_memory, _ = tracemalloc.get_traced_memory()
+            tracemalloc.reset_peak()
+        context = self._context
+        engine = self._engine
+        if engine.context is not context:
+            # Il preset del tavolo è cambiato: nuovo motore con le nuove opzioni
+            engine = self._engine = MOTION_ENGINES[context.engine_name](self, context)
+            self._tracker = BallTracker.from_options(context.table.detector)
+        self._debug_images = {} if self.debug_frames.wanted() else None
+        with frame:
+            context.ensure_shape(frame.image.shape[:2])
+            workspace = context.workspace
+            if workspace is not None:
+                reallocations = workspace.reallocations
+            # Il prefiltro sulle miniature decide se serve elaborare il frame;
+            # senza frame precedenti a cui riferirsi il frame va comunque elaborato
+            changed = (
+                context.gate is None
+                or context.gate.changed(frame.crop(context.roi))
+                or not engine.ready
+            )
+            if changed:
+                engine_start = time.perf_counter()
+                engine.read_frame(frame, context)
+        if changed:
+            score = engine.motion_score(context, frame_interval)
+            engine.record(time.perf_counter() - engine_start)
+        else:
+            score = engine.unchanged()
+
+        if score is not None:
+            motion_history = self._motion_history
+            if motion_history.size != self.motion_window():
+                # Il preset del tavolo ha cambiato la finestra del debounce
+                motion_history = self._motion_history = CircularArray(
+                    self.motion_window()
+                )
+                self._motion_times = deque(maxlen=motion_history.size)
+            self._last_motion_score = score
+            threshold = engine.threshold(frame_interval)
+            current_motion = score > threshold
+            if current_motion != self._last_motion:
+                # Primo frame di un nuovo stato: da qui si misura la latenza del rilevamento
+                self._last_motion = current_motion
+                self._motion_onset = frame.timestamp
+            motion_history.add(current_motion)
+            self._motion_times.append((frame.timestamp, current_motion))
+            tracker = self._tracking(engine, frame.timestamp, current_motion)
+
+            if self._show_windows:
                 # Codice per bloccare le schermate di debug
                 key = cv2.waitKey(1)
                 if key == ord("p"):
@@ -124,122 +411,193 @@ class VideoConsumer:
                         pass
                 #########################################################
 
-                if motion_history.get_len() == self.NUMBER_OF_MOTION_COUNT:
-                    history = motion_history.get_array()
-                    motion_count = sum(history)
-                    if motion_count > self.NUMBER_OF_MOTION_COUNT * 0.9:
-                        new_motion_state = True
-                    else:
+            if motion_history.is_full():
+                debounce_moving = (
+                    motion_history.get_sum()
+                    > motion_history.size
+                    * float(self.table_option(context.table, "motion_ratio"))
+                )
+                if debounce_moving or not self._is_moving:
+                    self._debounce_stopped_since = None
+                elif self._debounce_stopped_since is None:
+                    self._debounce_stopped_since = frame.timestamp
+                if self._is_moving and tracker is not None:
+                    # Con le biglie tracciate l'arresto è deciso dalle loro velocità: non
+                    # conta il movimento di mani e stecca, e una biglia lenta non è ferma
+                    new_motion_state = not tracker.all_stopped(frame.timestamp)
+                    if not new_motion_state:
+                        self._motion_onset = tracker.stopped_since
+                        # La finestra del debounce è piena del movimento appena finito
+                        motion_history.clear()
+                        self._motion_times.clear()
+                    elif (
+                        self._debounce_stopped_since is not None
+                        and frame.timestamp - self._debounce_stopped_since
+                        >= tracker.fallback_timeout
+                    ):
+                        # Il tracker non vede le biglie ferme (centroidi che tremano, macchie
+                        # che ricompaiono) ma il tavolo è fermo da tempo: decide il debounce
                         new_motion_state = False
-                    if new_motion_state != isMoving:
-                        isMoving = new_motion_state
-                        if new_motion_state:
-                            logging.info("Movimento rilevato")
-                            self.start_movement_callback()
-                        else:
-                            logging.info("Movimento terminato")
-                            self.stop_movement_callback()
-
-                    self._show_movement_status(blurred, isMoving)
-
-    def _motion_count(self, balls_mask_history):
+                        self._tracking_fallbacks += 1
+                elif debounce_moving:
+                    new_motion_state = True
+                    if not self._is_moving:
+                        # Il movimento è iniziato con il primo frame in moto della finestra
+                        self._motion_onset = next(
+                            timestamp
+                            for timestamp, motion in self._motion_times
+                            if motion
+                        )
+                else:
+                    new_motion_state = False
+                if new_motion_state != self._is_moving:
+                    self._is_moving = new_motion_state
+                    latency = frame.timestamp - self._motion_onset
+                    if new_motion_state:
+                        logging.info("Movimento rilevato")
+                        self._start_latency = latency
+                        self.start_movement_callback(self._motion_onset)
+                    else:
+                        logging.info("Movimento terminato")
+                        self._stop_latency = latency
+                        self.stop_movement_callback(self._motion_onset)
+
+                self._show_movement_status(engine.preview, self._is_moving)
+
+            self._frame_rate.update(
+                self._is_moving or score > threshold * self.ACTIVITY_RATIO,
+                now=self._clock.monotonic(),
+            )
+
+        if self._debug_images:
+            self.debug_frames.publish(self._debug_images)
+        self._debug_images = None
+
+        self._frames_processed += 1
+        self._processing_time += time.perf_counter() - processing_start
+        if workspace is not None:
+            self._last_frame_reallocations = workspace.reallocations - reallocations
+        if tracing:
+            _, peak_memory = tracemalloc.get_traced_memory()
+            self._last_frame_peak_bytes = peak_memory - start_memory
+
+    def _tracking(self, engine, timestamp, current_motion):
+        """
+        Aggiorna il tracciamento delle biglie, solo mentre c'è movimento: a tavolo fermo
+        il tracker viene svuotato e non costa nulla.
+
+        Returns:
+            BallTracker: Il tracker, None se il tracciamento è disattivato, il motore non
+                rileva le singole biglie o non c'è nessuna biglia tracciata.
+        """
+        tracker = self._tracker
+        if tracker is None:
+            return None
+        if not (self._is_moving or current_motion):
+            tracker.clear()
+            return None
+        centroids = engine.centroids()
+        if centroids is None:
+            return None
+        tracker.update(centroids, timestamp)
+        return tracker if tracker.tracks else None
+
+    def motion_threshold(self, frame_interval=None):
+        """
+        Pixel diversi tra due frame consecutivi oltre cui c'è movimento.
+        CURRENT_MOTION_THRESHOLD vale alla frequenza REFERENCE_FPS: con frame più ravvicinati
+        lo spostamento di una biglia è minore e la soglia si riduce in proporzione.
+
+        Args:
+            frame_interval (float): Secondi tra i due frame confrontati, None se non noto.
+        """
+        threshold = float(self.table_option(self._context.table, "motion_threshold"))
+        if frame_interval is None:
+            return threshold
+        scale = min(
+            1.0, max(self.MIN_THRESHOLD_SCALE, frame_interval * self.REFERENCE_FPS)
+        )
+        return threshold * scale
+
+    def _motion_count(self, balls_mask_history: PackedMaskHistory, frame_interval=None):
         """
         Determina se c'è stato movimento tra i frame delle biglie rilevate.
 
         Args:
-            balls_mask_history (list): Array contenente le maschere delle biglie degli ultimi 3 frame.
+            balls_mask_history (PackedMaskHistory): Maschere delle biglie degli ultimi 3 frame,
+                con i pixel diversi tra ogni coppia di frame consecutivi già contati.
+            frame_interval (float): Secondi tra gli ultimi due frame (Opzionale).
 
         Returns:
             bool: True se è stato rilevato movimento, False altrimenti.
         """
-        frame_p2 = balls_mask_history[0]  # Frame -2
-        frame_p1 = balls_mask_history[1]  # Frame -1
-        frame_c = balls_mask_history[2]  # Frame corrente
-
-        # Converti i frame in immagini binarie
-        _, frame_p2 = cv2.threshold(frame_p2, 127, 255, cv2.THRESH_BINARY)
-        _, frame_p1 = cv2.threshold(frame_p1, 127, 255, cv2.THRESH_BINARY)
-        _, frame_c = cv2.threshold(frame_c, 127, 255, cv2.THRESH_BINARY)
-
-        # Calcola le differenze assolute tra frame consecutivi
-        diff1 = cv2.absdiff(frame_p1, frame_p2)
-        diff2 = cv2.absdiff(frame_c, frame_p1)
-
-        white_pixel_frame_d1 = cv2.countNonZero(diff1)
-        white_pixel_frame_d2 = cv2.countNonZero(diff2)
-        max_white_pixel = max(white_pixel_frame_d1, white_pixel_frame_d2)
+        max_white_pixel = max(balls_mask_history.diff_counts())
+        self._last_motion_score = max_white_pixel
 
         # Visualizza i frame differenza per debugging
-        self._show_difference_frames(diff1, diff2)
+        self._show_difference_frames(balls_mask_history)
 
-        return max_white_pixel > self.CURRENT_MOTION_THRESHOLD
+        return max_white_pixel > self.motion_threshold(frame_interval)
 
-    def _create_mask(self, hsv, points, colors, min_area_threshold):
+    def _create_mask(self, hsv, context: DetectionContext):
         """
         Crea una maschera per rilevare le biglie da gioco basata sui colori,
         sulla forma del tavolo e sul valore minimo dell'area delle biglie.
 
         Args:
-            hsv (Mat): Frame in formato HSV.
-            points (list of tuple): Punti (x,y) che definiscono il poligono del tavolo.
-            colors (list of tuple): Lista di colori in formato HSV per il tavolo.
-            min_area_threshold (int): Valore minimo dell'area delle biglie.
+            hsv (Mat): ROI del frame in formato HSV.
+            context (DetectionContext): Contesto precompilato con limiti di colore,
+                maschera del poligono del tavolo e area minima delle biglie.
 
         Returns:
-            Mat: Maschera binaria contenente i contorni delle biglie.
+            Mat: Maschera binaria della ROI contenente i contorni delle biglie.
         """
-        # Definisce l'intervallo di colore basato sui valori minimi e massimi dei colori
-        color_lower = tuple(
-            min(color[i] for color in colors) - diff
-            for i, diff in enumerate([self.H_DIFF, self.S_DIFF, self.V_DIFF])
-        )
-        color_upper = tuple(
-            max(color[i] for color in colors) + diff
-            for i, diff in enumerate([self.H_DIFF, self.S_DIFF, self.V_DIFF])
-        )
-
-        # Crea una maschera rettangolare basata sui punti del tavolo
-        points = np.array(points, dtype=np.int32).reshape((-1, 1, 2))
-        rec_mask = cv2.fillPoly(np.zeros(hsv.shape[:2], dtype=np.uint8), [points], 255)
-
-        # Crea la maschera di colore e la inverte
-        color_mask = cv2.inRange(hsv, color_lower, color_upper)
-        color_mask = cv2.dilate(color_mask, None, iterations=2)
-        color_mask = cv2.bitwise_not(color_mask)
-
-        # Combina la maschera di colore con quella del tavolo
-        combined_mask = cv2.bitwise_and(color_mask, rec_mask)
-
-        # Trova i contorni e filtra per circolarità
-        contours, _ = cv2.findContours(
-            combined_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
-        circularity_mask = np.zeros_like(combined_mask)
-        for c in contours:
-            area = cv2.contourArea(c)
-            # Controllo sulla dimensione dell'area del contorno
-            if area < min_area_threshold:
-                continue
-            perimeter = cv2.arcLength(c, True)
-            if perimeter == 0:
-                continue
-            circularity = 4 * np.pi * area / (perimeter**2)
-            if circularity > self.CIRCULARITY_THRESHOLD:
-                cv2.drawContours(circularity_mask, [c], -1, 255, thickness=cv2.FILLED)
+        workspace = context.workspace
+        circularity = float(self.table_option(context.table, "circularity"))
+        # Maschera di ciò che non ha il colore del panno, limitata al poligono del tavolo
+        combined_mask = context.foreground_mask(hsv, workspace)
+
+        # Filtra le macchie per area e circolarità con il filtro scelto per il tavolo
+        if workspace is None:
+            circularity_mask = context.filter_blobs(
+                combined_mask, context.min_area_threshold, circularity
+            )
+        else:
+            circularity_mask = workspace.check(
+                context.filter_blobs(
+                    combined_mask,
+                    context.min_area_threshold,
+                    circularity,
+                    out=workspace.balls_mask,
+                    workspace=workspace,
+                ),
+                workspace.balls_mask,
+            )
 
         # Visualizza le maschere intermedie per debugging
         self._show_mask_images(combined_mask, circularity_mask)
         return circularity_mask
 
+    def _debugging(self):
+        """True se le immagini di debug del frame corrente vanno mostrate o pubblicate."""
+        return self._show_windows or self._debug_images is not None
+
+    def _debug_output(self, name, image):
+        """Mostra image nella finestra name e/o la raccoglie per debug_frames."""
+        if self._show_windows:
+            cv2.imshow(name, image)
+        if self._debug_images is not None:
+            self._debug_images[name] = image
+
     def _show_blurred_image(self, image):
         """Visualizza l'immagine sfocata per il debug."""
-        if self._is_raspberry_pi:
+        if not self._debugging():
             return
-        cv2.imshow("Blurred", image)
+        self._debug_output("Blurred", image)
 
     def _show_movement_status(self, image, is_moving):
         """Visualizza lo stato del movimento sull'immagine per il debug."""
-        if self._is_raspberry_pi:
+        if not self._debugging():
             return
         test_image = image.copy()
         text = "MOVIMENTO" if is_moving else "FERMO"
@@ -253,18 +611,23 @@ class VideoConsumer:
             2,
             cv2.LINE_AA,
         )
-        cv2.imshow("Blurred with movement", test_image)
+        self._debug_output("Blurred with movement", test_image)
 
-    def _show_difference_frames(self, diff1, diff2):
+    def _show_difference_frames(self, balls_mask_history: PackedMaskHistory):
         """Visualizza i frame di differenza per il debug."""
-        if self._is_raspberry_pi:
+        if not self._debugging():
             return
-        cv2.imshow("Diff1", diff1)
-        cv2.imshow("Diff2", diff2)
+        diff1, diff2 = balls_mask_history.diff_images()
+        self._debug_output("Diff1", self._context.to_frame_coordinates(diff1))
+        self._debug_output("Diff2", self._context.to_frame_coordinates(diff2))
 
     def _show_mask_images(self, combined_mask, circularity_mask):
         """Visualizza le maschere intermedie per il debug."""
-        if self._is_raspberry_pi:
+        if not self._debugging():
             return
-        cv2.imshow("Combined Mask", combined_mask)
-        cv2.imshow("Circularity Mask", circularity_mask)
+        self._debug_output(
+            "Combined Mask", self._context.to_frame_coordinates(combined_mask)
+        )
+        self._debug_output(
+            "Circularity Mask", self._context.to_frame_coordinates(circularity_mask)
+        )
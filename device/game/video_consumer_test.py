@@ -1,8 +1,13 @@
 import unittest
+
+import numpy as np
+
+from device.game.clock import VirtualClock
+from device.game.tracking import BallTracker
 from device.table import TablePreset
 from device.game.video_consumer import VideoConsumer
 from device.utils import hex_to_opencv_hsv
-from device.video_producer import VideoProducer
+from device.video_producer import Frame, VideoProducer
 
 
 class VideoConsumerTest(unittest.TestCase):
@@ -14,18 +19,29 @@ class VideoConsumerTest(unittest.TestCase):
             name="test_table_preset",
             points=[(120, 80), (520, 80), (520, 280), (120, 280)],
             colors=[hex_to_opencv_hsv(color) for color in colors],
+            min_area_threshold=30,
         )
+        self.image = np.zeros((360, 640, 3), np.uint8)
+        self.producer = VideoProducer(frame=self.image, frame_pool_size=0)
+        self.clock = VirtualClock(start=100, epoch=1000)
         self.video_consumer = VideoConsumer(
             self.table,
             self.start_movement_callback,
             self.stop_movement_callback,
-            VideoProducer.get_instance(),
+            self.producer,
+            headless=True,
+            clock=self.clock,
         )
 
-    def start_movement_callback(self):
+    def tearDown(self):
+        self.video_consumer.end()
+        self.video_consumer.join()
+        self.producer.stop()
+
+    def start_movement_callback(self, timestamp):
         print("START MOVEMENT")
 
-    def stop_movement_callback(self):
+    def stop_movement_callback(self, timestamp):
         print("STOP MOVEMENT")
 
     def test_init_video_consumer(self):
@@ -35,6 +51,131 @@ class VideoConsumerTest(unittest.TestCase):
             "new video_consumer is not an instance of VideoConsumer",
         )
 
+    def test_uses_clock(self):
+        self.video_consumer.process_frame(Frame(1, 100.0, self.image))
+        self.assertEqual(self.video_consumer._last_state_change_time, 1100)
+
+    def test_without_thread(self):
+        consumer = VideoConsumer(
+            self.table,
+            self.start_movement_callback,
+            self.stop_movement_callback,
+            None,
+            headless=True,
+            threaded=False,
+        )
+        self.assertIsNone(consumer._thread)
+        consumer.process_frame(Frame(1, 100.0, self.image))
+        self.assertEqual(consumer.get_stats()["frames"], 1)
+        self.assertTrue(consumer.join(0))
+
+
+class ScriptedEngine:
+    """Motore finto: punteggio e centroidi di ogni frame vengono decisi dal test."""
+
+    name = "scripted"
+    ready = True
+    preview = None
+    frames = 0
+    avg_ms = 0.0
+    last_time = 0.0
+
+    def __init__(self, context):
+        self.context = context
+        self.score = 0
+        self.points = []
+
+    def read_frame(self, frame, context):
+        pass
+
+    def motion_score(self, context, frame_interval=None):
+        return self.score
+
+    def record(self, elapsed):
+        pass
+
+    def threshold(self, frame_interval=None):
+        return 0.5
+
+    def centroids(self):
+        return np.array(self.points, dtype=np.float64).reshape((-1, 2))
+
+    def reset(self):
+        pass
+
+
+class TrackingFallbackTest(unittest.TestCase):
+    FPS = 30
+
+    def setUp(self):
+        table = TablePreset(
+            id=0,
+            name="test_table_preset",
+            points=[(0, 0), (63, 0), (63, 35), (0, 35)],
+            colors=[(100, 200, 150)],
+            min_area_threshold=30,
+            detector={"tracking": True, "gate": False},
+        )
+        self.events = []
+        self.consumer = VideoConsumer(
+            table,
+            lambda timestamp: self.events.append(("start", timestamp)),
+            lambda timestamp: self.events.append(("stop", timestamp)),
+            None,
+            headless=True,
+            threaded=False,
+        )
+        self.engine = self.consumer._engine = ScriptedEngine(self.consumer._context)
+        self.image = np.zeros((36, 64, 3), np.uint8)
+        self.seq = 0
+
+    def play(self, frames):
+        """Elabora un frame per ogni (punteggio, centroidi)."""
+        for score, points in frames:
+            self.seq += 1
+            self.engine.score = score
+            self.engine.points = points
+            self.consumer.process_frame(
+                Frame(self.seq, self.seq / self.FPS, self.image), 1 / self.FPS
+            )
+
+    def shot(self):
+        self.play([(1, [(5 + 2 * i, 20)]) for i in range(30)])
+        self.assertEqual([event for event, _ in self.events], ["start"])
+        return self.seq / self.FPS
+
+    def assert_stop_within_timeout(self, settled):
+        self.assertEqual([event for event, _ in self.events], ["start", "stop"])
+        stopped = self.seq / self.FPS
+        self.assertLessEqual(
+            stopped - settled,
+            BallTracker.FALLBACK_TIMEOUT + 2 * self.consumer.motion_window() / self.FPS,
+        )
+        self.assertEqual(self.consumer.get_stats()["tracking_fallbacks"], 1)
+
+    def play_until_stop(self, frames):
+        for frame in frames:
+            self.play([frame])
+            if len(self.events) == 2:
+                return
+
+    def test_jittering_centroid_stops(self):
+        settled = self.shot()
+        # Centroide che trema di 3 pixel: per il tracker la biglia resta sempre in moto
+        self.play_until_stop(
+            (0, [(65 + 3 * (i % 2), 20)]) for i in range(10 * self.FPS)
+        )
+        self.assert_stop_within_timeout(settled)
+
+    def test_flickering_blob_stops(self):
+        settled = self.shot()
+        # Macchia che ricompare ogni volta lontano: apre sempre nuove tracce senza velocità
+        self.play_until_stop(
+            (0, [(5 + 50 * (i % 12), 20)] if i % 2 else [])
+            for i in range(10 * self.FPS)
+        )
+        self.assert_stop_within_timeout(settled)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,358 @@
+"""
+Simulazione accelerata di partite con un orologio virtuale.
+
+Ogni partita è un Game vero, con timer e scheduler, il cui tempo scorre su un VirtualClock e
+quindi avanza istantaneamente. Un copione casuale, riproducibile con il seed, alterna attese
+dei giocatori, tiri (inizio e fine del movimento, con il ritardo del rilevatore), incrementi,
+pause, passaggi manuali del turno e scadenze del tempo. Dopo ogni azione stato del gioco e
+tempo rimanente vengono confrontati con un modello indipendente del turno (ExpectedTurn); le
+differenze vengono raccolte nel report insieme ai contatori dello scheduler e alla velocità
+della simulazione.
+
+Gli eventi di movimento vengono chiamati direttamente sul Game: il rilevatore riceve un
+VideoProducer già fermato e il suo thread termina subito.
+
+Uso:
+    python -m device simulate [--matches 1000] [--turns 40] [--seed 0]
+"""
+
+import contextlib
+import io
+import json
+import random
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from device.game import Game
+from device.game.clock import VirtualClock
+from device.game.ruleset import Ruleset
+from device.game.timer import Timer
+from device.table import TablePreset, load_table_preset
+from device.video_producer import VideoProducer
+
+DEFAULT_RULESET = Ruleset(
+    0,
+    "simulazione",
+    initial_duration=60,
+    turn_duration=35,
+    allarm_time=10,
+    increment_duration=25,
+    max_increment_for_match=1,
+)
+SIMULATION_TABLE = TablePreset(
+    0,
+    "simulazione",
+    points=[(0, 0), (63, 0), (63, 35), (0, 35)],
+    colors=[(100, 200, 200)],
+    min_area_threshold=30,
+)
+
+# Probabilità delle azioni a ogni turno
+INCREMENT_PROBABILITY = 0.05
+PAUSE_PROBABILITY = 0.05
+END_TURN_PROBABILITY = 0.02
+# Frazione di turni in cui il giocatore supera il tempo a disposizione
+TIMEOUT_PROBABILITY = 0.1
+# Ritardo massimo del rilevatore nel riconoscere inizio e fine del movimento, in secondi
+MAX_DETECTION_LATENCY = 1.0
+# Massima differenza ammessa tra il Game e il modello, in secondi
+TOLERANCE = 1e-6
+# Violazioni riportate per esteso nel report
+MAX_REPORTED_VIOLATIONS = 20
+
+
+class SimulatedGame(Game):
+    """
+    Game senza suoni né log periodici: allarmi e aggiornamenti del timer vengono solo contati,
+    le scadenze accettate dal gioco (segnalate dall'allarme finale) registrate con il loro
+    istante.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.allarms = 0
+        self.ticks = 0
+        self.expiries = []
+        self.timers = []
+        super().__init__(*args, **kwargs)
+
+    def _allarm(self, is_final=False):
+        if is_final:
+            self.expiries.append(self.clock.monotonic())
+        else:
+            self.allarms += 1
+
+    def _countdown(self, second):
+        self.allarms += 1
+
+    def _periodic_callback(self, remaining_time, is_timer_running):
+        self.last_remaining_time = remaining_time
+        self.ticks += 1
+
+    def _new_timer(self, duration: int):
+        timer = super()._new_timer(duration)
+        self.timers.append(timer)
+        return timer
+
+
+class ExpectedTurn:
+    """
+    Modello del tempo di un turno, indipendente dal Timer: il tempo scorre da START_DELAY dopo
+    l'inizio del turno e si ferma durante le pause.
+    """
+
+    def __init__(self, start, duration):
+        self.counting_start = start + Timer.START_DELAY
+        # Istante di scadenza, se il turno non è in pausa
+        self.end = self.counting_start + duration
+        self.counting_since = self.counting_start
+        self.paused_at = None
+
+    def remaining(self, now):
+        end = self.end
+        if self.paused_at is not None:
+            end += max(0.0, now - max(self.paused_at, self.counting_start))
+        return max(0.0, end - max(now, self.counting_start))
+
+    def pause(self, now, at=None):
+        """Pausa all'istante at, non prima dell'ultimo avvio o ripresa."""
+        self.paused_at = now if at is None else min(now, max(at, self.counting_since))
+
+    def resume(self, now):
+        self.end += max(0.0, now - max(self.paused_at, self.counting_start))
+        self.paused_at = None
+        self.counting_since = max(now, self.counting_start)
+
+
+def stopped_producer():
+    """VideoProducer con un frame fisso già fermato: il rilevatore del gioco termina subito."""
+    producer = VideoProducer(frame=np.zeros((36, 64, 3), np.uint8), frame_pool_size=0)
+    producer.stop()
+    return producer
+
+
+def simulate_match(ruleset: Ruleset, table: TablePreset, producer, rng, turns):
+    """
+    Simula una partita di turns turni con il copione generato da rng.
+
+    Returns:
+        dict: {"counts", "violations", "simulated_time", "scheduler", "timer_wakeups"}.
+    """
+    clock = VirtualClock()
+    game = SimulatedGame(
+        ruleset, table, "Giocatore 1", "Giocatore 2", producer, clock=clock
+    )
+    counts = Counter()
+    violations = []
+    turn = 0
+
+    def check(condition, message):
+        if not condition:
+            violations.append(f"turno {turn}: {message}")
+
+    def check_remaining(expected):
+        remaining = game._timer.remaining_time
+        check(
+            abs(remaining - expected.remaining(clock.monotonic())) <= TOLERANCE,
+            f"tempo rimanente {remaining:.6f}, atteso "
+            f"{expected.remaining(clock.monotonic()):.6f}",
+        )
+
+    def wait(expected, seconds):
+        """Attende seconds secondi; se il turno scade restituisce il modello del nuovo turno."""
+        expiries = len(game.expiries)
+        deadline = clock.monotonic() + seconds
+        # Il turno scade se il tempo rimanente finisce prima della fine dell'attesa
+        expected_expiry = (
+            expected.end
+            if expected.paused_at is None and expected.end <= deadline
+            else None
+        )
+        clock.run_until(deadline)
+        if expected_expiry is None:
+            check(len(game.expiries) == expiries, "scadenza inattesa")
+            return None
+        counts["expiries"] += 1
+        check(len(game.expiries) == expiries + 1, "scadenza mancata")
+        if len(game.expiries) > expiries:
+            check(
+                abs(game.expiries[expiries] - expected_expiry) <= TOLERANCE,
+                f"scadenza a {game.expiries[expiries]:.6f}, attesa a {expected_expiry:.6f}",
+            )
+        # Il turno successivo inizia alla scadenza
+        return ExpectedTurn(expected_expiry, ruleset.turn_duration)
+
+    game.start()
+    expected = ExpectedTurn(clock.monotonic(), ruleset.initial_duration)
+    increments = [ruleset.max_increment_for_match] * 2
+    for turn in range(turns):
+        player = turn % 2
+        check(game.status == "running", f"stato {game.status} all'inizio del turno")
+        check_remaining(expected)
+
+        if rng.random() < INCREMENT_PROBABILITY:
+            counts["increments"] += 1
+            message = game.increment_time(player).result()
+            check((message is None) == (increments[player] > 0), "incremento")
+            if increments[player] > 0:
+                increments[player] -= 1
+                expected.end += ruleset.increment_duration
+            check_remaining(expected)
+
+        # Tempo del giocatore prima del tiro, a volte oltre il tempo a disposizione
+        available = expected.end - clock.monotonic()
+        if rng.random() < TIMEOUT_PROBABILITY:
+            think = available + rng.uniform(0.1, 10)
+        else:
+            think = rng.uniform(0, available * 0.95)
+
+        if rng.random() < PAUSE_PROBABILITY:
+            split = rng.uniform(0, think)
+            next_turn = wait(expected, split)
+            if next_turn is not None:
+                expected = next_turn
+                continue
+            think -= split
+            counts["pauses"] += 1
+            game.pause()
+            expected.pause(clock.monotonic())
+            check(game.status == "paused", f"stato {game.status} dopo la pausa")
+            clock.advance(rng.uniform(1, 120))
+            check_remaining(expected)
+            game.resume()
+            expected.resume(clock.monotonic())
+            check(game.status == "running", f"stato {game.status} dopo la ripresa")
+
+        next_turn = wait(expected, think)
+        if next_turn is not None:
+            expected = next_turn
+            continue
+        check_remaining(expected)
+
+        if rng.random() < END_TURN_PROBABILITY:
+            counts["turns_ended"] += 1
+            game.end_turn()
+            expected = ExpectedTurn(clock.monotonic(), ruleset.turn_duration)
+            continue
+
+        # Tiro: il rilevatore riconosce l'inizio del movimento con un po' di ritardo
+        counts["shots"] += 1
+        latency = rng.uniform(0, MAX_DETECTION_LATENCY)
+        now = clock.monotonic()
+        game._start_movement(now - latency)
+        expected.pause(now, at=now - latency)
+        check(game.status == "waiting", f"stato {game.status} durante il tiro")
+        check_remaining(expected)
+        shot = rng.uniform(latency + 0.5, 15)
+        clock.advance(shot)
+        check_remaining(expected)
+        # Fine del movimento, riconosciuta anch'essa in ritardo
+        stop_latency = rng.uniform(0, min(MAX_DETECTION_LATENCY, shot - latency))
+        now = clock.monotonic()
+        game._stop_movement(now - stop_latency)
+        expected = ExpectedTurn(now - stop_latency, ruleset.turn_duration)
+        check(game.status == "running", f"stato {game.status} dopo il tiro")
+
+    check_remaining(expected)
+    # Game.end() stampa un messaggio per ogni partita
+    with contextlib.redirect_stdout(io.StringIO()):
+        game.end()
+    check(game.status == "ended", f"stato {game.status} alla fine della partita")
+    check(clock.scheduler().pending == 0, "chiamate ancora programmate dopo la fine")
+    counts["turns"] = turns
+    counts["allarms"] = game.allarms
+    counts["final_allarms"] = len(game.expiries)
+    counts["stale_events"] = game.stale_events
+    counts["ticks"] = game.ticks
+    return {
+        "counts": counts,
+        "violations": violations,
+        "simulated_time": clock.monotonic(),
+        "scheduler": clock.scheduler().get_stats(),
+        "timer_wakeups": sum(timer.wakeups for timer in game.timers),
+    }
+
+
+def simulate(
+    matches=1000, turns=40, seed=0, ruleset=DEFAULT_RULESET, table=SIMULATION_TABLE
+):
+    """
+    Simula matches partite e restituisce il report: conteggi delle azioni, violazioni,
+    contatori dello scheduler e velocità rispetto al tempo reale.
+    """
+    rng = random.Random(seed)
+    producer = stopped_producer()
+    counts = Counter()
+    scheduler = Counter()
+    violations = []
+    simulated_time = 0.0
+    timer_wakeups = 0
+    wall_start = time.perf_counter()
+    for match in range(matches):
+        result = simulate_match(ruleset, table, producer, rng, turns)
+        counts.update(result["counts"])
+        for key in ("scheduled", "fired", "cancelled", "errors"):
+            scheduler[key] += result["scheduler"][key]
+        violations.extend(
+            f"partita {match}, {violation}" for violation in result["violations"]
+        )
+        simulated_time += result["simulated_time"]
+        timer_wakeups += result["timer_wakeups"]
+    wall_time = time.perf_counter() - wall_start
+    return {
+        "matches": matches,
+        "turns_per_match": turns,
+        "seed": seed,
+        "counts": dict(counts),
+        "violations": len(violations),
+        "violation_samples": violations[:MAX_REPORTED_VIOLATIONS],
+        "scheduler": dict(scheduler),
+        "stats": {
+            "simulated_time": simulated_time,
+            "wall_time": wall_time,
+            "speed": simulated_time / wall_time if wall_time else 0.0,
+            "matches_per_second": matches / wall_time if wall_time else 0.0,
+            "timer_wakeups": timer_wakeups,
+            "us_per_scheduled_call": (
+                wall_time * 1e6 / scheduler["fired"] if scheduler["fired"] else 0.0
+            ),
+        },
+    }
+
+
+def add_arguments(parser):
+    """Aggiunge al parser gli argomenti del comando simulate."""
+    parser.add_argument(
+        "--matches", type=int, default=1000, help="Numero di partite simulate"
+    )
+    parser.add_argument("--turns", type=int, default=40, help="Turni per partita")
+    parser.add_argument("--seed", type=int, default=0, help="Seme del copione casuale")
+    parser.add_argument(
+        "--table",
+        default=None,
+        help="File JSON del preset del tavolo (predefinito: tavolo di prova)",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="File del report (predefinito: stdout)"
+    )
+
+
+def run(args):
+    """Esegue il comando simulate con gli argomenti di add_arguments()."""
+    table = SIMULATION_TABLE if args.table is None else load_table_preset(args.table)
+    report = simulate(args.matches, args.turns, args.seed, table=table)
+    if args.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    stats = report["stats"]
+    print(
+        f"{report['matches']} partite in {stats['wall_time']:.1f} s "
+        f"({stats['speed']:.0f}x tempo reale, {report['violations']} violazioni)",
+        file=sys.stderr,
+    )
+    if report["violations"]:
+        sys.exit(1)
@@ -0,0 +1,41 @@
+import unittest
+
+from device.simulation import ExpectedTurn, simulate
+from device.game.timer import Timer
+
+
+class ExpectedTurnTest(unittest.TestCase):
+    def test_backdated_pause_and_resume(self):
+        turn = ExpectedTurn(0, 35)
+        self.assertEqual(turn.remaining(1), 35)
+        turn.pause(now=12, at=11)
+        self.assertEqual(turn.remaining(12), 35 - (11 - Timer.START_DELAY))
+        turn.resume(now=20)
+        self.assertEqual(turn.remaining(20), 26)
+        self.assertEqual(turn.end, 46)
+
+
+class SimulationTest(unittest.TestCase):
+    def test_matches_follow_the_model(self):
+        report = simulate(matches=30, turns=20, seed=1)
+        self.assertEqual(report["violations"], 0, report["violation_samples"])
+        counts = report["counts"]
+        self.assertEqual(counts["turns"], 600)
+        for action in ("shots", "expiries", "pauses", "increments"):
+            self.assertGreater(counts.get(action, 0), 0, action)
+        self.assertEqual(counts["final_allarms"], counts["expiries"])
+        self.assertEqual(report["scheduler"]["errors"], 0)
+        # Minuti di gioco simulati in una frazione di secondo
+        self.assertGreater(report["stats"]["speed"], 100)
+
+    def test_same_seed_same_matches(self):
+        first = simulate(matches=5, turns=10, seed=7)
+        second = simulate(matches=5, turns=10, seed=7)
+        self.assertEqual(first["counts"], second["counts"])
+        self.assertEqual(
+            first["stats"]["simulated_time"], second["stats"]["simulated_time"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,7 @@
-from dataclasses import dataclass
+import json
+from dataclasses import dataclass, field
 from typing import List, Tuple
+from device.utils import hex_to_opencv_hsv
 
 
 @dataclass
@@ -11,3 +13,22 @@ class TablePreset:
     points: List[Tuple[int, int]]  # (x, y) punti del tavolo
     colors: List[Tuple[int, int, int]]  # HSV (OpenCV format) per il colore del tavolo
     min_area_threshold: int
+    # Opzioni del rilevatore per questo tavolo, es. {"blob_filter": "components"}
+    detector: dict = field(default_factory=dict)
+
+
+def load_table_preset(json_path, id=0, name=None) -> TablePreset:
+    """
+    Carica un TablePreset da un file JSON con le chiavi points, colors (esadecimali),
+    min_area_threshold e, opzionalmente, detector (come i file in device/test_data/video).
+    """
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    return TablePreset(
+        id,
+        name or json_path,
+        points=data["points"],
+        colors=[hex_to_opencv_hsv(color) for color in data["colors"]],
+        min_area_threshold=data["min_area_threshold"],
+        detector=data.get("detector", {}),
+    )
@@ -1,14 +1,14 @@
 import json
 import os
 import cv2
-from device.video_producer import VideoProducer
+from device.config import get_config
+from device.video_producer import get_producer
 
 
 def test_video():
     from device.game import Game, Ruleset
     from device.table import TablePreset
     from device.utils import hex_to_opencv_hsv
-    from device.video_producer import VideoProducer
 
     ruleset = Ruleset(
         id=0,
@@ -39,7 +39,7 @@ def test_video():
         min_area_threshold=min_area_threshold,
     )
 
-    video_producer = VideoProducer.get_instance(video_source=video_test, loop=False)
+    video_producer = get_producer(video_source=video_test, loop=False)
 
     game = Game(ruleset, table, "Player 1", "Player 2", video_producer)
     game.start()
@@ -50,11 +50,11 @@ def test_api(is_video=False, static=False):
 
     if static:
         frame = cv2.imread("./device/test_data/images/esempio_2.png")
-        VideoProducer.get_instance(frame=frame)
+        get_producer(frame=frame)
     elif is_video:
-        VideoProducer.get_instance(
-            video_source="./device/test_data/video/esempio_2.mp4"
-        )
+        # Il file video di test diventa la sorgente predefinita
+        get_config()["VIDEO"]["Source"] = "./device/test_data/video/esempio_2.mp4"
+        get_producer()
 
     api.start(debug=True)
 
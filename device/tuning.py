@@ -0,0 +1,374 @@
+"""
+Ricerca automatica delle soglie del rilevatore su video etichettati.
+
+Ogni video di labels.json (vedi device.benchmark) viene decodificato una sola volta: i frame
+da elaborare, ritagliati sulla ROI del tavolo, sono copiati in memoria condivisa e letti da
+tutte le prove, eseguite in parallelo da un gruppo di processi. Ogni prova applica ai preset
+dei video una combinazione di soglie (chiavi di VideoConsumer.TABLE_OPTIONS e fattore
+dell'area minima delle biglie) e viene valutata sulle latenze di inizio e fine movimento e
+sugli eventi falsi o mancati. La prima prova usa i preset invariati, come riferimento.
+
+Le soglie migliori si possono scrivere in un preset del tavolo (--write): le soglie in
+"detector", l'area minima in "min_area_threshold".
+
+Uso:
+    python -m device tune [--labels labels.json] [--trials 50] [--workers N] [--write preset.json]
+"""
+
+import dataclasses
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+from device.analysis import decode_frames, replay_frames, video_info
+from device.benchmark import (
+    LABELS_PATH,
+    load_labels,
+    match_events,
+    summarize_matches,
+)
+from device.config import get_config
+from device.game.video_consumer import VideoConsumer
+from device.table import TablePreset, load_table_preset
+
+# Valori provati per ogni soglia; min_area_scale moltiplica min_area_threshold di ogni preset,
+# che dipende dalla risoluzione del video
+SEARCH_SPACE = {
+    "motion_threshold": [50, 75, 100, 150, 200],
+    "circularity": [0.5, 0.6, 0.7, 0.8],
+    "hsv_diff": [[3, 6, 3], [5, 10, 5], [8, 15, 8], [10, 20, 10]],
+    "motion_window": [10, 15, 20, 27],
+    "motion_ratio": [0.7, 0.8, 0.9],
+    "min_area_scale": [0.5, 0.75, 1.0, 1.5, 2.0],
+}
+# Secondi di latenza equivalenti a un evento falso e a un evento mancato
+FALSE_EVENT_PENALTY = 5.0
+MISSED_EVENT_PENALTY = 10.0
+
+# Video condivisi a cui è collegato il processo: (descrizione, frame)
+_clips = []
+_shared_memory = []
+
+
+def apply_parameters(table: TablePreset, parameters) -> TablePreset:
+    """Copia di table con le soglie di una prova."""
+    detector = {**table.detector}
+    min_area_threshold = table.min_area_threshold
+    for key, value in parameters.items():
+        if key == "min_area_scale":
+            min_area_threshold = max(1, round(table.min_area_threshold * value))
+        else:
+            detector[key] = value
+    return dataclasses.replace(
+        table, min_area_threshold=min_area_threshold, detector=detector
+    )
+
+
+def score_trial(summary):
+    """Punteggio di una prova, da minimizzare: latenze medie più penalità degli errori."""
+    latency = (summary["start_latency_mean"] or 0.0) + (
+        summary["stop_latency_mean"] or 0.0
+    )
+    false_events = summary["false_starts"] + summary["false_stops"]
+    missed_events = summary["missed_starts"] + summary["missed_stops"]
+    return (
+        latency
+        + FALSE_EVENT_PENALTY * false_events
+        + MISSED_EVENT_PENALTY * missed_events
+    )
+
+
+def candidates(space, search="random", trials=50, seed=0):
+    """
+    Combinazioni di soglie da provare, precedute da quella vuota (preset invariati).
+
+    Args:
+        space (dict): Valori da provare per ogni soglia.
+        search (str): "grid" per tutte le combinazioni, "random" per trials combinazioni
+            diverse scelte a caso.
+        trials (int): Numero di combinazioni casuali.
+        seed (int): Seme della scelta casuale, per ripetere la stessa ricerca.
+    """
+    keys = list(space)
+    if search == "grid":
+        combinations = [
+            dict(zip(keys, values))
+            for values in itertools.product(*(space[key] for key in keys))
+        ]
+        return [{}] + combinations
+    generator = random.Random(seed)
+    total = 1
+    for key in keys:
+        total *= len(space[key])
+    chosen = []
+    seen = set()
+    while len(chosen) < min(trials, total):
+        parameters = {key: generator.choice(space[key]) for key in keys}
+        fingerprint = json.dumps(parameters, sort_keys=True)
+        if fingerprint not in seen:
+            seen.add(fingerprint)
+            chosen.append(parameters)
+    return [{}] + chosen
+
+
+def share_clips(clips, max_fps):
+    """
+    Decodifica una volta i video etichettati e copia in memoria condivisa i frame da elaborare
+    (al massimo max_fps al secondo), ritagliati sulla ROI del tavolo.
+
+    Returns:
+        tuple: (descrizioni dei video da passare a attach_clips(), blocchi di memoria
+            condivisa da chiudere e rilasciare alla fine).
+    """
+    specs = []
+    blocks = []
+    for clip in clips:
+        table = load_table_preset(clip["table"])
+        _, fps = video_info(clip["video"])
+        context = None
+        indices = []
+        crops = []
+        for index, image in decode_frames(clip["video"], 0, sys.maxsize, max_fps, {}):
+            if context is None:
+                context = VideoConsumer.compile_context(table)
+                context.ensure_shape(image.shape[:2])
+            x, y, w, h = context.roi
+            indices.append(index)
+            crops.append(image[y : y + h, x : x + w].copy())
+        if not crops:
+            raise ValueError(f"Nessun frame nel video: {clip['video']}")
+        shape = (len(crops),) + crops[0].shape
+        block = SharedMemory(create=True, size=int(np.prod(shape)))
+        blocks.append(block)
+        frames = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        for slot, crop in zip(frames, crops):
+            slot[...] = crop
+        del frames, crops
+        # Il preset del video ritagliato ha i punti in coordinate della ROI
+        x, y = context.roi[:2]
+        points = [[px - x, py - y] for px, py in table.points]
+        specs.append(
+            {
+                "video": os.path.basename(clip["video"]),
+                "memory": block.name,
+                "shape": shape,
+                "indices": indices,
+                "fps": fps,
+                "table": dataclasses.replace(table, points=points),
+                "motion": [tuple(interval) for interval in clip["motion"]],
+            }
+        )
+    return specs, blocks
+
+
+def attach_clips(specs):
+    """Collega il processo ai frame condivisi dei video, in sola lettura."""
+    for spec in specs:
+        block = SharedMemory(name=spec["memory"])
+        frames = np.ndarray(spec["shape"], dtype=np.uint8, buffer=block.buf)
+        frames.flags.writeable = False
+        _shared_memory.append(block)
+        _clips.append((spec, frames))
+
+
+def detach_clips():
+    """Scollega il processo dai frame condivisi."""
+    _clips.clear()
+    for block in _shared_memory:
+        block.close()
+    _shared_memory.clear()
+
+
+def run_trial(parameters, tolerance):
+    """Esegue una prova su tutti i video condivisi e ne restituisce punteggio e riepilogo."""
+    matches = []
+    for spec, frames in _clips:
+        table = apply_parameters(spec["table"], parameters)
+        result = replay_frames(table, zip(spec["indices"], frames), spec["fps"])
+        matches.append(match_events(result["events"], spec["motion"], tolerance))
+    summary = summarize_matches(matches)
+    return {"parameters": parameters, "score": score_trial(summary), **summary}
+
+
+def tune(
+    clips,
+    tolerance,
+    space=None,
+    search="random",
+    trials=50,
+    workers=1,
+    seed=0,
+    max_fps=None,
+    progress=None,
+):
+    """
+    Cerca le soglie del rilevatore con il punteggio migliore sui video etichettati.
+
+    Args:
+        clips (list of dict): Video etichettati, come restituiti da load_labels().
+        tolerance (float): Anticipo massimo di un evento rispetto all'etichetta, in secondi.
+        space (dict): Valori da provare per ogni soglia (Opzionale, SEARCH_SPACE).
+        search (str): "random" o "grid".
+        trials (int): Numero di prove casuali.
+        workers (int): Processi che eseguono le prove.
+        seed (int): Seme della ricerca casuale.
+        max_fps (float): Frequenza massima di elaborazione (Opzionale, config DetectorMaxFps).
+        progress (callable): Funzione chiamata con (prove completate, totale, risultato)
+            dopo ogni prova (Opzionale).
+
+    Returns:
+        dict: {"baseline", "best", "trials" (ordinate per punteggio), "stats"}.
+    """
+    if space is None:
+        space = SEARCH_SPACE
+    if max_fps is None:
+        max_fps = get_config().getfloat("VIDEO", "DetectorMaxFps", fallback=30.0)
+    wall_start = time.perf_counter()
+    specs, blocks = share_clips(clips, max_fps)
+    decode_time = time.perf_counter() - wall_start
+    pending = candidates(space, search, trials, seed)
+    results = []
+    try:
+        if workers <= 1:
+            attach_clips(specs)
+            try:
+                for parameters in pending:
+                    results.append(run_trial(parameters, tolerance))
+                    if progress is not None:
+                        progress(len(results), len(pending), results[-1])
+            finally:
+                detach_clips()
+        else:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(
+                workers,
+                mp_context=context,
+                initializer=attach_clips,
+                initargs=(specs,),
+            ) as executor:
+                futures = [
+                    executor.submit(run_trial, parameters, tolerance)
+                    for parameters in pending
+                ]
+                for future in as_completed(futures):
+                    results.append(future.result())
+                    if progress is not None:
+                        progress(len(results), len(pending), results[-1])
+    finally:
+        for block in blocks:
+            block.close()
+            block.unlink()
+    wall_time = time.perf_counter() - wall_start
+
+    baseline = next(result for result in results if not result["parameters"])
+    results.sort(key=lambda result: result["score"])
+    return {
+        "baseline": baseline,
+        "best": results[0],
+        "trials": results,
+        "stats": {
+            "clips": [spec["video"] for spec in specs],
+            "frames": sum(spec["shape"][0] for spec in specs),
+            "shared_bytes": sum(block.size for block in blocks),
+            "search": search,
+            "trials": len(results),
+            "workers": workers,
+            "max_fps": max_fps,
+            "decode_time": decode_time,
+            "wall_time": wall_time,
+        },
+    }
+
+
+def write_preset(json_path, parameters):
+    """
+    Scrive le soglie di una prova nel file JSON di un preset del tavolo: le soglie nelle
+    opzioni "detector", il fattore min_area_scale applicato a "min_area_threshold".
+    """
+    with open(json_path, "r") as f:
+        data = json.load(f)
+    detector = data.setdefault("detector", {})
+    for key, value in parameters.items():
+        if key == "min_area_scale":
+            data["min_area_threshold"] = max(
+                1, round(data["min_area_threshold"] * value)
+            )
+        else:
+            detector[key] = value
+    with open(json_path, "w") as f:
+        json.dump(data, f, indent=4)
+        f.write("\n")
+
+
+def add_arguments(parser):
+    """Aggiunge al parser gli argomenti del comando tune."""
+    parser.add_argument(
+        "--labels", default=LABELS_PATH, help="File JSON delle etichette dei video"
+    )
+    parser.add_argument("--search", choices=["random", "grid"], default="random")
+    parser.add_argument(
+        "--trials", type=int, default=50, help="Numero di prove casuali"
+    )
+    parser.add_argument(
+        "--seed", type=int, default=0, help="Seme della ricerca casuale"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count() or 1,
+        help="Processi che eseguono le prove",
+    )
+    parser.add_argument(
+        "--max-fps",
+        type=float,
+        default=None,
+        help="Frequenza massima di elaborazione (predefinita: config DetectorMaxFps)",
+    )
+    parser.add_argument(
+        "--write",
+        default=None,
+        help="Preset del tavolo in cui scrivere le soglie migliori",
+    )
+    parser.add_argument(
+        "-o", "--output", default=None, help="File del report (predefinito: stdout)"
+    )
+
+
+def run(args):
+    """Esegue il comando tune con gli argomenti di add_arguments()."""
+    clips, tolerance = load_labels(args.labels)
+
+    def progress(done, total, result):
+        print(f"{done}/{total} punteggio {result['score']:.2f}", file=sys.stderr)
+
+    report = tune(
+        clips,
+        tolerance,
+        search=args.search,
+        trials=args.trials,
+        workers=args.workers,
+        seed=args.seed,
+        max_fps=args.max_fps,
+        progress=progress,
+    )
+    if args.output is None:
+        print(json.dumps(report, indent=4))
+    else:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=4)
+    best = report["best"]
+    print(
+        f"Punteggio migliore {best['score']:.2f} (preset invariati "
+        f"{report['baseline']['score']:.2f}): {json.dumps(best['parameters'])}",
+        file=sys.stderr,
+    )
+    if args.write is not None:
+        write_preset(args.write, best["parameters"])
@@ -0,0 +1,69 @@
+import os
+import tempfile
+import unittest
+
+from device.benchmark import load_labels
+from device.game.video_consumer import VideoConsumer
+from device.table import load_table_preset
+from device.tuning import apply_parameters, candidates, tune, write_preset
+
+TABLE = "device/test_data/video/example_edited.json"
+
+
+class TuningTest(unittest.TestCase):
+    def test_apply_parameters(self):
+        table = load_table_preset(TABLE)
+        tuned = apply_parameters(
+            table,
+            {"motion_threshold": 150, "hsv_diff": [8, 15, 8], "min_area_scale": 0.5},
+        )
+        self.assertEqual(tuned.min_area_threshold, 25)
+        self.assertEqual(VideoConsumer.table_option(tuned, "motion_threshold"), 150)
+        self.assertEqual(VideoConsumer.compile_context(tuned).hsv_diff, (8, 15, 8))
+        # Le soglie non cercate restano quelle della classe, il preset originale non cambia
+        self.assertEqual(
+            VideoConsumer.table_option(tuned, "circularity"),
+            VideoConsumer.CIRCULARITY_THRESHOLD,
+        )
+        self.assertEqual(table.detector, {})
+
+    def test_candidates(self):
+        space = {"motion_threshold": [50, 100], "motion_ratio": [0.8, 0.9]}
+        grid = candidates(space, "grid")
+        self.assertEqual(grid[0], {})
+        self.assertEqual(len(grid), 5)
+        chosen = candidates(space, "random", trials=10, seed=1)
+        self.assertEqual(len(chosen), 5)
+        self.assertEqual(chosen, candidates(space, "random", trials=10, seed=1))
+
+    def test_write_preset(self):
+        with tempfile.TemporaryDirectory() as folder:
+            path = os.path.join(folder, "preset.json")
+            with open(TABLE) as source, open(path, "w") as target:
+                target.write(source.read())
+            write_preset(path, {"motion_window": 15, "min_area_scale": 2.0})
+            table = load_table_preset(path)
+        self.assertEqual(table.min_area_threshold, 100)
+        self.assertEqual(table.detector, {"motion_window": 15})
+
+    def test_tune_on_shared_frames(self):
+        clips, tolerance = load_labels()
+        clips = [clip for clip in clips if clip["motion"][0][1] is not None]
+        report = tune(
+            clips, tolerance, space={"motion_ratio": [0.8, 0.9]}, search="grid"
+        )
+        self.assertEqual(report["stats"]["trials"], 3)
+        self.assertGreater(report["stats"]["shared_bytes"], 0)
+        self.assertEqual(report["baseline"]["missed_starts"], 0)
+        self.assertLessEqual(report["best"]["score"], report["baseline"]["score"])
+        # Stesse soglie del preset invariato, stesso punteggio
+        same = next(
+            trial
+            for trial in report["trials"]
+            if trial["parameters"] == {"motion_ratio": VideoConsumer.MOTION_RATIO}
+        )
+        self.assertAlmostEqual(same["score"], report["baseline"]["score"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,8 @@
 import colorsys
+import numbers
+import numpy as np
 from gpiozero import pi_info, BadPinFactory
+from device.config import get_config
 
 
 def is_raspberry_pi():
@@ -10,6 +13,11 @@ def is_raspberry_pi():
         return False
 
 
+def is_headless():
+    """True se il dispositivo funziona senza display (config VIDEO/Headless)."""
+    return get_config().getboolean("VIDEO", "Headless", fallback=False)
+
+
 def hex_to_rgb(color: str):
     r, g, b = int(color[1:3], 16), int(color[3:5], 16), int(color[5:7], 16)
     return (r, g, b)
@@ -31,17 +39,56 @@ def hex_to_opencv_hsv(color: str):
 
 
 class CircularArray:
+    """
+    Buffer circolare di capacità fissa: aggiungere un elemento costa O(1) e, quando il buffer
+    è pieno, sovrascrive il più vecchio.
+    Se gli elementi sono numeri o booleani mantiene anche la loro somma corrente (get_sum),
+    così il totale della finestra non va ricalcolato ad ogni aggiunta.
+    """
+
     def __init__(self, size):
         self.size = size
-        self.array = []
+        self._items = [None] * size
+        self.clear()
+
+    def clear(self):
+        """Svuota il buffer riusando lo spazio già allocato."""
+        self._start = 0
+        self._len = 0
+        self._sum = 0
+        self._numeric = True
 
     def add(self, element):
-        if len(self.array) >= self.size:
-            self.array.pop(0)
-        self.array.append(element)
+        if self._len < self.size:
+            index = (self._start + self._len) % self.size
+            self._len += 1
+        else:
+            index = self._start
+            self._start = (self._start + 1) % self.size
+            if self._numeric:
+                self._sum -= self._items[index]
+        self._items[index] = element
+        if self._numeric:
+            if isinstance(element, (numbers.Number, np.bool_)):
+                self._sum += element
+            else:
+                self._numeric = False
 
     def get_array(self):
-        return self.array
+        """Elementi dal più vecchio al più recente."""
+        return [self._items[(self._start + i) % self.size] for i in range(self._len)]
 
     def get_len(self):
-        return len(self.array)
+        return self._len
+
+    def get_sum(self):
+        """Somma degli elementi nel buffer (solo per elementi numerici o booleani)."""
+        if not self._numeric:
+            raise TypeError("Il buffer contiene elementi non numerici")
+        return self._sum
+
+    def is_full(self):
+        return self._len == self.size
+
+    def __len__(self):
+        return self._len
@@ -0,0 +1,40 @@
+import unittest
+
+from device.utils import CircularArray
+
+
+class CircularArrayTest(unittest.TestCase):
+    def test_keeps_last_elements_in_order(self):
+        array = CircularArray(3)
+        for i in range(5):
+            array.add(i)
+        self.assertEqual(array.get_array(), [2, 3, 4])
+        self.assertEqual(array.get_len(), 3)
+        self.assertTrue(array.is_full())
+
+    def test_running_sum(self):
+        array = CircularArray(4)
+        values = [True, False, True, True, True, False, False]
+        for i, value in enumerate(values):
+            array.add(value)
+            self.assertEqual(array.get_sum(), sum(values[max(0, i - 3) : i + 1]))
+
+    def test_clear(self):
+        array = CircularArray(2)
+        array.add(1)
+        array.add(2)
+        array.clear()
+        self.assertEqual(array.get_len(), 0)
+        self.assertEqual(array.get_sum(), 0)
+        array.add(5)
+        self.assertEqual(array.get_array(), [5])
+
+    def test_sum_of_non_numeric_elements(self):
+        array = CircularArray(2)
+        array.add("a")
+        with self.assertRaises(TypeError):
+            array.get_sum()
+
+
+if __name__ == "__main__":
+    unittest.main()
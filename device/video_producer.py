@@ -1,105 +1,423 @@
 import cv2
+import numpy as np
+import os
 import threading
 import time
+from device.config import get_config
 from device.utils import is_raspberry_pi
 
 
+class Frame:
+    """
+    Frame acquisito dal VideoProducer.
+
+    Le immagini derivate (sfocata, HSV, scala di grigi, ridotta) vengono calcolate in modo lazy
+    una sola volta per frame e condivise tra tutti i consumatori. La cache vive insieme al frame,
+    quindi viene scartata quando il producer pubblica il frame successivo.
+    Le immagini derivate sono in sola lettura: chi deve modificarle ne fa una copia.
+
+    Attributi:
+        seq (int): Numero di sequenza, cresce in modo monotono ad ogni frame acquisito.
+        timestamp (float): Istante di acquisizione (time.monotonic()).
+        image (Mat): Immagine BGR acquisita.
+
+    Se il frame è stato acquisito in un buffer di un FramePool, image è una vista in sola lettura
+    del buffer e il frame ha un conteggio dei riferimenti: chi lo ottiene da wait_for_frame() deve
+    chiamare release() (oppure usarlo in un blocco with) quando ha finito, così il buffer torna nel pool.
+    """
+
+    __slots__ = (
+        "seq",
+        "timestamp",
+        "image",
+        "_derived",
+        "_derived_lock",
+        "_pool",
+        "_buffer",
+        "_refs",
+    )
+
+    BLUR_KERNEL = (5, 5)
+
+    def __init__(self, seq, timestamp, image, pool=None):
+        self.seq = seq
+        self.timestamp = timestamp
+        self._derived = {}
+        self._derived_lock = threading.RLock()
+        self._pool = pool
+        self._buffer = image if pool is not None else None
+        self._refs = 1  # Riferimento tenuto dal producer
+        if pool is not None:
+            image = image.view()
+            image.setflags(write=False)
+        self.image = image
+
+    def retain(self):
+        """Aggiunge un riferimento al frame, il buffer non verrà riutilizzato fino al release()."""
+        if self._pool is not None:
+            self._pool._retain(self)
+        return self
+
+    def release(self):
+        """Rilascia un riferimento al frame; all'ultimo rilascio il buffer torna nel pool."""
+        if self._pool is not None:
+            self._pool._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+
+    def _derive(self, key, compute):
+        """Restituisce l'immagine derivata identificata da key, calcolandola alla prima richiesta."""
+        with self._derived_lock:
+            image = self._derived.get(key)
+            if image is None:
+                image = compute()
+                image.setflags(write=False)
+                self._derived[key] = image
+            return image
+
+    def crop(self, roi=None):
+        """Vista (senza copia) della regione roi = (x, y, w, h) dell'immagine, l'intera immagine se None."""
+        if roi is None:
+            return self.image
+        x, y, w, h = roi
+        return self.image[y : y + h, x : x + w]
+
+    def blurred(self, roi=None):
+        """Frame BGR sfocato con filtro gaussiano, limitato alla regione roi se indicata."""
+        return self._derive(
+            ("blurred", roi),
+            lambda: cv2.GaussianBlur(self.crop(roi), self.BLUR_KERNEL, 0),
+        )
+
+    def hsv(self, roi=None):
+        """Frame sfocato convertito in HSV, limitato alla regione roi se indicata."""
+        return self._derive(
+            ("hsv", roi), lambda: cv2.cvtColor(self.blurred(roi), cv2.COLOR_BGR2HSV)
+        )
+
+    def gray(self, roi=None):
+        """Frame sfocato convertito in scala di grigi, limitato alla regione roi se indicata."""
+        return self._derive(
+            ("gray", roi), lambda: cv2.cvtColor(self.blurred(roi), cv2.COLOR_BGR2GRAY)
+        )
+
+    def downscaled(self, scale=0.5):
+        """Frame BGR ridotto del fattore scale."""
+        return self._derive(
+            ("downscaled", scale),
+            lambda: cv2.resize(
+                self.image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA
+            ),
+        )
+
+
+class FramePool:
+    """
+    Pool di dimensione fissa di buffer preallocati in cui il VideoProducer acquisisce i frame.
+
+    I buffer vengono riutilizzati in ordine FIFO quando l'ultimo riferimento al frame che li
+    contiene viene rilasciato. Se tutti i buffer sono in uso l'acquisizione non si blocca:
+    viene allocato un buffer temporaneo, che non entra nel pool, e viene contato in fallbacks.
+    """
+
+    def __init__(self, size):
+        """
+        Inizializza il pool.
+
+        Parametri:
+            size (int): Numero massimo di buffer preallocati.
+        """
+        self.size = size
+        self._lock = threading.Lock()
+        self._free = []
+        self._shape = None
+        self._dtype = None
+        self.allocated = 0  # Buffer allocati dal pool
+        self.reused = 0  # Acquisizioni servite con un buffer già esistente
+        self.fallbacks = (
+            0  # Acquisizioni fuori dal pool (pool esaurito o formato errato)
+        )
+
+    def acquire(self, shape, dtype=np.uint8):
+        """Restituisce un buffer libero del formato richiesto, allocandolo se necessario."""
+        with self._lock:
+            if shape != self._shape or dtype != self._dtype:
+                # Cambio di risoluzione: i buffer precedenti non sono più utilizzabili
+                self._free.clear()
+                self._shape, self._dtype = shape, dtype
+                self.allocated = 0
+            if self._free:
+                self.reused += 1
+                return self._free.pop(0)
+            if self.allocated < self.size:
+                self.allocated += 1
+                return np.empty(shape, dtype=dtype)
+            self.fallbacks += 1
+        return None
+
+    def discard(self, buffer):
+        """Restituisce al pool un buffer acquisito ma non utilizzato per un frame."""
+        with self._lock:
+            if buffer.shape == self._shape and buffer.dtype == self._dtype:
+                self._free.append(buffer)
+
+    def _retain(self, frame):
+        with self._lock:
+            frame._refs += 1
+
+    def _release(self, frame):
+        with self._lock:
+            if frame._refs <= 0:
+                return
+            frame._refs -= 1
+            if frame._refs == 0 and frame._buffer is not None:
+                buffer, frame._buffer = frame._buffer, None
+                if buffer.shape == self._shape and buffer.dtype == self._dtype:
+                    self._free.append(buffer)
+
+    def stats(self):
+        """Statistiche del pool: dimensione, buffer liberi, allocazioni, riusi e fallback."""
+        with self._lock:
+            return {
+                "size": self.size,
+                "allocated": self.allocated,
+                "free": len(self._free),
+                "in_use": self.allocated - len(self._free),
+                "reused": self.reused,
+                "fallbacks": self.fallbacks,
+            }
+
+
 class VideoProducer:
     """
-    VideoProcessor è un Singleton che gira su un thread separato e gestirà la registrazione
-    video. Fornisce la funzione get_frame() che restituisce il frame attuale.
+    VideoProducer gira su un thread separato e gestisce l'acquisizione video da una sorgente
+    (telecamera o file). Fornisce la funzione get_frame() che restituisce il frame attuale.
+    Esiste un VideoProducer per ogni sorgente video: le istanze si ottengono dal registro
+    con get_producer(video_source), così un dispositivo può gestire più telecamere e tavoli.
+
+    Ogni frame acquisito viene pubblicato con un numero di sequenza e un timestamp di acquisizione:
+    i consumatori chiamano wait_for_frame(after_seq) e restano bloccati su una Condition finché non
+    arriva un frame più recente dell'ultimo che hanno già visto.
+
+    Con frame_pool_size > 0 (parametro o chiave FramePoolSize della sezione VIDEO del file di
+    configurazione) i frame vengono acquisiti in un FramePool di buffer preallocati invece di
+    allocare un nuovo array ad ogni frame.
     """
 
-    _instance = None
+    def __init__(self, frame=None, video_source=0, loop=False, frame_pool_size=None):
+        """
+        Inizializza il producer e avvia il thread di acquisizione.
 
-    def __init__(self):
-        raise RuntimeError("VideoProcessor instance cannot be instantiated")
+        Parametri:
+            frame (Mat): Frame fisso da pubblicare al posto di una sorgente reale (Opzionale).
+            video_source (int | str): Indice della telecamera o percorso di un file video.
+            loop (bool): Se True, un file video ricomincia dall'inizio quando termina.
+            frame_pool_size (int): Numero di buffer preallocati, None per leggerlo dalla configurazione.
+        """
+        if frame_pool_size is None:
+            frame_pool_size = get_config().getint("VIDEO", "FramePoolSize", fallback=0)
+        self._frame_pool = FramePool(frame_pool_size) if frame_pool_size > 0 else None
+        self._frame_shape = None
+        self._frame_condition = threading.Condition()
+        self._latest_frame = None
+        self._seq = 0
+        if frame is not None:
+            self._publish(frame)
+        self.video_source = video_source
+        self.fixed_frame = frame is not None
+        self.is_picamera = is_raspberry_pi()
+        self.is_running_picamera = False
 
-    def __new__(cls, frame, video_source, loop):
-        if not cls._instance:
-            cls._instance = super(VideoProducer, cls).__new__(cls)
+        if self.fixed_frame:
+            pass
+        elif self.is_picamera and not isinstance(video_source, str):
+            from picamera2 import Picamera2
+
+            self.is_running_picamera = True
+
+            self.picam = Picamera2(video_source)
+            # Configurazione base della camera
+            config = self.picam.create_preview_configuration(
+                main={"size": (852, 480), "format": "XRGB8888"},
+            )
+            self.picam.configure(config)
+            self.picam.start()
+        else:
+            self.video_capture = cv2.VideoCapture(video_source)
 
-            cls._instance.frame = frame
-            cls._instance.fixed_frame = frame is not None
-            cls._instance.is_picamera = is_raspberry_pi()
-            cls._instance.is_running_picamera = False
+        # I file video vengono letti alla loro frequenza nominale; telecamere e stream non hanno
+        # bisogno di attese, perché la lettura si blocca fino al frame successivo
+        self.is_file = isinstance(video_source, str) and os.path.isfile(video_source)
+        self._frame_interval = 0.0
+        if self.is_file and not self.fixed_frame:
+            fps = self.video_capture.get(cv2.CAP_PROP_FPS)
+            self._frame_interval = 1 / fps if fps > 0 else 1 / 30
 
-            if cls._instance.is_picamera and not isinstance(video_source, str):
-                from picamera2 import Picamera2
+        self._loop = loop
+        self.is_running = False
+        self.capture_thread = None
+        self.stop_lock = threading.Lock()
+        self._start_capture()
 
-                cls._instance.is_running_picamera = True
+    def _acquire_buffer(self):
+        """Buffer del pool in cui acquisire il prossimo frame, None se il pool non è attivo."""
+        if self._frame_pool is None or self._frame_shape is None:
+            return None
+        return self._frame_pool.acquire(self._frame_shape)
 
-                cls._instance.picam = Picamera2()
-                # Configurazione base della camera
-                config = cls._instance.picam.create_preview_configuration(
-                    main={"size": (852, 480), "format": "XRGB8888"},
-                )
-                cls._instance.picam.configure(config)
-                cls._instance.picam.start()
+    def _publish(self, image, buffer=None):
+        """
+        Pubblica un nuovo frame e sveglia tutti i consumatori in attesa.
+        Se image è stato acquisito nel buffer del pool, il frame ne mantiene il riferimento.
+        """
+        pool = None
+        if buffer is not None:
+            if image is buffer:
+                pool = self._frame_pool
             else:
-                cls._instance.video_capture = cv2.VideoCapture(video_source)
+                # Il backend ha allocato un nuovo array (es. cambio di risoluzione)
+                self._frame_pool.discard(buffer)
+        self._frame_shape = image.shape
+        frame = Frame(self._seq + 1, time.monotonic(), image, pool=pool)
+        with self._frame_condition:
+            self._seq = frame.seq
+            previous, self._latest_frame = self._latest_frame, frame
+            self._frame_condition.notify_all()
+        if previous is not None:
+            previous.release()
 
-            cls._instance._loop = loop
-            cls._instance.is_running = False
-            cls._instance.capture_thread = None
-            cls._instance.stop_lock = threading.Lock()
-            cls._instance._start_capture()
-        return cls._instance
+    def _capture_picamera(self):
+        buffer = self._acquire_buffer()
+        if buffer is None:
+            return self.picam.capture_array(), None
+        from picamera2 import MappedArray
 
-    @classmethod
-    def get_instance(cls, frame=None, video_source=0, loop=False):
-        if not cls._instance:
-            cls._instance = cls.__new__(cls, frame, video_source, loop)
-        return cls._instance
+        # Copia direttamente dal buffer della camera nel buffer preallocato
+        request = self.picam.capture_request()
+        try:
+            with MappedArray(request, "main") as mapped:
+                if mapped.array.shape != buffer.shape:
+                    return mapped.array.copy(), buffer
+                np.copyto(buffer, mapped.array)
+        finally:
+            request.release()
+        return buffer, buffer
 
     def _capture_loop(self):
         if self.fixed_frame:
-            while self.is_running:
-                time.sleep(1 / 30)
+            return  # Il frame fisso è già stato pubblicato
         if self.is_running_picamera:
             while self.is_running:
-                self.frame = self.picam.capture_array()
-                time.sleep(1 / 30)
+                # capture_request() attende il frame successivo della camera
+                self._publish(*self._capture_picamera())
         else:
+            next_time = time.monotonic()
             while self.video_capture.isOpened() and self.is_running:
-                ret, frame = self.video_capture.read()
+                buffer = self._acquire_buffer()
+                # Con un buffer del pool, read() scrive il frame direttamente nel buffer
+                ret, frame = self.video_capture.read(buffer)
                 if ret:
-                    self.frame = frame
-                elif self._loop:
-                    self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
-                time.sleep(1 / 30)
+                    self._publish(frame, buffer)
+                elif buffer is not None:
+                    self._frame_pool.discard(buffer)
+                if not ret:
+                    if self._loop:
+                        self.video_capture.set(cv2.CAP_PROP_POS_FRAMES, 0)
+                    else:
+                        # Fine del file o errore della telecamera: evita di ciclare a vuoto
+                        time.sleep(self._frame_interval or 1 / 30)
+                        continue
+                if self._frame_interval:
+                    # Cadenza del file: se la lettura è in ritardo non recupera i frame persi
+                    next_time += self._frame_interval
+                    delay = next_time - time.monotonic()
+                    if delay > 0:
+                        time.sleep(delay)
+                    else:
+                        next_time = time.monotonic()
 
     def _start_capture(self):
         if not self.is_running:
             self.is_running = True
             self.capture_thread = threading.Thread(target=self._capture_loop)
             self.capture_thread.daemon = True
-            self.capture_thread.name = "VideoProducerThread"
+            self.capture_thread.name = f"VideoProducerThread-{self.video_source}"
             self.capture_thread.start()
 
+    def wait_for_frame(self, after_seq=0, timeout=None):
+        """
+        Attende un frame con numero di sequenza maggiore di after_seq.
+
+        Parametri:
+            after_seq (int): Numero di sequenza dell'ultimo frame già elaborato dal chiamante.
+            timeout (float): Tempo massimo di attesa in secondi, None per attendere indefinitamente.
+
+        Restituisce:
+            Frame: Il frame più recente, oppure None se scade il timeout o il producer viene fermato.
+                Il frame restituito ha un riferimento in più: va rilasciato con release().
+        """
+        with self._frame_condition:
+            self._frame_condition.wait_for(
+                lambda: not self.is_running
+                or (
+                    self._latest_frame is not None
+                    and self._latest_frame.seq > after_seq
+                ),
+                timeout=timeout,
+            )
+            latest = self._latest_frame
+            if latest is None or latest.seq <= after_seq:
+                return None
+            return latest.retain()
+
     def get_frame(self):
-        while self.frame is None:
-            time.sleep(0.01)  # Ritardo per evitare il 100% CPU
-        return self.frame
+        """
+        Restituisce l'immagine dell'ultimo frame, attendendo il primo frame se necessario.
+        Con il pool attivo l'immagine viene copiata, perché il buffer verrà riutilizzato.
+        """
+        frame = self.wait_for_frame()
+        if frame is None:
+            return None
+        with frame:
+            return frame.image.copy() if frame._pool is not None else frame.image
 
     def get_frame_blurred(self):
-        frame = self.get_frame()
-        return cv2.GaussianBlur(frame, (5, 5), 0) if frame is not None else None
+        frame = self.wait_for_frame()
+        if frame is None:
+            return None
+        with frame:
+            return frame.blurred()
+
+    def get_stats(self):
+        """Statistiche di acquisizione: ultimo numero di sequenza, cadenza dei file e stato del FramePool."""
+        return {
+            "seq": self._seq,
+            "source_fps": 1 / self._frame_interval if self._frame_interval else None,
+            "frame_pool": self._frame_pool.stats() if self._frame_pool else None,
+        }
 
     def stop(self):
         with self.stop_lock:
             if self.is_running:
-                self.is_running = False
+                with self._frame_condition:
+                    self.is_running = False
+                    self._frame_condition.notify_all()
                 if self.capture_thread:
                     self.capture_thread.join(timeout=1)
-                if self.is_picamera:
+                if self.is_running_picamera:
                     self.picam.stop()
                     self.picam.close()
                 elif hasattr(self, "video_capture") and self.video_capture.isOpened():
                     self.video_capture.release()
 
     def is_opened(self):
-        if self.is_picamera:
+        if self.fixed_frame:
+            return self.is_running
+        if self.is_running_picamera:
             # Non c'è un metodo isOpened() equivalente in picamera2
             # quindi assumiamo che sia aperta se l'istanza esiste
             return True
@@ -108,3 +426,54 @@ class VideoProducer:
 
     def __del__(self):
         self.stop()
+
+
+"""------ REGISTRO DEI PRODUCER -----"""
+
+_producers: dict = {}
+_producers_lock = threading.Lock()
+
+
+def normalize_source(video_source=None):
+    """
+    Normalizza una sorgente video: None diventa la sorgente predefinita (chiave Source della
+    sezione VIDEO della configurazione) e le stringhe numeriche diventano indici di telecamera.
+    """
+    if video_source is None:
+        video_source = get_config().get("VIDEO", "Source", fallback="0")
+    if isinstance(video_source, str) and video_source.isdigit():
+        return int(video_source)
+    return video_source
+
+
+def get_producer(video_source=None, frame=None, loop=False, frame_pool_size=None):
+    """
+    Restituisce il VideoProducer associato alla sorgente video, creandolo se non esiste ancora.
+    Gli altri parametri vengono usati solo alla creazione del producer.
+    """
+    video_source = normalize_source(video_source)
+    with _producers_lock:
+        producer = _producers.get(video_source)
+        if producer is None or not producer.is_running:
+            producer = VideoProducer(
+                frame=frame,
+                video_source=video_source,
+                loop=loop,
+                frame_pool_size=frame_pool_size,
+            )
+            _producers[video_source] = producer
+        return producer
+
+
+def get_producers() -> dict:
+    """Restituisce una copia del registro {sorgente: VideoProducer}."""
+    with _producers_lock:
+        return dict(_producers)
+
+
+def remove_producer(video_source=None):
+    """Ferma il producer associato alla sorgente e lo rimuove dal registro."""
+    with _producers_lock:
+        producer = _producers.pop(normalize_source(video_source), None)
+    if producer is not None:
+        producer.stop()
@@ -0,0 +1,86 @@
+import threading
+import unittest
+
+import numpy as np
+
+from device.video_producer import Frame, FramePool, get_producer
+
+
+class VideoProducerTest(unittest.TestCase):
+    def setUp(self):
+        self.image = np.zeros((48, 64, 3), dtype=np.uint8)
+        self.video_producer = get_producer("test_fixed_frame", frame=self.image)
+
+    def test_wait_for_frame_returns_latest(self):
+        frame = self.video_producer.wait_for_frame(after_seq=0, timeout=1)
+        self.assertIsNotNone(frame, "Il frame fisso non è stato pubblicato")
+        self.assertGreaterEqual(frame.seq, 1)
+
+    def test_wait_for_frame_timeout_on_seen_frame(self):
+        frame = self.video_producer.wait_for_frame(after_seq=0, timeout=1)
+        self.assertIsNone(
+            self.video_producer.wait_for_frame(after_seq=frame.seq, timeout=0.05),
+            "Un frame già visto non deve essere restituito di nuovo",
+        )
+
+    def test_wait_for_frame_wakes_on_publish(self):
+        last = self.video_producer.wait_for_frame(after_seq=0, timeout=1)
+        received = []
+
+        def consumer():
+            received.append(
+                self.video_producer.wait_for_frame(after_seq=last.seq, timeout=2)
+            )
+
+        t = threading.Thread(target=consumer)
+        t.start()
+        self.video_producer._publish(self.image)
+        t.join()
+        self.assertEqual(received[0].seq, last.seq + 1)
+        self.assertGreaterEqual(received[0].timestamp, last.timestamp)
+
+    def test_derived_images_are_cached_per_frame(self):
+        frame = self.video_producer.wait_for_frame(after_seq=0, timeout=1)
+        self.assertIs(frame.blurred(), frame.blurred())
+        self.assertIs(frame.hsv(), frame.hsv())
+        self.assertEqual(frame.gray().shape, self.image.shape[:2])
+        self.assertEqual(frame.downscaled(0.5).shape[:2], (24, 32))
+        self.assertFalse(frame.hsv().flags.writeable)
+
+        self.video_producer._publish(self.image)
+        next_frame = self.video_producer.wait_for_frame(after_seq=frame.seq, timeout=1)
+        self.assertIsNot(next_frame.blurred(), frame.blurred())
+
+    def test_registry_returns_same_producer_per_source(self):
+        self.assertIs(get_producer("test_fixed_frame"), self.video_producer)
+        self.assertIsNot(
+            get_producer("test_other_frame", frame=self.image), self.video_producer
+        )
+
+
+class FramePoolTest(unittest.TestCase):
+    def setUp(self):
+        self.pool = FramePool(2)
+        self.shape = (48, 64, 3)
+
+    def test_buffer_reused_after_release(self):
+        buffer = self.pool.acquire(self.shape)
+        frame = Frame(1, 0.0, buffer, pool=self.pool)
+        self.assertFalse(frame.image.flags.writeable)
+        frame.retain()
+        frame.release()
+        self.assertEqual(self.pool.stats()["free"], 0, "Il frame è ancora in uso")
+        frame.release()
+        self.assertIs(self.pool.acquire(self.shape), buffer)
+        self.assertEqual(self.pool.stats()["reused"], 1)
+
+    def test_exhausted_pool_falls_back(self):
+        self.assertIsNotNone(self.pool.acquire(self.shape))
+        self.assertIsNotNone(self.pool.acquire(self.shape))
+        self.assertIsNone(self.pool.acquire(self.shape))
+        stats = self.pool.stats()
+        self.assertEqual((stats["allocated"], stats["fallbacks"]), (2, 1))
+
+
+if __name__ == "__main__":
+    unittest.main()